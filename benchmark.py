@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import accumulate
+from typing import Callable, Dict, List, Optional
+
+from searcher import FileSearchEngine
+from utils import extensionTypes
+
+try:
+    # Only available on unix
+    import resource
+except ImportError:
+    resource = None
+
+# Extensions of the generated files with their weights, the extensions of utils.fileTypes are mixed with common others
+EXTENSIONS = {
+    **{ext: 1 for ext in extensionTypes},
+    '.txt': 6, '.py': 6, '.js': 6, '.json': 4, '.html': 3, '.css': 2, '.log': 3, '.csv': 2, '': 2,
+}
+
+# The characters that join the words of a generated name
+JOINERS = ['_', '-', ' ', '.', '']
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+
+
+class TreeSpec:
+    """ TreeSpec describes a synthetic directory tree, the same spec (and seed) always generates the same tree. """
+
+    def __init__(self, entries: int = 100000, depth: int = 6, fanout: int = 4, files_per_dir: int = 20,
+                 vocabulary: int = 2000, zipf: float = 1.1, max_words: int = 3, seed: int = 0):
+        """Initializes the spec
+
+        Args:
+            entries (int, optional): The total number of files and directories. Defaults to 100000
+            depth (int, optional): The maximum depth of the directories. Defaults to 6
+            fanout (int, optional): The average number of sub directories of a directory. Defaults to 4
+            files_per_dir (int, optional): The average number of files in a directory. Defaults to 20
+            vocabulary (int, optional): The number of distinct words in the names. Defaults to 2000
+            zipf (float, optional): The skew of the word frequencies, 0 is uniform. Defaults to 1.1
+            max_words (int, optional): The maximum number of words in a name. Defaults to 3
+            seed (int, optional): The seed of the random generator. Defaults to 0
+        """
+        self.entries = entries
+        self.depth = depth
+        self.fanout = fanout
+        self.files_per_dir = files_per_dir
+        self.vocabulary = vocabulary
+        self.zipf = zipf
+        self.max_words = max_words
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        """Returns the spec as a (json) dict"""
+        return dict(vars(self))
+
+
+class NameGenerator:
+    """ NameGenerator creates names out of a vocabulary of made up words, the words are picked with a zipf distribution. """
+
+    def __init__(self, spec: TreeSpec, rng: random.Random):
+        self.rng = rng
+        self.max_words = spec.max_words
+        self.words = sorted({self._word() for _ in range(spec.vocabulary)})
+        rng.shuffle(self.words)
+        self.word_weights = list(accumulate(1 / (rank ** spec.zipf) for rank in range(1, len(self.words) + 1)))
+        self.extensions = list(EXTENSIONS)
+        self.extension_weights = list(accumulate(EXTENSIONS.values()))
+
+    def _word(self) -> str:
+        syllables = self.rng.randint(1, 4)
+        return ''.join(self.rng.choice(CONSONANTS) + self.rng.choice(VOWELS) for _ in range(syllables))
+
+    def word(self) -> str:
+        """Returns a word, the frequent words are picked more often"""
+        return self.rng.choices(self.words, cum_weights=self.word_weights)[0]
+
+    def name(self, is_dir: bool) -> str:
+        """Returns the name of a file or directory"""
+        words = [self.word() for _ in range(self.rng.randint(1, self.max_words))]
+        joiner = self.rng.choice(JOINERS)
+        if joiner == '':
+            # camelCase
+            name = words[0] + ''.join(word.capitalize() for word in words[1:])
+        else:
+            name = joiner.join(words)
+        if is_dir:
+            return name
+        return name + self.rng.choices(self.extensions, cum_weights=self.extension_weights)[0]
+
+
+def generate_tree(root_dir: str, spec: TreeSpec) -> Dict[str, int]:
+    """Generates the tree of the spec in root_dir (breadth first), the files are empty
+
+    Args:
+        root_dir (str): The directory to generate the tree in, it is created
+        spec (TreeSpec): The tree to generate
+
+    Returns:
+        Dict[str, int]: The number of dirs and files that were created
+    """
+    rng = random.Random(spec.seed)
+    names = NameGenerator(spec, rng)
+    os.makedirs(root_dir, exist_ok=True)
+    dirs, files = 0, 0
+    level = [root_dir]
+    for depth in range(spec.depth + 1):
+        next_level = []
+        for path in level:
+            taken = set()
+
+            def unique(name: str) -> str:
+                base, n = name, 1
+                while name.lower() in taken:
+                    n += 1
+                    name = f'{base} ({n})'
+                taken.add(name.lower())
+                return name
+
+            for _ in range(rng.randint(0, 2 * spec.files_per_dir)):
+                if dirs + files >= spec.entries:
+                    return {'dirs': dirs, 'files': files}
+                open(os.path.join(path, unique(names.name(False))), 'w').close()
+                files += 1
+            if depth == spec.depth:
+                continue
+            for _ in range(rng.randint(1, 2 * spec.fanout - 1)):
+                if dirs + files >= spec.entries:
+                    return {'dirs': dirs, 'files': files}
+                sub_dir = os.path.join(path, unique(names.name(True)))
+                os.mkdir(sub_dir)
+                next_level.append(sub_dir)
+                dirs += 1
+        if not next_level:
+            break
+        level = next_level
+    return {'dirs': dirs, 'files': files}
+
+
+def prepare_tree(root_dir: str, spec: TreeSpec) -> dict:
+    """Generates the tree, unless root_dir already holds the tree of the same spec
+
+    Args:
+        root_dir (str): The directory of the tree
+        spec (TreeSpec): The tree to generate
+
+    Returns:
+        dict: The spec, the number of dirs and files and the time it took to generate the tree
+    """
+    # The description is stored next to the tree, so it is not part of the tree itself
+    description_file = f'{root_dir.rstrip(os.sep)}.tree.json'
+    if os.path.isfile(description_file) and os.path.isdir(root_dir):
+        with open(description_file, 'r') as f:
+            description = json.load(f)
+        if description['spec'] == spec.as_dict():
+            return description
+        # Only a tree that was generated (it has a description) is removed
+        shutil.rmtree(root_dir)
+    elif os.path.isdir(root_dir) and os.listdir(root_dir):
+        raise FileExistsError(f'{root_dir} is not a generated tree')
+    start = time.perf_counter()
+    counts = generate_tree(root_dir, spec)
+    description = {'spec': spec.as_dict(), **counts, 'generate_seconds': time.perf_counter() - start}
+    with open(description_file, 'w') as f:
+        json.dump(description, f)
+    return description
+
+
+def query_log(root_dir: str, count: int, seed: int) -> List[str]:
+    """Creates a log of queries as they are sent while typing: every prefix of a name that is in the tree.
+    Some of the names get a typo at the end, so there are queries without matches as well.
+
+    Args:
+        root_dir (str): The directory of the tree
+        count (int): The number of names that are typed
+        seed (int): The seed of the random generator
+
+    Returns:
+        List[str]: The queries
+    """
+    rng = random.Random(seed)
+    names = []
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        names.extend(dir_names)
+        names.extend(file_names)
+    names.sort()
+    queries = []
+    for name in rng.sample(names, min(count, len(names))):
+        # People type the start of a word of the name, up to about 12 characters
+        typed = os.path.splitext(name)[0][:rng.randint(3, 12)]
+        if rng.random() < 0.1:
+            typed += 'q'
+        queries.extend(typed[:n] for n in range(1, len(typed) + 1))
+    return queries
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Returns the p-th percentile (nearest rank) of the sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency(queries: List[str], search: Callable[[str], object]) -> dict:
+    """Runs the queries one after another and measures the latency of each of them
+
+    Args:
+        queries (List[str]): The queries
+        search (Callable[[str], object]): Runs a query
+
+    Returns:
+        dict: The number of queries and the p50, p90, p99, max and mean latency (in milliseconds)
+    """
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'queries': len(times),
+        'p50_ms': percentile(times, 50),
+        'p90_ms': percentile(times, 90),
+        'p99_ms': percentile(times, 99),
+        'max_ms': times[-1] if times else 0.0,
+        'mean_ms': sum(times) / len(times) if times else 0.0,
+    }
+
+
+def peak_rss() -> Optional[int]:
+    """Returns the peak resident memory of this process (in bytes), None if it can not be measured"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def timed(function: Callable[[], object]) -> float:
+    """Runs the function and returns how long it took (in seconds)"""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def file_size(file_path: str) -> int:
+    """Returns the size of a file (in bytes), 0 if it does not exist"""
+    return os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+
+
+def git_revision() -> Optional[str]:
+    """Returns the commit of the code that is benchmarked, None if it is not a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(root_dir: str, spec: TreeSpec, typed_names: int, workers: int) -> dict:
+    """Runs the benchmark
+
+    Args:
+        root_dir (str): The directory of the (generated) tree
+        spec (TreeSpec): The tree to benchmark on
+        typed_names (int): The number of names in the query log
+        workers (int): The number of crawl workers
+
+    Returns:
+        dict: The results
+    """
+    tree = prepare_tree(root_dir, spec)
+    queries = query_log(root_dir, typed_names, spec.seed)
+    with tempfile.TemporaryDirectory() as save_dir:
+        save_file = os.path.join(save_dir, 'benchmark.idx')
+        # The first start crawls the tree (in the background) and saves the index
+        start = time.perf_counter()
+        engine = FileSearchEngine(root_dir, watch_timeout=24 * 60, save_file=save_file, crawl_workers=workers)
+        engine.stop_watcher()
+        searchable = time.perf_counter() - start
+        engine.wait_until_fresh()
+        first_start = time.perf_counter() - start
+        # The next start serves the saved index and checks it in the background
+        start = time.perf_counter()
+        restarted = FileSearchEngine(root_dir, watch_timeout=24 * 60, save_file=save_file, crawl_workers=workers)
+        restarted.stop_watcher()
+        restart = time.perf_counter() - start
+        restarted.wait_until_fresh()
+        revalidate = time.perf_counter() - start
+
+        crawl = timed(engine.create_index)
+        save = timed(engine.save_index)
+        load = timed(engine.load_index)
+        entries = len(engine.index)
+
+        # The query log is run twice, the first time the query cache is empty
+        search = latency(queries, lambda query: engine.search(query, budget=60))
+        cached_search = latency(queries, lambda query: engine.search(query, budget=60))
+        engine.cache.clear()
+        simple_search = latency(queries, lambda query: engine.simple_search(query, True))
+        fuzzy_search = latency(queries, lambda query: engine.advanced_search(query, {'budget': 60}))
+
+        return {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'tree': tree,
+            'entries': entries,
+            'first_searchable_seconds': searchable,
+            'first_start_seconds': first_start,
+            'restart_seconds': restart,
+            'revalidate_seconds': revalidate,
+            'crawl_seconds': crawl,
+            'save_seconds': save,
+            'load_seconds': load,
+            'index_bytes': file_size(save_file),
+            'trigram_bytes': file_size(engine.trigram_file),
+            'search': search,
+            'cached_search': cached_search,
+            'simple_search': simple_search,
+            'fuzzy_search': fuzzy_search,
+            'cache': engine.cache.stats(),
+            'peak_rss_bytes': peak_rss(),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks indexing and searching a generated directory tree.')
+    parser.add_argument('--tree', default=os.path.join(tempfile.gettempdir(), 'filesearcher-benchmark'),
+                        help='The directory of the generated tree, it is reused when the spec did not change')
+    parser.add_argument('--entries', type=int, default=100000, help='The number of files and directories')
+    parser.add_argument('--depth', type=int, default=6, help='The maximum depth of the directories')
+    parser.add_argument('--fanout', type=int, default=4, help='The average number of sub directories')
+    parser.add_argument('--files-per-dir', type=int, default=20, help='The average number of files in a directory')
+    parser.add_argument('--vocabulary', type=int, default=2000, help='The number of distinct words in the names')
+    parser.add_argument('--zipf', type=float, default=1.1, help='The skew of the word frequencies, 0 is uniform')
+    parser.add_argument('--max-words', type=int, default=3, help='The maximum number of words in a name')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the tree and the query log')
+    parser.add_argument('--typed-names', type=int, default=200, help='The number of names typed in the query log')
+    parser.add_argument('--workers', type=int, default=8, help='The number of crawl workers')
+    parser.add_argument('--output', default='', help='The file to write the results (json) to. Defaults to stdout')
+    args = parser.parse_args()
+
+    spec = TreeSpec(args.entries, args.depth, args.fanout, args.files_per_dir, args.vocabulary, args.zipf,
+                    args.max_words, args.seed)
+    results = run(os.path.abspath(args.tree), spec, args.typed_names, args.workers)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class QueryCache:
+    """QueryCache is an LRU cache of the ids that matched recent queries, bounded by the memory the ids use.
+
+    The cached results belong to one generation of the index, when the index changes the whole cache is dropped.
+    A query that contains a cached query only has to check the cached ids (search-as-you-type: 'repo' -> 'report').
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """Initializes the cache
+
+        Args:
+            max_bytes (int, optional): The maximum memory used by the cached ids. Defaults to 64MB
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.generation: Hashable = None
+        self._entries: 'OrderedDict[bytes, array]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Statistics, used to tune the size of the cache
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, needle: bytes, generation: Hashable) -> Tuple[Optional[array], bool]:
+        """Looks up the ids of a query
+
+        Args:
+            needle (bytes): The folded query
+            generation (Hashable): Identifies the current state of the index
+
+        Returns:
+            Tuple[Optional[array], bool]: The cached ids and whether they are exactly the ids of the query.
+                                          When they are not exact, they are the ids of a shorter query the needle contains,
+                                          and still have to be checked. None if nothing useful is cached.
+        """
+        with self._lock:
+            self._check_generation(generation)
+            ids = self._entries.get(needle)
+            if ids is not None:
+                self._entries.move_to_end(needle)
+                self.hits += 1
+                return ids, True
+            # The longest cached query contained in the needle has the smallest set of candidates
+            best = None
+            for cached in self._entries:
+                if cached in needle and (best is None or len(cached) > len(best)):
+                    best = cached
+            if best is not None:
+                self._entries.move_to_end(best)
+                self.refinements += 1
+                return self._entries[best], False
+            self.misses += 1
+            return None, False
+
+    def store(self, needle: bytes, ids: array, generation: Hashable) -> None:
+        """Stores the (complete) ids of a query
+
+        Args:
+            needle (bytes): The folded query
+            ids (array): All the ids that matched the query
+            generation (Hashable): Identifies the state of the index the ids were found in
+        """
+        size = ids.itemsize * len(ids)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            old = self._entries.pop(needle, None)
+            if old is not None:
+                self.bytes -= old.itemsize * len(old)
+            self._entries[needle] = ids
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.itemsize * len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes everything from the cache"""
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """Returns the statistics of the cache
+
+        Returns:
+            dict: entries, bytes, max_bytes, hits, refinements, misses and evictions
+        """
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'refinements': self.refinements,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _check_generation(self, generation: Hashable) -> None:
+        """Drops the cache when the index changed"""
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
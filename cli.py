@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+from typing import Iterable, Iterator, Optional
+
+# Only the search engine is imported (not the interface), so a search starts quickly enough for shell pipelines
+from searcher import FileSearchEngine, default_save_file
+from utils import fileTypeNames
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Searches the saved index of a directory, without the interface.')
+    parser.add_argument('query', help='The query to search for')
+    parser.add_argument('--root', default='', help='The directory that was indexed. Defaults to the root_dir in settings.json')
+    parser.add_argument('--save-file', default='', help='The index file. Defaults to the save file of the root')
+    parser.add_argument('--limit', type=int, default=None, help='The maximum number of results. Defaults to all of them')
+    parser.add_argument('--type', dest='types', action='append', choices=sorted(fileTypeNames.values()),
+                        help='Only return this file type, can be repeated')
+    parser.add_argument('--ext', dest='extensions', action='append', help='Only return files with this extension, can be repeated')
+    parser.add_argument('--path', default='', help='Only return entries in this directory (absolute or relative to the root)')
+    parser.add_argument('--fuzzy', action='store_true',
+                        help='Match the characters of the query in order and rank the results (see advanced_search), '
+                             'the results are written when the search is done instead of as they are found')
+    pattern = parser.add_mutually_exclusive_group()
+    pattern.add_argument('--glob', action='store_true', help='The query is a glob that matches the whole name, e.g. "*.pdf"')
+    pattern.add_argument('--regex', action='store_true', help='The query is a (case insensitive) regular expression')
+    parser.add_argument('--content', action='store_true',
+                        help='Also return the documents that contain the words of the query (when the app or daemon indexes '
+                             'the content), the results are ranked like --fuzzy')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('-0', '--null', action='store_true', help='Separate the paths with a null character (for xargs -0)')
+    output.add_argument('--json', action='store_true', help='Write every result as a line of json')
+    return parser.parse_args(argv)
+
+
+def default_root() -> str:
+    """Returns the root_dir of the app (in settings.json), or the current directory if it is not set"""
+    if os.path.isfile('settings.json'):
+        with open('settings.json', 'r') as f:
+            return json.load(f).get('root_dir', os.getcwd())
+    return os.getcwd()
+
+
+def results(engine: FileSearchEngine, args: argparse.Namespace) -> Iterator[dict]:
+    """Runs the search, the results are yielded as they are found (unless it is a fuzzy or content search)"""
+    mode = 'glob' if args.glob else 'regex' if args.regex else 'substring'
+    opts = {'types': args.types, 'extensions': args.extensions, 'path': args.path, 'mode': mode}
+    if args.fuzzy or args.content:
+        opts.update(mode='fuzzy' if args.fuzzy else mode, content=args.content)
+        # A limit is needed to rank, without one every match is ranked
+        limit = args.limit if args.limit is not None else len(engine.index)
+        yield from engine.advanced_search(args.query, {**opts, 'limit': limit, 'budget': float('inf')})['results']
+        return
+    for result in engine.iter_search(args.query, limit=args.limit, opts=opts):
+        yield result._asdict()
+
+
+def write(matches: Iterable[dict], args: argparse.Namespace) -> int:
+    """Writes the results to stdout
+
+    Returns:
+        int: The number of results that were written
+    """
+    out = sys.stdout
+    written = 0
+    for result in matches:
+        if args.json:
+            out.write(json.dumps(result) + '\n')
+        else:
+            out.write(result['path'] + ('\0' if args.null else '\n'))
+        written += 1
+    out.flush()
+    return written
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Searches the index and writes the results, the exit code is 0 when something matched, 1 if nothing matched
+    and 2 when there is no (valid) index of the root or the query is not a valid glob or regular expression"""
+    args = parse_args(argv)
+    root_dir = os.path.abspath(args.root or default_root())
+    save_file = args.save_file or default_save_file(root_dir)
+    try:
+        # Read only: the index is not created, saved or watched, it is only mapped into memory
+        engine = FileSearchEngine(root_dir, save_file=save_file, read_only=True)
+    except (FileNotFoundError, ValueError) as e:
+        print(f'No index of {root_dir} in {save_file}, open the app (or run the daemon) to create it. {e}', file=sys.stderr)
+        return 2
+    try:
+        written = write(results(engine, args), args)
+    except ValueError as e:
+        # An invalid glob or regular expression
+        print(e, file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # The reader (e.g. head) stopped reading, python should not complain about stdout when exiting
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    return 0 if written else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
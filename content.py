@@ -0,0 +1,420 @@
+import heapq
+import html
+import importlib.util
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from itertools import compress
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from index import NameIndex, KIND_FILE
+
+logger = logging.getLogger(__name__)
+
+# The words in the text (and the query) that are indexed, shorter and longer words are left out
+WORD = re.compile(r'\w{2,64}')
+
+# At most this much text is extracted from a single file, so one huge file can not exhaust the memory of a worker
+MAX_TEXT_CHARS = 4 * 1024 * 1024
+
+# At most this many distinct words of a single file are indexed (the most frequent ones)
+MAX_TERMS = 20000
+
+# Files larger than this are not extracted at all
+MAX_FILE_BYTES = 64 * 1024 * 1024
+
+# The score of a content match per query word, names that match score (much) higher, see ranking.SCORE_MATCH
+CONTENT_SCORE = 8
+# The extra score for the number of times the words occur in the content
+CONTENT_MAX_BONUS = 8
+
+# The maximum number of content matches of a query
+MAX_HITS = 10000
+
+# The members of the zip based formats that contain the text
+ZIP_MEMBERS = {
+    '.docx': re.compile(r'word/(document|header\d*|footer\d*|footnotes)\.xml'),
+    '.pptx': re.compile(r'ppt/slides/slide\d+\.xml'),
+    '.xlsx': re.compile(r'xl/sharedStrings\.xml'),
+    '.odt': re.compile(r'content\.xml'),
+    '.ods': re.compile(r'content\.xml'),
+    '.odp': re.compile(r'content\.xml'),
+}
+
+# The plain text formats
+TEXT_EXTENSIONS = ('.txt', '.md', '.rst', '.csv')
+
+# pdf files are only supported when pypdf is installed, it is optional
+HAS_PDF = importlib.util.find_spec('pypdf') is not None
+
+XML_TAG = re.compile(r'<[^>]*>')
+
+
+def read_text(path: str) -> str:
+    """Reads (the start of) a plain text file"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read(MAX_TEXT_CHARS)
+
+
+def read_zip(path: str) -> str:
+    """Extracts the text of a zip based document (docx, pptx, xlsx, odt, ods, odp) by stripping the xml tags"""
+    import zipfile
+    members = ZIP_MEMBERS[os.path.splitext(path)[1].lower()]
+    parts: List[str] = []
+    remaining = MAX_TEXT_CHARS
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if remaining <= 0:
+                break
+            if not members.fullmatch(info.filename):
+                continue
+            with archive.open(info) as member:
+                # The xml is (a lot) larger than the text, but read no more than a bounded part of it
+                xml = member.read(4 * remaining).decode('utf-8', errors='replace')
+            text = html.unescape(XML_TAG.sub(' ', xml))
+            parts.append(text[:remaining])
+            remaining -= len(parts[-1])
+    return ' '.join(parts)
+
+
+def read_pdf(path: str) -> str:
+    """Extracts the text of a pdf file with pypdf"""
+    from pypdf import PdfReader
+    parts: List[str] = []
+    remaining = MAX_TEXT_CHARS
+    for page in PdfReader(path).pages:
+        if remaining <= 0:
+            break
+        parts.append((page.extract_text() or '')[:remaining])
+        remaining -= len(parts[-1])
+    return ' '.join(parts)
+
+
+# The text extractor of every supported extension
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    **{ext: read_text for ext in TEXT_EXTENSIONS},
+    **{ext: read_zip for ext in ZIP_MEMBERS},
+    **({'.pdf': read_pdf} if HAS_PDF else {}),
+}
+
+
+def supported(name: str) -> bool:
+    """Checks if the content of a file (name) can be indexed"""
+    return os.path.splitext(name)[1].lower() in EXTRACTORS
+
+
+def terms(text: str) -> Iterable[str]:
+    """Returns the (folded) words of a text, as they are indexed"""
+    return WORD.findall(text.casefold())
+
+
+def extract(path: str) -> Optional[Dict[str, int]]:
+    """Extracts the words of a file and counts them, it runs in the worker processes
+
+    Args:
+        path (str): The full path of the file
+
+    Returns:
+        Optional[Dict[str, int]]: The number of times every word occurs (the MAX_TERMS most frequent words),
+                                  None if the file could not be read
+    """
+    try:
+        if os.path.getsize(path) > MAX_FILE_BYTES:
+            return {}
+        text = EXTRACTORS[os.path.splitext(path)[1].lower()](path)
+    except Exception:
+        # Corrupt documents are common, they are skipped (and not retried until they change)
+        return None
+    counts = Counter(terms(text))
+    if len(counts) > MAX_TERMS:
+        return dict(counts.most_common(MAX_TERMS))
+    return dict(counts)
+
+
+# The files that could be indexed: path -> (id in the name index, mtime, size)
+Candidates = Dict[str, Tuple[int, float, int]]
+
+
+def candidates(index: NameIndex) -> Candidates:
+    """Collects the files of the index with a supported extension, the caller should hold the lock of the index
+
+    Args:
+        index (NameIndex): The name index
+
+    Returns:
+        Candidates: The files whose content can be indexed
+    """
+    names, mtimes, sizes = index.names, index.mtimes, index.sizes
+    files = {}
+    for i in compress(range(len(index)), map(KIND_FILE.__eq__, index.kinds)):
+        if supported(names[i]):
+            files[index.path(i)] = (i, mtimes[i], sizes[i])
+    return files
+
+
+class ContentIndex:
+    """ ContentIndex is an inverted index (word -> files) of the content of documents, stored in sqlite.
+
+    Every file is stored with its path, its modification time and size (so unchanged files are never extracted
+    again) and its id in the name index, so matches are returned as ids that are checked against the name index.
+    The database is opened in WAL mode, so searches (every thread has its own connection) are not blocked by the
+    indexer writing to it.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS docs (
+            id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, entry INTEGER NOT NULL, mtime REAL NOT NULL,
+            size INTEGER NOT NULL, ok INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL, doc INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+    '''
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        """Opens (or creates) the content index
+
+        Args:
+            db_path (str): The sqlite database
+            read_only (bool, optional): Only search the index, it is not created when it does not exist. Defaults to False
+
+        Raises:
+            FileNotFoundError: If read_only and the database does not exist
+        """
+        if read_only and not os.path.isfile(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.read_only = read_only
+        self._local = threading.local()
+        if not read_only:
+            with self.connection() as db:
+                db.executescript(self.SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            if self.read_only:
+                import pathlib
+                db = sqlite3.connect(f'{pathlib.Path(self.db_path).absolute().as_uri()}?mode=ro', uri=True)
+            else:
+                db = sqlite3.connect(self.db_path)
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def docs(self) -> Dict[str, Tuple[int, int, float, int]]:
+        """Returns the indexed files: path -> (doc id, entry, mtime, size)"""
+        rows = self.connection().execute('SELECT path, id, entry, mtime, size FROM docs')
+        return {path: (doc, entry, mtime, size) for path, doc, entry, mtime, size in rows}
+
+    def count(self) -> Tuple[int, int]:
+        """Returns the number of indexed files, and the number of files that could not be read"""
+        return self.connection().execute('SELECT COUNT(*), COALESCE(SUM(ok = 0), 0) FROM docs').fetchone()
+
+    def store(self, path: str, entry: int, mtime: float, size: int, words: Optional[Dict[str, int]]) -> None:
+        """Stores (or replaces) the words of a file
+
+        Args:
+            path (str): The full path of the file
+            entry (int): The id of the file in the name index
+            mtime (float): The modification time of the file when it was extracted
+            size (int): The size of the file when it was extracted
+            words (Dict[str, int], optional): The words and their counts, None if the file could not be read
+        """
+        db = self.connection()
+        with db:
+            self._delete(db, [path])
+            doc = db.execute('INSERT INTO docs (path, entry, mtime, size, ok) VALUES (?, ?, ?, ?, ?)',
+                             (path, entry, mtime, size, words is not None)).lastrowid
+            if words:
+                db.executemany('INSERT INTO postings (term, doc, count) VALUES (?, ?, ?)',
+                               ((term, doc, count) for term, count in words.items()))
+
+    def move(self, moves: Iterable[Tuple[int, int]]) -> None:
+        """Changes the entries (ids in the name index) of unchanged files, e.g. after the name index was recreated
+
+        Args:
+            moves (Iterable[Tuple[int, int]]): The (doc id, new entry) pairs
+        """
+        db = self.connection()
+        with db:
+            db.executemany('UPDATE docs SET entry = ? WHERE id = ?', ((entry, doc) for doc, entry in moves))
+
+    def remove(self, paths: Iterable[str]) -> None:
+        """Removes files from the index"""
+        db = self.connection()
+        with db:
+            self._delete(db, paths)
+
+    @staticmethod
+    def _delete(db: sqlite3.Connection, paths: Iterable[str]) -> None:
+        for path in paths:
+            row = db.execute('SELECT id FROM docs WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                db.execute('DELETE FROM postings WHERE doc = ?', row)
+                db.execute('DELETE FROM docs WHERE id = ?', row)
+
+    def search(self, query: str, index: NameIndex) -> Dict[int, int]:
+        """Finds the files that contain every word of the query (the words match as prefixes)
+
+        Args:
+            query (str): The query
+            index (NameIndex): The name index the ids are checked against, files that are not (or no longer) in it are left out
+
+        Returns:
+            Dict[int, int]: The id (in the name index) and the score of the MAX_HITS best matching files
+        """
+        words = sorted(set(terms(query)), key=len, reverse=True)
+        if not words:
+            return {}
+        db = self.connection()
+        scores: Optional[Dict[int, int]] = None
+        # The longest (most selective) word first, the others only narrow it down
+        for word in words:
+            rows = db.execute('SELECT doc, count FROM postings WHERE term >= ? AND term < ?', (word, word + '\uffff'))
+            counts: Dict[int, int] = {}
+            for doc, count in rows:
+                if scores is None or doc in scores:
+                    counts[doc] = counts.get(doc, 0) + count
+            scores = counts if scores is None else {doc: scores[doc] + count for doc, count in counts.items()}
+            if not scores:
+                return {}
+        best = heapq.nlargest(MAX_HITS, scores.items(), key=lambda item: item[1])
+        hits: Dict[int, int] = {}
+        for chunk in range(0, len(best), 500):
+            part = dict(best[chunk:chunk + 500])
+            rows = db.execute(f'SELECT id, path, entry FROM docs WHERE id IN ({",".join("?" * len(part))})', list(part))
+            for doc, path, entry in rows:
+                # The entry could have been removed or reused since the content was indexed
+                if entry < len(index) and index.kinds[entry] == KIND_FILE and index.path(entry) == path:
+                    hits[entry] = CONTENT_SCORE * len(words) + min(part[doc], CONTENT_MAX_BONUS)
+        return hits
+
+    def close(self) -> None:
+        """Closes the connection of the current thread"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class ContentIndexer:
+    """ ContentIndexer keeps a ContentIndex up to date with the name index of a FileSearchEngine.
+
+    A background thread compares the files in the name index with the content index when it is scheduled
+    (after the name index changed), and extracts the new and changed files in a process pool. At most a few
+    files per worker are extracted at the same time and only their word counts are sent back, so the memory
+    use is bounded. The pool only exists while there is something to extract.
+    """
+
+    def __init__(self, content: ContentIndex, snapshot: Callable[[], Candidates], workers: int = 2):
+        """Initializes the indexer, it starts when it is scheduled
+
+        Args:
+            content (ContentIndex): The index to update
+            snapshot (Callable[[], Candidates]): Returns the files that could be indexed, see candidates
+            workers (int, optional): The number of extraction processes. Defaults to 2
+        """
+        self.content = content
+        self.snapshot = snapshot
+        self.workers = max(1, workers)
+        # The number of files that still have to be extracted in the current pass
+        self.pending = 0
+        self.extracted = 0
+        # True while the indexes are compared and the files extracted
+        self._busy = False
+        self._wanted = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self) -> None:
+        """Lets the indexer compare the name index with the content index (again), in the background"""
+        if self._stopped.is_set():
+            return
+        self._wanted.set()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='content-indexer', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the indexer, the extractions that are running are finished first"""
+        self._stopped.set()
+        self._wanted.set()
+
+    @property
+    def running(self) -> bool:
+        """True while the content index is (or is about to be) updated"""
+        return self._thread is not None and not self._stopped.is_set() and (self._wanted.is_set() or self._busy)
+
+    def stats(self) -> dict:
+        """Returns the state of the content index: docs, failed (could not be read), pending, extracted and running"""
+        docs, failed = self.content.count()
+        return {'docs': docs, 'failed': failed, 'pending': self.pending, 'extracted': self.extracted,
+                'running': self.running}
+
+    def _run(self) -> None:
+        while True:
+            self._wanted.wait()
+            if self._stopped.is_set():
+                break
+            self._busy = True
+            self._wanted.clear()
+            try:
+                self.update()
+            except Exception:
+                logger.exception('Could not update the content index %s', self.content.db_path)
+            finally:
+                self._busy = False
+        self.content.close()
+
+    def update(self) -> int:
+        """Brings the content index up to date with the name index
+
+        Returns:
+            int: The number of files that were extracted
+        """
+        files = self.snapshot()
+        known = self.content.docs()
+        self.content.remove(path for path in known if path not in files)
+        todo: List[Tuple[str, int, float, int]] = []
+        moves: List[Tuple[int, int]] = []
+        for path, (entry, mtime, size) in files.items():
+            doc = known.get(path)
+            if doc is None or doc[2] != mtime or doc[3] != size:
+                todo.append((path, entry, mtime, size))
+            elif doc[1] != entry:
+                moves.append((doc[0], entry))
+        self.content.move(moves)
+        if not todo:
+            return 0
+        logger.info('Extracting the content of %d files for %s', len(todo), self.content.db_path)
+        self.pending = len(todo)
+        extracted = 0
+        # Only imported when there is something to extract, it is slow to import and the cli never needs it
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        running: Dict[Future, Tuple[str, int, float, int]] = {}
+        # spawn (instead of fork) so the workers do not inherit the threads (watcher, crawler, eel) of the app
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            todo.reverse()
+            while todo or running:
+                # Bound the number of files (and so the text) in flight
+                while todo and len(running) < 2 * self.workers and not self._stopped.is_set():
+                    item = todo.pop()
+                    running[pool.submit(extract, item[0])] = item
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, entry, mtime, size = running.pop(future)
+                    self.content.store(path, entry, mtime, size, future.result())
+                    extracted += 1
+                    self.extracted += 1
+                    self.pending -= 1
+        self.pending = 0
+        return extracted
@@ -0,0 +1,264 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from parallel import ShardedScanner
+from rules import CrawlRules
+from searcher import FileSearchEngine, sort_order
+
+# A root is either a directory or a dict with its path and (optionally) its search_timeout and save_file
+RootSpec = Union[str, dict]
+
+# The time between two checkpoints while waiting for the roots that are searched in parallel (in seconds)
+CHECKPOINT_SECONDS = 0.01
+
+
+class SearchCoordinator:
+    """ SearchCoordinator owns a FileSearchEngine (with its own index, save file and refresh schedule) for every root
+    directory, and searches all of them at once. Adding or removing a root does not touch the other roots. """
+
+    def __init__(self, roots: Iterable[RootSpec], watch_timeout: float = 5.0, workers: int = 4,
+                 rules: Optional[CrawlRules] = None, content_index: bool = False, scan_workers: int = 0):
+        """Initializes the coordinator and creates (or loads) the index of every root
+
+        Args:
+            roots (Iterable[RootSpec]): The root directories
+            watch_timeout (float, optional): The default time between refreshing an index (in minutes). Defaults to 5.0
+            workers (int, optional): The number of roots that are searched in parallel. Defaults to 4
+            rules (CrawlRules, optional): The crawl rules of every root. Defaults to indexing everything
+            content_index (bool, optional): Set to true to index the content of the documents in every root. Defaults to False
+            scan_workers (int, optional): The number of processes that scan the indexes in parallel, the roots share
+                                          them (see parallel.ShardedScanner). Defaults to 0, scanning in the searching thread
+
+        Raises:
+            FileNotFoundError: If one of the root directories does not exist
+        """
+        self.watch_timeout = watch_timeout
+        self.rules = rules if rules is not None else CrawlRules()
+        self.content_index = content_index
+        self.scanner = ShardedScanner(scan_workers) if scan_workers > 0 else None
+        self.engines: Dict[str, FileSearchEngine] = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.set_roots(roots)
+
+    @property
+    def roots(self) -> List[str]:
+        """The root directories, in the order they were added"""
+        return list(self.engines)
+
+    def set_roots(self, roots: Iterable[RootSpec]) -> None:
+        """Changes the root directories, only the added roots are indexed and only the removed roots are dropped.
+        The engines of the added roots are created first, so nothing changes when one of them fails
+
+        Args:
+            roots (Iterable[RootSpec]): The new root directories
+
+        Raises:
+            FileNotFoundError: If one of the added root directories does not exist
+            ValueError: If one of the search_timeouts is not a number
+        """
+        specs = {}
+        timeouts = {}
+        for root in roots:
+            spec = {'path': root} if isinstance(root, str) else dict(root)
+            root_dir = os.path.abspath(spec['path'])
+            specs[root_dir] = spec
+            timeouts[root_dir] = float(spec.get('search_timeout', self.watch_timeout))
+        added: Dict[str, FileSearchEngine] = {}
+        try:
+            for root_dir, spec in specs.items():
+                if root_dir not in self.engines:
+                    added[root_dir] = self._create_engine(root_dir, timeouts[root_dir], spec.get('save_file', ''))
+        except FileNotFoundError:
+            for engine in added.values():
+                self._close_engine(engine)
+            raise
+        for root_dir in list(self.engines):
+            if root_dir not in specs:
+                self.remove_root(root_dir)
+        self.engines.update(added)
+        for root_dir, timeout in timeouts.items():
+            if root_dir not in added and self.engines[root_dir].timeout != timeout * 60:
+                # Only the refresh schedule changed, there is no need to index the root again
+                engine = self.engines[root_dir]
+                engine.stop_watcher()
+                engine.timeout = timeout * 60
+                engine.start_watcher()
+
+    def add_root(self, root_dir: str, watch_timeout: Optional[float] = None, save_file: str = '') -> FileSearchEngine:
+        """Adds a root directory, its index is loaded from its save file or created
+
+        Args:
+            root_dir (str): The directory to add
+            watch_timeout (float, optional): The time between refreshing the index (in minutes). Defaults to the watch_timeout of the coordinator
+            save_file (str, optional): The file to save the index to. Defaults to a file named after the root_dir
+
+        Raises:
+            FileNotFoundError: If the root directory does not exist
+
+        Returns:
+            FileSearchEngine: The engine of the root
+        """
+        root_dir = os.path.abspath(root_dir)
+        if root_dir in self.engines:
+            return self.engines[root_dir]
+        timeout = self.watch_timeout if watch_timeout is None else watch_timeout
+        engine = self._create_engine(root_dir, timeout, save_file)
+        self.engines[root_dir] = engine
+        return engine
+
+    def remove_root(self, root_dir: str) -> None:
+        """Removes a root directory, stops refreshing its index and removes it from the scan workers
+
+        Args:
+            root_dir (str): The directory to remove
+        """
+        engine = self.engines.pop(os.path.abspath(root_dir), None)
+        if engine is not None:
+            self._close_engine(engine)
+
+    def _create_engine(self, root_dir: str, watch_timeout: float, save_file: str) -> FileSearchEngine:
+        """Creates the engine of a root, see add_root"""
+        return FileSearchEngine(root_dir, watch_timeout, save_file, rules=self.rules, content_index=self.content_index,
+                                scanner=self.scanner)
+
+    def _close_engine(self, engine: FileSearchEngine) -> None:
+        """Stops the work of the engine of a root that is removed, and removes its shared memory copies"""
+        engine.stop_watcher()
+        engine.set_content_indexing(False)
+        if self.scanner is not None:
+            self.scanner.release(engine.index.uid)
+
+    def set_rules(self, rules: CrawlRules) -> None:
+        """Changes the crawl rules of every root, see FileSearchEngine.set_rules
+
+        Args:
+            rules (CrawlRules): The new rules
+        """
+        self.rules = rules
+        for engine in list(self.engines.values()):
+            if engine.index.rules != rules:
+                engine.set_rules(rules)
+
+    def set_content_index(self, enabled: bool) -> None:
+        """Starts or stops indexing the content of the documents in every root, see FileSearchEngine.set_content_indexing
+
+        Args:
+            enabled (bool): True to index the content
+        """
+        self.content_index = enabled
+        for engine in list(self.engines.values()):
+            engine.set_content_indexing(enabled)
+
+    def set_scan_workers(self, scan_workers: int) -> None:
+        """Changes the number of processes that scan the indexes in parallel, 0 scans in the searching thread
+
+        Args:
+            scan_workers (int): The number of processes
+        """
+        current = self.scanner.workers if self.scanner is not None else 0
+        if scan_workers == current:
+            return
+        old, self.scanner = self.scanner, ShardedScanner(scan_workers) if scan_workers > 0 else None
+        for engine in list(self.engines.values()):
+            engine.set_scanner(self.scanner)
+        if old is not None:
+            old.close()
+
+    def search(self, query: str, limit: int = 50, offset: int = 0, query_id: Optional[int] = None,
+               budget: float = 0.25, checkpoint: Optional[Callable[[], None]] = None, mode: str = 'substring') -> dict:
+        """Searches every root for the query (see FileSearchEngine.search), and merges the ranked results
+
+        Raises:
+            ValueError: If the mode is unknown or the query is not a valid glob or regular expression
+
+        Returns:
+            dict: The page of results, with the same keys as FileSearchEngine.search
+        """
+        pages = self._fan_out(lambda engine, checkpoint: engine.search(query, limit=offset + limit, offset=0,
+                                                                       query_id=query_id, budget=budget,
+                                                                       checkpoint=checkpoint, mode=mode), checkpoint)
+        # Every page is sorted on the file type, so they only have to be merged
+        merged = heapq.merge(*(page['results'] for page in pages), key=itemgetter('file_type'))
+        return self._merge(pages, merged, limit, offset, query_id)
+
+    def advanced_search(self, query: str, opts: dict) -> dict:
+        """Searches every root with advanced_search (see FileSearchEngine.advanced_search), and merges the results on their
+        score (or the sort option)
+
+        Raises:
+            ValueError: If the sort option is unknown
+
+        Returns:
+            dict: The page of results, with the same keys as FileSearchEngine.advanced_search
+        """
+        limit = int(opts.get('limit', 50))
+        offset = int(opts.get('offset', 0))
+        field, descending = sort_order(opts.get('sort') or 'score')
+        root_opts = {**opts, 'limit': offset + limit, 'offset': 0}
+        checkpoint = root_opts.pop('checkpoint', None)
+        pages = self._fan_out(lambda engine, checkpoint: engine.advanced_search(query, {**root_opts,
+                                                                                       'checkpoint': checkpoint}),
+                              checkpoint)
+        # Every page is sorted the same way, so they only have to be merged
+        if field is None:
+            # The content matches come after the name matches, see FileSearchEngine.advanced_search
+            key = lambda result: (result.get('match') != 'content', result['score'])
+        else:
+            key = itemgetter(field)
+        merged = heapq.merge(*(page['results'] for page in pages), key=key, reverse=descending)
+        return self._merge(pages, merged, limit, offset, opts.get('query_id'))
+
+    def stats(self) -> dict:
+        """Returns the health and the metrics of the index of every root (see FileSearchEngine.stats)"""
+        return {'roots': {root_dir: engine.stats() for root_dir, engine in list(self.engines.items())}}
+
+    def stop_watcher(self) -> None:
+        """Stops refreshing the indexes of all the roots"""
+        for engine in self.engines.values():
+            engine.stop_watcher()
+
+    def close(self) -> None:
+        """Stops refreshing the indexes and stops the scan workers"""
+        self.stop_watcher()
+        self.set_scan_workers(0)
+
+    def _fan_out(self, search: Callable[[FileSearchEngine, Optional[Callable[[], None]]], dict],
+                 checkpoint: Optional[Callable[[], None]]) -> List[dict]:
+        """Runs the search on every engine, in parallel when there is more than one root
+
+        Args:
+            search (Callable[[FileSearchEngine, Optional[Callable[[], None]]], dict]): Searches a single engine,
+                                                                                       with the checkpoint to call
+            checkpoint (Callable[[], None], optional): Called regularly until the results are there
+
+        Returns:
+            List[dict]: The pages of the roots, in the order of the roots
+        """
+        engines = list(self.engines.values())
+        if len(engines) == 1:
+            # The search runs in the calling thread, so it calls the checkpoint itself
+            return [search(engines[0], checkpoint)]
+        # The searches run in the pool, the checkpoint (e.g. eel.sleep) is only called from the calling thread
+        futures = [self.pool.submit(search, engine, None) for engine in engines]
+        if checkpoint is not None:
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=CHECKPOINT_SECONDS)
+                checkpoint()
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _merge(pages: List[dict], merged: Iterable[dict], limit: int, offset: int, query_id: Optional[int]) -> dict:
+        """Combines the pages of the roots into one page"""
+        results = list(islice(merged, offset, offset + limit))
+        return {
+            'query_id': query_id,
+            'results': results,
+            'matched': sum(page['matched'] for page in pages),
+            'complete': all(page['complete'] for page in pages),
+            'cancelled': any(page['cancelled'] for page in pages),
+        }
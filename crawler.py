@@ -0,0 +1,208 @@
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from index import NameIndex, KIND_DIR, KIND_FILE
+from rules import CrawlRules, device, is_hidden, relative
+
+# The partial index is made searchable every time it doubled in size (and at least this many entries were added)
+PUBLISH_MIN = 10000
+
+
+@dataclass
+class CrawlProgress:
+    """CrawlProgress describes how far a crawl is
+    Args:
+        dirs (int): The number of directories that have been listed
+        entries (int): The number of files and directories in the index
+        elapsed (float): The time since the crawl started (in seconds)
+        done (bool): True when the crawl is finished
+    """
+    dirs: int
+    entries: int
+    elapsed: float
+    done: bool
+
+
+class Crawler:
+    """ Crawler lists the root_dir with a pool of threads and builds a NameIndex from it.
+
+    Every thread takes a directory from a (bounded) work queue, lists it with os.scandir and adds the entries to the
+    index. The type information of the DirEntry objects is used, so no extra stat calls are needed to tell files
+    and directories apart. When the work queue is full a thread continues with the subdirectories itself.
+    The size and modification time of every file are recorded as well, so they can be filtered on without the filesystem.
+    The crawl rules are checked while listing, so excluded directories (and directories below the max depth)
+    are never listed.
+    """
+
+    def __init__(self, root_dir: str, workers: int = 8, queue_size: int = 4096,
+                 progress: Optional[Callable[[CrawlProgress], None]] = None, progress_interval: float = 0.5,
+                 rules: Optional[CrawlRules] = None):
+        """Initializes the crawler
+
+        Args:
+            root_dir (str): The directory to crawl
+            workers (int, optional): The number of threads listing directories. Defaults to 8
+            queue_size (int, optional): The maximum number of directories waiting in the work queue. Defaults to 4096
+            progress (Callable[[CrawlProgress], None], optional): Called with the progress of the crawl
+            progress_interval (float, optional): The minimum time between two progress calls (in seconds). Defaults to 0.5
+            rules (CrawlRules, optional): Decide which entries are indexed. Defaults to indexing everything
+        """
+        self.root_dir = root_dir
+        self.workers = max(1, workers)
+        # The index is searchable while crawling, although it is only updated every now and then
+        self.index = NameIndex(root_dir)
+        self.rules = rules if rules is not None else CrawlRules()
+        self.index.rules = self.rules
+        self._root_dev = 0
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.dirs = 0
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        # Guards the index and the counters
+        self._lock = threading.Lock()
+        # The number of directories that are queued or being listed, the crawl is done when it reaches 0
+        self._outstanding = 0
+        self._done = threading.Event()
+        self._published = 0
+        self._started = 0.0
+        self._reported = 0.0
+
+    def run(self) -> NameIndex:
+        """Crawls the root_dir, and blocks until it is done
+
+        Returns:
+            NameIndex: The created index
+        """
+        self._started = time.perf_counter()
+        try:
+            st = os.stat(self.root_dir)
+            self.index.mtimes[0] = st.st_mtime
+            self._root_dev = st.st_dev
+        except OSError:
+            pass
+        self.index.freeze(track=False)
+        self._outstanding = 1
+        self._queue.put((0, self.root_dir, ''))
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        self._done.wait()
+        # Stop the threads
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        self.index.freeze()
+        self._report(done=True)
+        return self.index
+
+    def _work(self) -> None:
+        """Lists the directories from the work queue until the crawl is done"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            stack = [item]
+            while stack:
+                subdirs = self._list(*stack.pop())
+                with self._lock:
+                    # Count the subdirectories before they are queued, and this directory is done
+                    self._outstanding += len(subdirs) - 1
+                    if self._outstanding == 0:
+                        self._done.set()
+                for subdir in subdirs:
+                    try:
+                        self._queue.put_nowait(subdir)
+                    except queue.Full:
+                        # Never block on the queue, that could deadlock when every thread is waiting for it
+                        stack.append(subdir)
+
+    def _list(self, parent: int, path: str, rel: str) -> List[Tuple[int, str, str]]:
+        """Lists a directory and adds its entries to the index
+
+        Args:
+            parent (int): The id of the directory
+            path (str): The full path of the directory
+            rel (str): The path of the directory relative to the root_dir (separated by /)
+
+        Returns:
+            List[Tuple[int, str, str]]: The id, path and relative path of every subdirectory that should be listed as well
+        """
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            # Like os.walk, a directory that can not be listed is empty
+            entries = []
+        rules = self.rules
+        # Without rules nothing has to be checked
+        check = bool(rules)
+        depth = rel.count('/') + 2 if rel else 1
+        pruned = False
+        files = []
+        dirs = []
+        for entry in entries:
+            try:
+                # Like os.walk, symbolic links to directories are directories but they are not followed
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if check and not rules.allows(relative(rel, entry.name), is_dir, is_hidden(entry)):
+                pruned = True
+                continue
+            if not is_dir:
+                # The stat result comes with the listing on windows, elsewhere it is one lstat per file
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((entry.name, st.st_mtime, st.st_size))
+                except OSError:
+                    files.append((entry.name, 0.0, 0))
+                continue
+            mtime = 0.0
+            follow = not entry.is_symlink()
+            unlisted = False
+            if follow and check:
+                # The device is only looked up to stay on one file system
+                dev = device(entry) if rules.one_file_system else self._root_dev
+                if not rules.lists(depth, dev, self._root_dev):
+                    # The directory is indexed, but not listed
+                    follow = False
+                    unlisted = True
+            if follow:
+                # The modification time is recorded before the directory is listed, so changes are never missed
+                try:
+                    mtime = entry.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    pass
+            dirs.append((entry.name, follow, mtime, unlisted))
+
+        subdirs = []
+        with self._lock:
+            for name, mtime, size in files:
+                self.index.add(name, parent, KIND_FILE, mtime, size)
+            for name, follow, mtime, unlisted in dirs:
+                i = self.index.add(name, parent, KIND_DIR, mtime)
+                if follow:
+                    subdirs.append((i, os.path.join(path, name), relative(rel, name)))
+                elif unlisted:
+                    self.index.pruned.add(i)
+            if pruned:
+                self.index.pruned.add(parent)
+            self.dirs += 1
+            if len(self.index) >= 2 * self._published + PUBLISH_MIN:
+                self._published = len(self.index)
+                self.index.freeze(track=False)
+            self._report()
+        return subdirs
+
+    def _report(self, done: bool = False) -> None:
+        """Calls the progress callback, if the progress_interval passed since the last call"""
+        now = time.perf_counter()
+        if self.progress is None or (not done and now - self._reported < self.progress_interval):
+            return
+        self._reported = now
+        self.progress(CrawlProgress(self.dirs, len(self.index), now - self._started, done))
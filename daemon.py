@@ -0,0 +1,283 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# Only the standard library is imported here, so a client (the interface, scripts) can import RemoteSearchEngine
+# without loading the search engine, and the daemon itself never loads the gui libraries
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """ Handles the requests to the daemon, every request runs in its own thread.
+
+    GET  /search?q=..&limit=..&offset=..&query_id=..&mode=..  See SearchCoordinator.search
+    POST /advanced_search   {"query": .., "opts": {..}}  See SearchCoordinator.advanced_search
+    GET  /stats             The health and metrics of the index of every root (see FileSearchEngine.stats)
+    POST /reindex           {"root": ..} Recreates the index of the root (all roots if it is left out), in the background
+    GET  /roots             The roots that are searched
+    POST /roots             {"roots": [..], "watch_timeout": ..} Changes the roots (see SearchCoordinator.set_roots)
+    GET  /rules             The crawl rules (see rules.CrawlRules.as_dict)
+    POST /rules             {"exclude": [..], ..} Changes the crawl rules of every root, in the background
+    """
+
+    def do_GET(self) -> None:
+        if not self.trusted_host():
+            return self.send_error(403, 'Only requests to localhost are served')
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/search':
+            if 'q' not in params:
+                return self.send_error(400, 'The query (q) is missing')
+            try:
+                query_id = int(params['query_id']) if 'query_id' in params else None
+                page = self.server.coordinator.search(params['q'], limit=int(params.get('limit', 50)),
+                                                      offset=int(params.get('offset', 0)), query_id=query_id,
+                                                      mode=params.get('mode', 'substring'))
+            except ValueError as e:
+                return self.send_error(400, str(e))
+            self.respond(page)
+        elif url.path == '/stats':
+            self.respond(self.server.coordinator.stats())
+        elif url.path == '/roots':
+            self.respond(self.server.coordinator.roots)
+        elif url.path == '/rules':
+            self.respond(self.server.coordinator.rules.as_dict())
+        else:
+            self.send_error(404)
+
+    def do_POST(self) -> None:
+        if not self.trusted_host():
+            return self.send_error(403, 'Only requests to localhost are served')
+        # A form on a web page can post to the daemon without asking, but it can not send json
+        if self.headers.get_content_type() != 'application/json':
+            return self.send_error(415, 'The body should be json (Content-Type: application/json)')
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            return self.send_error(400, 'The body is not valid json')
+        if not isinstance(body, dict):
+            return self.send_error(400, 'The body should be a json object')
+        coordinator = self.server.coordinator
+        if self.path == '/advanced_search':
+            query, opts = body.get('query', ''), body.get('opts', {})
+            if not isinstance(query, str) or not isinstance(opts, dict):
+                return self.send_error(400, 'The query should be a string and the opts an object')
+            try:
+                page = coordinator.advanced_search(query, opts)
+            except (TypeError, ValueError) as e:
+                return self.send_error(400, str(e))
+            self.respond(page)
+        elif self.path == '/reindex':
+            if body.get('root') is not None and not isinstance(body['root'], str):
+                return self.send_error(400, 'The root should be a string')
+            root = os.path.abspath(body['root']) if body.get('root') else None
+            if root is not None and root not in coordinator.engines:
+                return self.send_error(404, f'{root} is not a root')
+            engines = list(coordinator.engines.values()) if root is None else [coordinator.engines[root]]
+            threading.Thread(target=reindex, args=(engines,), daemon=True).start()
+            self.respond({'reindexing': [engine.root_dir for engine in engines]}, 202)
+        elif self.path == '/roots':
+            watch_timeout = coordinator.watch_timeout
+            try:
+                # The default timeout of the added roots, it is only kept when the roots could be changed
+                coordinator.watch_timeout = float(body.get('watch_timeout', watch_timeout))
+                coordinator.set_roots(body.get('roots', coordinator.roots))
+            except FileNotFoundError:
+                coordinator.watch_timeout = watch_timeout
+                return self.send_error(400, 'One of the roots does not exist')
+            except (KeyError, TypeError, ValueError) as e:
+                coordinator.watch_timeout = watch_timeout
+                return self.send_error(400, f'The roots are invalid: {e}')
+            self.respond(coordinator.roots)
+        elif self.path == '/rules':
+            from rules import CrawlRules
+            try:
+                rules = CrawlRules.from_dict(body)
+            except (TypeError, ValueError) as e:
+                return self.send_error(400, f'The rules are invalid: {e}')
+            threading.Thread(target=coordinator.set_rules, args=(rules,), daemon=True).start()
+            self.respond(rules.as_dict(), 202)
+        else:
+            self.send_error(404)
+
+    def trusted_host(self) -> bool:
+        """Checks that the request was sent to the daemon on localhost, the Host header of a web page that resolves
+        its own name to 127.0.0.1 (dns rebinding) names that page instead"""
+        port = self.server.server_port
+        return self.headers.get('Host') in (f'127.0.0.1:{port}', f'localhost:{port}')
+
+    def respond(self, data: object, status: int = 200) -> None:
+        """Sends the data as json"""
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Every keystroke is a request, logging them all would only be noise
+        pass
+
+
+def reindex(engines: list) -> None:
+    """Recreates and saves the indexes of the engines, the engines keep serving their current index meanwhile"""
+    for engine in engines:
+        engine.create_and_save_index()
+
+
+def serve(roots: List[str], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, watch_timeout: float = 5.0,
+          ready: Optional[Callable[[ThreadingHTTPServer], None]] = None, rules: Optional[dict] = None,
+          content_index: bool = False, scan_workers: int = 0) -> None:
+    """Loads (or creates) the indexes of the roots and serves searches until the process is stopped
+
+    Args:
+        roots (List[str]): The directories to search in
+        host (str, optional): The (loopback) address to listen on, only requests to 127.0.0.1 or localhost are served.
+                              Defaults to 127.0.0.1
+        port (int, optional): The port to listen on. Defaults to 8765
+        watch_timeout (float, optional): The time between refreshing the indexes (in minutes). Defaults to 5.0
+        ready (Callable[[ThreadingHTTPServer], None], optional): Called with the server when it is listening
+        rules (dict, optional): The crawl rules (see rules.CrawlRules.from_dict). Defaults to indexing everything
+        content_index (bool, optional): Set to true to index the content of the documents as well. Defaults to False
+        scan_workers (int, optional): The number of processes that scan the indexes in parallel. Defaults to 0 (none)
+    """
+    # The search engine is only needed by the daemon itself, not by its clients
+    from coordinator import SearchCoordinator
+    from rules import CrawlRules
+
+    coordinator = SearchCoordinator(roots, watch_timeout, rules=CrawlRules.from_dict(rules), content_index=content_index,
+                                    scan_workers=scan_workers)
+    server = ThreadingHTTPServer((host, port), SearchRequestHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    if ready is not None:
+        ready(server)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        coordinator.close()
+
+
+class RemoteSearchEngine:
+    """ RemoteSearchEngine searches through a running daemon, it has the same search methods as SearchCoordinator.
+    The daemon keeps the indexes in memory, so nothing has to be indexed or loaded by the client. """
+
+    def __init__(self, url: str = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}', timeout: float = 10.0):
+        """Initializes the client
+
+        Args:
+            url (str, optional): The address of the daemon. Defaults to the default address of the daemon
+            timeout (float, optional): The maximum time to wait for a response (in seconds). Defaults to 10.0
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        # Sent to the daemon together with the roots
+        self.watch_timeout: Optional[float] = None
+
+    def search(self, query: str, limit: int = 50, offset: int = 0, query_id: Optional[int] = None,
+               budget: float = 0.25, checkpoint: Optional[Callable[[], None]] = None, mode: str = 'substring') -> dict:
+        """Searches for the query, see SearchCoordinator.search (the budget and checkpoint are up to the daemon)"""
+        params = {'q': query, 'limit': limit, 'offset': offset, 'mode': mode}
+        if query_id is not None:
+            params['query_id'] = query_id
+        return self.request(f'/search?{urlencode(params)}')
+
+    def advanced_search(self, query: str, opts: dict) -> dict:
+        """Searches for the query, see SearchCoordinator.advanced_search"""
+        opts = {key: value for key, value in opts.items() if key != 'checkpoint'}
+        return self.request('/advanced_search', {'query': query, 'opts': opts})
+
+    def stats(self) -> dict:
+        """Returns the state of the indexes of the daemon"""
+        return self.request('/stats')
+
+    def reindex(self, root: Optional[str] = None) -> dict:
+        """Lets the daemon recreate the index of the root (all roots if it is None)"""
+        return self.request('/reindex', {} if root is None else {'root': root})
+
+    @property
+    def roots(self) -> List[str]:
+        """The roots the daemon searches"""
+        return self.request('/roots')
+
+    def set_roots(self, roots: list) -> None:
+        """Changes the roots of the daemon, see SearchCoordinator.set_roots"""
+        body = {'roots': roots}
+        if self.watch_timeout is not None:
+            body['watch_timeout'] = self.watch_timeout
+        self.request('/roots', body)
+
+    def rules(self) -> dict:
+        """The crawl rules of the daemon"""
+        return self.request('/rules')
+
+    def set_rules(self, rules: dict) -> None:
+        """Changes the crawl rules of the daemon (see rules.CrawlRules.as_dict), they are applied in the background"""
+        self.request('/rules', rules)
+
+    def stop_watcher(self) -> None:
+        """The daemon keeps refreshing its indexes, the client has nothing to stop"""
+
+    def close(self) -> None:
+        """The daemon keeps running, the client has nothing to stop"""
+
+    def request(self, path: str, body: Optional[dict] = None) -> object:
+        """Sends a request (a POST when there is a body) to the daemon
+
+        Raises:
+            ValueError: If the daemon rejected the request (e.g. an invalid regular expression), like the local engine
+            OSError: If the daemon can not be reached or responds with another error
+
+        Returns:
+            object: The (json) response
+        """
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 400:
+                # The reason is the message of the daemon, see SearchRequestHandler
+                raise ValueError(e.reason) from e
+            raise
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Keeps the indexes of the roots in memory and serves searches over http.')
+    parser.add_argument('roots', nargs='+', help='The directories to search in')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='The port to listen on')
+    parser.add_argument('--timeout', type=float, default=5.0, help='The time between refreshing the indexes (in minutes)')
+    parser.add_argument('--exclude', action='append', default=[], help='A gitignore style glob of the entries to leave out, can be repeated')
+    parser.add_argument('--include', action='append', default=[], help='Only index the files that match this glob, can be repeated')
+    parser.add_argument('--no-hidden', action='store_true', help='Leave out hidden files and directories')
+    parser.add_argument('--max-depth', type=int, default=None, help='The maximum depth of the indexed entries')
+    parser.add_argument('--one-file-system', action='store_true', help='Do not index other file systems (mount points)')
+    parser.add_argument('--content', action='store_true',
+                        help='Index the content of the documents as well, for advanced_search with the content option')
+    parser.add_argument('--scan-workers', type=int, default=0,
+                        help='The number of processes that scan the indexes in parallel (for queries the trigram index '
+                             'can not answer, e.g. short queries and fuzzy matches). Defaults to 0, scanning in one thread')
+    args = parser.parse_args()
+    rules = {'exclude': args.exclude, 'include': args.include, 'hidden': not args.no_hidden,
+             'max_depth': args.max_depth, 'one_file_system': args.one_file_system}
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # Only requests to localhost are served (see SearchRequestHandler.trusted_host), so it only listens there
+    serve(args.roots, DEFAULT_HOST, args.port, args.timeout,
+          ready=lambda server: print(f'Serving {", ".join(args.roots)} on http://{DEFAULT_HOST}:{server.server_port}'),
+          rules=rules, content_index=args.content, scan_workers=args.scan_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,670 @@
+import json
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, compress, count, islice
+from mmap import mmap
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, Set, Tuple, Union
+
+from storage import (SECTION_ALIGNMENT, ArrayLike, aligned, atomic_write, map_file, map_section, pad, to_array,
+                     view_array, write_array)
+from parallel import ShardedScanner
+from rules import CrawlRules
+from trigram import TrigramIndex
+
+# The kinds of entries stored in NameIndex.kinds
+KIND_FILE = 0
+KIND_DIR = 1
+# Removed entries stay in the index (so the ids do not change) until it is compacted (see NameIndex.compact)
+KIND_DELETED = 2
+
+# When more than this share of the entries is removed, the index is compacted when it is saved
+COMPACT_RATIO = 0.2
+
+# When this many entries changed since the search buffer was built, it is rebuilt
+PENDING_LIMIT = 50000
+
+# Gives every index a unique id, together with the generation it identifies the state of an index
+_uids = count()
+
+# The names in the search buffer are separated by a null byte, it can not occur in a filename
+# so a query can never match across two names.
+SEPARATOR = b'\0'
+
+# A single os.walk item: (path, dirs, files)
+WalkItem = Tuple[str, List[str], List[str]]
+
+# The searchable state of an index: (search buffer, offsets, pending names), see NameIndex
+Snapshot = Tuple[Union[bytes, mmap], ArrayLike, Dict[int, bytes]]
+
+# Header of the index file: magic, version, flags, entry count, size of the name table and size of the search buffer
+HEADER = struct.Struct('<4sHHQQQ')
+MAGIC = b'FSIX'
+VERSION = 1
+# The flags in the header, they tell which optional columns are stored
+FLAG_MTIMES = 1
+# The crawl rules and the pruned directories are stored after the search buffer
+FLAG_RULES = 2
+FLAG_SIZES = 4
+# The section with the crawl rules starts with the number of pruned directories and the size of the (json) rules
+RULES_HEADER = struct.Struct('<QQ')
+
+
+def fold(name: str) -> bytes:
+    """Folds a name (or query) to the representation stored in the search buffer
+
+    Args:
+        name (str): The name to fold
+
+    Returns:
+        bytes: The lower case, utf-8 encoded name
+    """
+    return encode(name.lower())
+
+
+def encode(name: str) -> bytes:
+    """Encodes a name as utf-8, surrogatepass keeps undecodable filenames (surrogate escaped by os) intact"""
+    return name.encode('utf-8', 'surrogatepass')
+
+
+class StringTable(Sequence[str]):
+    """StringTable is a read only list of names, stored as null terminated utf-8 in a (mapped) index file.
+    The names are only decoded when they are accessed.
+    """
+
+    def __init__(self, table: memoryview, offsets: Sequence[int]):
+        """Initializes the table
+
+        Args:
+            table (memoryview): The encoded names
+            offsets (Sequence[int]): The offset of every name in the table (with one extra offset at the end)
+        """
+        self.table = table
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.table[self.offsets[i]:self.offsets[i + 1] - 1], 'utf-8', 'surrogatepass')
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class NameIndex:
+    """NameIndex is a flat representation of the folder structure of the root_dir.
+
+    Every file and directory is an entry identified by its position, the entries are stored in parallel arrays:
+        names (List[str]): The name of the entry
+        parents (array): The id of the directory the entry is in (-1 for the root directory)
+        kinds (bytearray): The kind of the entry (KIND_FILE, KIND_DIR or KIND_DELETED)
+        mtimes (array): The modification time of a file, or of a directory when it was listed (0.0 if it is unknown)
+        sizes (array): The size of a file in bytes (0 for directories, or if it is unknown)
+
+    The folded (lower case) names are joined into a single search buffer, so a query is one scan over
+    the buffer instead of lowering and comparing every name. When a trigram index is attached, queries of
+    three or more bytes only verify the candidates from the trigram posting lists. The other queries scan the
+    whole buffer, which an attached ShardedScanner splits over several processes.
+
+    Entries that are added or renamed after the buffer was built are kept in a (small) pending dict
+    that is scanned as well, until the next call to freeze().
+
+    The buffer, its offsets and the pending dict are published together as one snapshot tuple, so a search
+    (in another thread) always sees a buffer with its own offsets, even when the buffer is rebuilt meanwhile.
+
+    A saved index is mapped into memory when it is loaded, searches then run directly against the mapped
+    file. The columns are only copied into memory when the index is changed.
+    """
+
+    def __init__(self, root_dir: str):
+        """Initializes an index that only contains the root directory (id 0)
+
+        Args:
+            root_dir (str): The directory the index describes
+        """
+        self.root_dir = root_dir
+        self.names: Sequence[str] = []
+        self.parents: Sequence[int] = array('i')
+        self.kinds: Sequence[int] = bytearray()
+        self.mtimes: Sequence[float] = array('d')
+        self.sizes: Sequence[int] = array('q')
+        # True while the columns are views of a mapped index file
+        self._mapped = False
+        # Incremented on every change, so users of the index can detect that it changed
+        self.generation = 0
+        self.uid = next(_uids)
+        # The full paths of the directories, they are created on demand when building result paths
+        self._dir_paths: Dict[int, str] = {}
+        # The search buffer, the offset at which every entry starts in it (with one extra offset at the end) and the
+        # folded names of the entries that are not (correctly) in the search buffer yet. It is only ever replaced as a
+        # whole, searches read it once so they never mix a new buffer with old offsets
+        self._snapshot: Snapshot = (b'', array('Q', [0]), {})
+        # The optional trigram index over the search buffer
+        self.trigrams: Optional[TrigramIndex] = None
+        # The optional pool that scans the search buffer in parallel (see ShardedScanner)
+        self.scanner: Optional[ShardedScanner] = None
+        # Changes are only tracked once the search buffer was built for the first time
+        self._tracking = False
+        # The children (name -> id) of every directory, only created when the index is changed by path
+        self._children: Optional[Dict[int, Dict[str, int]]] = None
+        # The rules the index was crawled with, and the directories the rules left entries out of (or that were not
+        # listed at all). Only those have to be listed again when the rules change
+        self.rules = CrawlRules()
+        self.pruned: Set[int] = set()
+        # The number of removed entries, it is counted the first time it is needed (see removed)
+        self._removed: Optional[int] = None
+        # The root directory itself is not searchable, which is why it gets an empty folded name
+        self.add('', -1, KIND_DIR)
+        self._dir_paths[0] = root_dir
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def removed(self) -> int:
+        """The number of removed entries that are still in the index, see compact"""
+        if self._removed is None:
+            self._removed = bytes(self.kinds).count(KIND_DELETED)
+        return self._removed
+
+    @classmethod
+    def from_walk(cls, root_dir: str, walk: Iterable[WalkItem], stat_dirs: bool = False) -> 'NameIndex':
+        """Creates an index from os.walk (like) output
+
+        Args:
+            root_dir (str): The directory that was walked
+            walk (Iterable[WalkItem]): The (path, dirs, files) items, parents have to come before their children (topdown)
+            stat_dirs (bool, optional): Set to true to record the modification time of every walked directory
+
+        Returns:
+            NameIndex: The created index
+        """
+        index = cls(root_dir)
+        # Keep track of the id of every directory so the children can refer to it
+        dir_ids = {root_dir: 0}
+        for path, dirs, files in walk:
+            parent = dir_ids.get(path)
+            if parent is None:
+                # The directory was never listed (e.g. it is outside the root_dir), so it can not be linked
+                continue
+            if stat_dirs:
+                try:
+                    index.mtimes[parent] = os.stat(path).st_mtime
+                except OSError:
+                    pass
+            # Files first, and then the directories to keep the order the results used to have
+            for file in files:
+                index.add(file, parent, KIND_FILE)
+            for direc in dirs:
+                dir_ids[os.path.join(path, direc)] = index.add(direc, parent, KIND_DIR)
+        index.freeze()
+        return index
+
+    def add(self, name: str, parent: int, kind: int, mtime: float = 0.0, size: int = 0) -> int:
+        """Adds an entry to the index
+        Note: Entries added while building the index are searchable after the call to freeze(),
+              later additions are searchable immediately (via the pending names)
+
+        Args:
+            name (str): The name of the file or directory
+            parent (int): The id of the directory the entry is in
+            kind (int): KIND_FILE or KIND_DIR
+            mtime (float, optional): The modification time of a file, or of a directory when it was listed
+            size (int, optional): The size of a file
+
+        Returns:
+            int: The id of the new entry
+        """
+        self._materialize()
+        self.names.append(name)
+        self.parents.append(parent)
+        self.kinds.append(kind)
+        self.mtimes.append(mtime)
+        self.sizes.append(size)
+        i = len(self.names) - 1
+        if self._tracking:
+            self._changed(i)
+        if self._children is not None:
+            self._children.setdefault(parent, {})[name] = i
+        return i
+
+    def remove(self, i: int) -> None:
+        """Removes an entry (and everything in it if it is a directory) from the index
+
+        Args:
+            i (int): The id of the entry to remove
+        """
+        self._materialize()
+        removed = self.removed
+        children = self._child_map()
+        children.get(self.parents[i], {}).pop(self.names[i], None)
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            if self.kinds[j] != KIND_DELETED:
+                removed += 1
+            self.kinds[j] = KIND_DELETED
+            self._snapshot[2].pop(j, None)
+            self.pruned.discard(j)
+            self._dir_paths.pop(j, None)
+            stack.extend(children.pop(j, {}).values())
+        self._removed = removed
+        self.generation += 1
+
+    def move(self, i: int, parent: int, name: str) -> None:
+        """Moves (or renames) an entry, the entries in a moved directory keep their ids
+
+        Args:
+            i (int): The id of the entry to move
+            parent (int): The id of the new directory of the entry
+            name (str): The new name of the entry
+        """
+        self._materialize()
+        children = self._child_map()
+        children.get(self.parents[i], {}).pop(self.names[i], None)
+        self.names[i] = name
+        self.parents[i] = parent
+        children.setdefault(parent, {})[name] = i
+        # The paths of everything in a moved directory changed as well
+        self._dir_paths = {0: self.root_dir}
+        self._changed(i)
+
+    def set_mtime(self, i: int, mtime: float) -> None:
+        """Records the modification time of a directory when it was listed
+
+        Args:
+            i (int): The id of the directory
+            mtime (float): The modification time
+        """
+        self._materialize()
+        self.mtimes[i] = mtime
+
+    def set_metadata(self, i: int, mtime: float, size: int) -> None:
+        """Records the modification time and the size of a (changed) file
+
+        Args:
+            i (int): The id of the file
+            mtime (float): The modification time
+            size (int): The size in bytes
+        """
+        if self.mtimes[i] == mtime and self.sizes[i] == size:
+            return
+        self._materialize()
+        self.mtimes[i] = mtime
+        self.sizes[i] = size
+        self.generation += 1
+
+    def lookup(self, path: str) -> Optional[int]:
+        """Finds the entry of a path
+
+        Args:
+            path (str): The full path
+
+        Returns:
+            Optional[int]: The id of the entry, None if it is not in the index
+        """
+        rel = os.path.relpath(path, self.root_dir)
+        if rel == os.curdir:
+            return 0
+        if rel.startswith(os.pardir):
+            return None
+        children = self._child_map()
+        i = 0
+        for part in rel.split(os.sep):
+            i = children.get(i, {}).get(part)
+            if i is None:
+                return None
+        return i
+
+    def children(self, i: int) -> Dict[str, int]:
+        """Returns the entries in a directory
+
+        Args:
+            i (int): The id of the directory
+
+        Returns:
+            Dict[str, int]: The name and id of every entry in the directory
+        """
+        return dict(self._child_map().get(i, {}))
+
+    def _child_map(self) -> Dict[int, Dict[str, int]]:
+        """Returns the children of every directory, it is created the first time it is needed"""
+        if self._children is None:
+            children: Dict[int, Dict[str, int]] = {}
+            for i in range(1, len(self.names)):
+                if self.kinds[i] != KIND_DELETED:
+                    children.setdefault(self.parents[i], {})[self.names[i]] = i
+            self._children = children
+        return self._children
+
+    def _materialize(self) -> None:
+        """Copies the columns of a mapped index into memory, so they can be changed"""
+        if not self._mapped:
+            return
+        self.names = list(self.names)
+        self.parents = to_array(self.parents, 'i')
+        self.kinds = bytearray(self.kinds)
+        self.mtimes = to_array(self.mtimes, 'd')
+        self.sizes = to_array(self.sizes, 'q')
+        self._mapped = False
+
+    def _changed(self, i: int) -> None:
+        """Makes the (new) name of a changed entry searchable"""
+        folded = fold(self.names[i])
+        pending = self._snapshot[2]
+        pending[i] = folded
+        if self.trigrams is not None:
+            self.trigrams.add(i, folded)
+        self.generation += 1
+        # Scanning the pending names is slow compared to the search buffer, so do not let it grow to large
+        if len(pending) > PENDING_LIMIT:
+            self.freeze()
+
+    def freeze(self, track: bool = True) -> None:
+        """(Re)builds the search buffer from the names
+
+        Args:
+            track (bool, optional): Set to false while the index is still being built, the entries added after this call
+                                    are then only searchable after the next call to freeze(). Defaults to True
+        """
+        # The root directory (id 0) and the removed entries have an empty name in the buffer
+        folded = [b''] + [fold(name) if kind != KIND_DELETED else b''
+                          for name, kind in islice(zip(self.names, self.kinds), 1, None)]
+        buffer = SEPARATOR.join(folded) + SEPARATOR
+        # Every name is followed by the separator, so the next entry starts one byte after the name
+        offsets = array('Q', accumulate((len(name) + 1 for name in folded), initial=0))
+        # Published at once, the searches that still use the old snapshot keep their own buffer and pending names
+        self._snapshot = (buffer, offsets, {})
+        self._tracking = track
+        # The trigram index already contains the changed entries, it now describes the new buffer
+        if self.trigrams is not None:
+            self.trigrams.stamp(buffer)
+
+    def compact(self) -> Tuple['NameIndex', array]:
+        """Creates a copy of the index without the removed entries, the entries are numbered again (in the same order)
+
+        The copy is a new index (with its own uid), so the searches that still use this index are not affected. The ids
+        of this index that are stored elsewhere (e.g. in the content index) have to be translated with the returned
+        mapping, the trigram index is rebuilt for the copy when this index has one.
+
+        Returns:
+            Tuple[NameIndex, array]: The compacted index, and the new id of every entry of this index (-1 if it was removed)
+        """
+        names, parents, kinds = self.names, self.parents, self.kinds
+        live = list(compress(range(len(kinds)), (kind != KIND_DELETED for kind in kinds)))
+        remap = array('i', [-1]) * len(kinds)
+        for new, old in enumerate(live):
+            remap[old] = new
+        index = NameIndex(self.root_dir)
+        index.names = [names[i] for i in live]
+        # The root directory (id 0) has no parent, and the parents of the entries that are left were not removed
+        index.parents = array('i', (remap[parents[i]] if parents[i] >= 0 else -1 for i in live))
+        index.kinds = bytearray(kinds[i] for i in live)
+        index.mtimes = array('d', (self.mtimes[i] for i in live))
+        index.sizes = array('q', (self.sizes[i] for i in live))
+        index.rules = self.rules
+        index.pruned = {remap[i] for i in self.pruned if remap[i] >= 0}
+        index.generation = self.generation
+        index.scanner = self.scanner
+        index._removed = 0
+        index.freeze()
+        if self.trigrams is not None:
+            index.build_trigrams()
+        return index, remap
+
+    def save(self, file_path: str) -> None:
+        """Saves the index to file_path, the file is replaced atomically
+
+        The file starts with the header and the root_dir, followed by the sections:
+            name offsets, name table, parents, kinds, mtimes, sizes, search buffer offsets and the search buffer.
+        The search buffer is aligned to SECTION_ALIGNMENT, so it can be mapped on its own.
+        When there are crawl rules, the pruned directories and the (json) rules follow the search buffer.
+
+        Args:
+            file_path (str): The file to write the index to
+        """
+        # Everything has to be in the search buffer
+        buffer, offsets, pending = self._snapshot
+        # A loaded index is still mapped from its file, which can not be replaced while it is mapped on windows
+        mapped = self._mapped or isinstance(buffer, mmap)
+        if pending or len(offsets) - 1 != len(self.names) or mapped:
+            self._materialize()
+            self.freeze()
+            buffer, offsets, _ = self._snapshot
+        names = [encode(name) for name in self.names]
+        table = SEPARATOR.join(names) + SEPARATOR
+        name_offsets = array('Q', accumulate((len(name) + 1 for name in names), initial=0))
+        root = encode(self.root_dir)
+        flags = FLAG_MTIMES | FLAG_SIZES | (FLAG_RULES if self.rules or self.pruned else 0)
+        with atomic_write(file_path) as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, len(names), len(table), len(buffer)))
+            f.write(struct.pack('<I', len(root)))
+            f.write(root)
+            pad(f)
+            write_array(f, name_offsets)
+            f.write(table)
+            pad(f)
+            for column in (self.parents, self.kinds, self.mtimes, self.sizes, offsets):
+                write_array(f, column)
+            pad(f, SECTION_ALIGNMENT)
+            f.write(buffer)
+            if flags & FLAG_RULES:
+                pad(f)
+                rules = json.dumps(self.rules.as_dict()).encode('utf-8')
+                f.write(RULES_HEADER.pack(len(self.pruned), len(rules)))
+                write_array(f, array('I', sorted(self.pruned)))
+                f.write(rules)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'NameIndex':
+        """Loads an index from file_path by mapping it into memory, nothing is copied or parsed
+
+        Args:
+            file_path (str): The file the index was saved to
+
+        Raises:
+            ValueError: If the file is not a (supported) index file, or if it is truncated
+
+        Returns:
+            NameIndex: The loaded index
+        """
+        view = map_file(file_path)
+        if len(view) < HEADER.size:
+            raise ValueError(f'{file_path} is not an index file')
+        magic, version, flags, count, table_size, buffer_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{file_path} is not an index file')
+        pos = HEADER.size
+        root_size, = struct.unpack_from('<I', view, pos)
+        pos += 4
+        root_dir = str(view[pos:pos + root_size], 'utf-8', 'surrogatepass')
+        pos = aligned(pos + root_size)
+
+        def column(typecode: str, length: int):
+            nonlocal pos
+            arr = view_array(view, typecode, pos, length)
+            pos = aligned(pos + arr.itemsize * length)
+            return arr
+
+        name_offsets = column('Q', count + 1)
+        table = view[pos:pos + table_size]
+        pos = aligned(pos + table_size)
+        index = cls(root_dir)
+        index.names = StringTable(table, name_offsets)
+        index.parents = column('i', count)
+        index.kinds = column('B', count)
+        index.mtimes = column('d', count) if flags & FLAG_MTIMES else array('d', bytes(8 * count))
+        index.sizes = column('q', count) if flags & FLAG_SIZES else array('q', bytes(8 * count))
+        offsets = column('Q', count + 1)
+        pos = aligned(pos, SECTION_ALIGNMENT)
+        if pos + buffer_size > len(view) or len(table) != table_size:
+            raise ValueError('The file is truncated')
+        index._snapshot = (map_section(file_path, pos, buffer_size), offsets, {})
+        if flags & FLAG_RULES:
+            pos = aligned(pos + buffer_size)
+            if pos + RULES_HEADER.size > len(view):
+                raise ValueError('The file is truncated')
+            pruned_count, rules_size = RULES_HEADER.unpack_from(view, pos)
+            pos += RULES_HEADER.size
+            index.pruned = set(column('I', pruned_count))
+            try:
+                index.rules = CrawlRules.from_dict(json.loads(bytes(view[pos:pos + rules_size])))
+            except ValueError as e:
+                raise ValueError('The crawl rules are invalid') from e
+        index._mapped = True
+        index._tracking = True
+        return index
+
+    def build_trigrams(self) -> TrigramIndex:
+        """Builds the trigram index for the current search buffer
+
+        Returns:
+            TrigramIndex: The created (and attached) trigram index
+        """
+        buffer, offsets, _ = self._snapshot
+        self.trigrams = TrigramIndex.build(buffer, offsets)
+        return self.trigrams
+
+    def attach_trigrams(self, trigrams: TrigramIndex) -> bool:
+        """Attaches a (loaded) trigram index, if it was built from the current search buffer
+
+        Args:
+            trigrams (TrigramIndex): The trigram index to attach
+
+        Returns:
+            bool: True if the trigram index was attached, False if it is stale
+        """
+        buffer, offsets, _ = self._snapshot
+        if trigrams.entries != len(offsets) - 1 or not trigrams.matches(buffer):
+            return False
+        self.trigrams = trigrams
+        return True
+
+    @property
+    def state(self) -> Tuple[int, int]:
+        """Identifies the current state of the index, it changes whenever the index changes"""
+        return self.uid, self.generation
+
+    def search(self, query: str, candidates: Optional[Sequence[int]] = None, stats: Optional[dict] = None) -> Iterator[int]:
+        """Searches the folded names for the (case insensitive) query
+
+        Args:
+            query (str): The query to search for
+            candidates (Sequence[int], optional): Only check these ids (in this order), e.g. the matches of a shorter query
+            stats (dict, optional): Receives the number of entries that are checked ('candidates'), for the metrics
+
+        Yields:
+            int: The ids of the matching entries, in index order
+        """
+        needle = fold(query)
+        buffer, offsets, pending = self._snapshot
+        trigrams, kinds = self.trigrams, self.kinds
+        # Copy the pending names, so changes made while searching do not interfere
+        pending = dict(pending)
+        # Entries added after the copy (e.g. in the trigram overlay) are not in this snapshot
+        last = len(offsets) - 1
+        if candidates is not None:
+            if stats is not None:
+                stats['candidates'] = len(candidates) + len(pending)
+            for i in candidates:
+                if kinds[i] == KIND_DELETED:
+                    continue
+                name = pending.get(i)
+                if name is not None:
+                    if needle in name:
+                        yield i
+                elif i < last and buffer.find(needle, offsets[i], offsets[i + 1] - 1) != -1:
+                    yield i
+            return
+        # An empty query matches everything, except the root directory
+        if not needle:
+            if stats is not None:
+                stats['candidates'] = len(kinds)
+            yield from (i for i in range(1, len(kinds)) if kinds[i] != KIND_DELETED)
+            return
+        # Use the trigram index if possible, queries shorter than three bytes fall back to the scan
+        candidates = trigrams.candidates(needle) if trigrams is not None else None
+        if stats is not None:
+            # The scan checks every entry in the buffer
+            stats['candidates'] = (len(candidates) if candidates is not None else last) + len(pending)
+        if candidates is not None:
+            for i in candidates:
+                if i >= last or i in pending or kinds[i] == KIND_DELETED:
+                    continue
+                # The candidates contain every trigram, but not necessarily in the right order
+                if buffer.find(needle, offsets[i], offsets[i + 1] - 1) != -1:
+                    yield i
+        else:
+            ids = self._scan_shards(buffer, offsets, re.compile(re.escape(needle)))
+            if ids is not None:
+                yield from (i for i in ids if i not in pending and kinds[i] != KIND_DELETED)
+            else:
+                find = buffer.find
+                pos = find(needle)
+                while pos != -1:
+                    # Find the entry the match is in, the offsets are sorted so we can bisect
+                    i = bisect_right(offsets, pos) - 1
+                    if i not in pending and kinds[i] != KIND_DELETED:
+                        yield i
+                    # Continue at the next entry, so every entry is only yielded once
+                    pos = find(needle, offsets[i + 1])
+        # The entries that changed since the buffer was built are matched against their current name
+        for i in sorted(pending):
+            if needle in pending[i] and kinds[i] != KIND_DELETED:
+                yield i
+
+    def match(self, pattern: Pattern[bytes]) -> Iterator[int]:
+        """Searches the folded names with a (compiled) regular expression
+
+        Args:
+            pattern (Pattern[bytes]): The pattern, it should not match the null byte that separates the names
+
+        Yields:
+            int: The ids of the matching entries, in index order
+        """
+        buffer, offsets, pending = self._snapshot
+        kinds = self.kinds
+        pending = dict(pending)
+        search = pattern.search
+        ids = self._scan_shards(buffer, offsets, pattern)
+        if ids is not None:
+            # The root directory is never a match
+            yield from (i for i in ids if i != 0 and i not in pending and kinds[i] != KIND_DELETED)
+        else:
+            m = search(buffer)
+            while m is not None:
+                i = bisect_right(offsets, m.start()) - 1
+                if i != 0 and i not in pending and kinds[i] != KIND_DELETED:
+                    yield i
+                if i + 1 >= len(offsets) - 1:
+                    break
+                m = search(buffer, offsets[i + 1])
+        for i in sorted(pending):
+            if kinds[i] != KIND_DELETED and search(pending[i]) is not None:
+                yield i
+
+    def _scan_shards(self, buffer: bytes, offsets: Sequence[int], pattern: Pattern[bytes]) -> Optional[List[int]]:
+        """Scans the search buffer with the scanner (in parallel), None if there is no scanner or it did not scan"""
+        if self.scanner is None:
+            return None
+        return self.scanner.scan(self.uid, buffer, offsets, pattern)
+
+    def path(self, i: int) -> str:
+        """Returns the full path of an entry
+
+        Args:
+            i (int): The id of the entry
+
+        Returns:
+            str: The full path
+        """
+        if i in self._dir_paths:
+            return self._dir_paths[i]
+        path = os.path.join(self.path(self.parents[i]), self.names[i])
+        # Only the directory paths are cached, because they are shared between many entries
+        if self.kinds[i] == KIND_DIR:
+            self._dir_paths[i] = path
+        return path
@@ -1,5 +1,5 @@
 import eel
-from typing import List, Tuple
+from typing import Tuple
 import subprocess
 import os
 import platform
@@ -11,19 +11,23 @@ import pystray
 from PIL import Image
 
 
-from searcher import FileSearchEngine
-from utils import sortByFolder
+from coordinator import SearchCoordinator
+from daemon import RemoteSearchEngine
+from rules import CrawlRules
+import threading
 import time
 import json
+import logging
+import multiprocessing
 
 # Type defs
 StartSize = Tuple[int, int]
 StartPos = Tuple[int, int]
-SearchFileRet = List[dict]
+SearchFileRet = dict
 
 
 class SearchApp:
-    def __init__(self, host: str, port: str, start_size: StartSize, start_pos: StartPos, root_dir: str, prod: bool = True, search_timeout=5.0):
+    def __init__(self, host: str, port: str, start_size: StartSize, start_pos: StartPos, root_dir: str, prod: bool = True, search_timeout=5.0, roots=(), daemon='', crawl_rules=None, content_index=False, scan_workers=0):
         """Initialize the search app
 
         Args:
@@ -32,6 +36,11 @@ class SearchApp:
             start_size (StartSize): The size of the main window when starting up
             start_pos (StartPos): The position on the screen when starting the application
             root_dir (str): The root directory where all searches take place
+            roots (list, optional): The other directories to search in, a directory or a dict with its path and search_timeout
+            daemon (str, optional): The address of a running search daemon (daemon.py), it then does the indexing and searching
+            crawl_rules (dict, optional): Which files and directories are indexed, see rules.CrawlRules.from_dict
+            content_index (bool, optional): Set to true to index the content of the documents as well (in the background)
+            scan_workers (int, optional): The number of processes that scan the indexes in parallel, 0 scans in the search request
         """
         self.host = host
         self.port = port
@@ -39,7 +48,16 @@ class SearchApp:
         self.startPosition = start_pos
         self.root_dir = root_dir
         self.search_timeout = search_timeout
-        self.file_search = FileSearchEngine(root_dir, search_timeout)
+        self.roots = list(roots)
+        self.daemon = daemon
+        self.crawl_rules = CrawlRules.from_dict(crawl_rules)
+        self.content_index = content_index
+        self.scan_workers = scan_workers
+        if daemon:
+            self.file_search = RemoteSearchEngine(daemon)
+        else:
+            self.file_search = SearchCoordinator(self.all_roots(), search_timeout, rules=self.crawl_rules,
+                                                 content_index=content_index, scan_workers=scan_workers)
 
         # The hotkey to use when opening from the background
         self.hotkey = 'ctrl+shift+space'
@@ -126,8 +144,8 @@ class SearchApp:
             except AttributeError:
                 pass
             print("Hotkeys removed")
-            # Stop the filewather from the FileSearchEngine
-            self.file_search.stop_watcher()
+            # Stop the filewatchers (and the scan workers) of all the roots
+            self.file_search.close()
             print("Watchers stopped")
             self.icon.stop()
             print("Removed the icon")
@@ -173,9 +191,37 @@ class SearchApp:
 
     def update_search_engine(self):
         """ Updates the search engine settings
-            Note: it creates a new search engine
+            Note: only the roots that were added are indexed, the indexes of the other roots are kept,
+                  and a change of the crawl rules only lists the directories it affects. None of it blocks:
+                  the added roots serve their saved index while it is checked (or crawled) in the background
         """
-        self.file_search = FileSearchEngine(self.root_dir, self.search_timeout)
+        if self.daemon:
+            if not isinstance(self.file_search, RemoteSearchEngine) or self.file_search.url != self.daemon.rstrip('/'):
+                self.file_search.close()
+                self.file_search = RemoteSearchEngine(self.daemon)
+            # The daemon applies the rules in the background
+            self.file_search.set_rules(self.crawl_rules.as_dict())
+        elif not isinstance(self.file_search, SearchCoordinator):
+            self.file_search = SearchCoordinator(self.all_roots(), self.search_timeout, rules=self.crawl_rules,
+                                                 content_index=self.content_index, scan_workers=self.scan_workers)
+            return
+        else:
+            # Applying the rules lists the directories they affect, the settings are not kept waiting for that
+            # (the new roots are crawled in the background as well)
+            threading.Thread(target=self.file_search.set_rules, args=(self.crawl_rules,), daemon=True).start()
+            # The daemon decides itself whether it indexes the content (see daemon.py --content)
+            self.file_search.set_content_index(self.content_index)
+            self.file_search.set_scan_workers(self.scan_workers)
+        self.file_search.watch_timeout = self.search_timeout
+        self.file_search.set_roots(self.all_roots())
+
+    def daemon_error(self, error: OSError) -> str:
+        """ Returns the error message for a request to the daemon that failed (e.g. it is not running) """
+        return f"The search daemon at {self.daemon} can not be reached: {error}"
+
+    def all_roots(self) -> list:
+        """ Returns the root_dir followed by the other roots, which use the search_timeout unless they have their own """
+        return [self.root_dir] + [root for root in self.roots if root != self.root_dir]
 
     def save_settings(self, file_name='settings.json', settings={}) -> None:
         """Save the settings to a file
@@ -219,20 +265,35 @@ class SearchApp:
 
     @staticmethod
     @eel.expose("search_file")
-    def search_file(search_query: str) -> List[dict]:
+    def search_file(search_query: str, query_id: int = None, limit: int = 50, offset: int = 0,
+                    mode: str = 'substring') -> SearchFileRet:
         """Search file is exposed to the interface and uses FileSearchEngine to search for the given query
 
         Args:
             search_query (str): The query to search for
+            query_id (int, optional): Increases with every query, a newer query cancels the search of the older ones
+            limit (int, optional): The number of results to return. Defaults to 50
+            offset (int, optional): The number of results to skip (for the next pages). Defaults to 0
+            mode (str, optional): 'substring', 'glob' (e.g. *.pdf) or 'regex'. Defaults to 'substring'
         Returns:
-            List[dict]: The search results
+            SearchFileRet: The page of (sorted) search results, see FileSearchEngine.search. An invalid glob or
+                           regular expression (or a daemon that can not be reached) returns an empty page with the error
         """
 
         # This is a bit hacky, but the method has to be a static method because the javascript
         # does not have access to the class
         # This is if the self.file_search changes for example when the root_dir is changed, we can
         # still access the correct variable
-        return sortByFolder(app.file_search.simple_search(search_query, ret_dic=True))
+        # eel.sleep lets the newer queries come in while searching, so they can cancel this one
+        try:
+            return app.file_search.search(search_query, limit=int(limit), offset=int(offset), query_id=query_id,
+                                          checkpoint=lambda: eel.sleep(0), mode=mode)
+        except ValueError as e:
+            error = str(e)
+        except OSError as e:
+            error = app.daemon_error(e)
+        return {'query_id': query_id, 'results': [], 'matched': 0, 'complete': True, 'cancelled': False,
+                'error': error}
 
     @staticmethod
     @eel.expose("open_file")
@@ -264,10 +325,28 @@ class SearchApp:
         settings = {
             "hotkey": app.hotkey,
             "root_dir": app.root_dir,
-            "search_timeout": app.search_timeout
+            "search_timeout": app.search_timeout,
+            "roots": app.roots,
+            "daemon": app.daemon,
+            "crawl_rules": app.crawl_rules.as_dict(),
+            "content_index": app.content_index,
+            "scan_workers": app.scan_workers
         }
         return settings
 
+    @staticmethod
+    @eel.expose("get_stats")
+    def get_stats() -> dict:
+        """get_stats returns the health and the metrics of the index of every root (shown in the settings)
+
+        Returns:
+            dict: See SearchCoordinator.stats, with the error when the daemon can not be reached
+        """
+        try:
+            return app.file_search.stats()
+        except OSError as e:
+            return {'roots': {}, 'error': app.daemon_error(e)}
+
     @staticmethod
     @eel.expose("update_settings")
     def update_settings(settings: dict) -> str:
@@ -292,13 +371,50 @@ class SearchApp:
         # Set the search timeout
         if 'search_timeout' in settings:
             app.search_timeout = float(settings['search_timeout'])
-        # Update the search engine
-        app.update_search_engine()
+        # Set the other roots, the directories that do not exist are skipped
+        if 'roots' in settings:
+            roots = []
+            for root in settings['roots']:
+                path = root if isinstance(root, str) else root.get('path', '')
+                if os.path.isdir(path):
+                    roots.append(root)
+                else:
+                    error = f"The directory {path} is not valid"
+            app.roots = roots
+        # Search through a daemon (an empty string searches in this process)
+        if 'daemon' in settings:
+            app.daemon = settings['daemon']
+        # Set the crawl rules, invalid rules (e.g. a broken glob) keep the current rules
+        if 'crawl_rules' in settings:
+            try:
+                app.crawl_rules = CrawlRules.from_dict(settings['crawl_rules'])
+            except (TypeError, ValueError) as e:
+                error = f"The crawl rules are not valid: {e}"
+        # Index the content of the documents as well
+        if 'content_index' in settings:
+            app.content_index = bool(settings['content_index'])
+        # Scan the indexes with more processes, which only pays off for big indexes
+        if 'scan_workers' in settings:
+            try:
+                app.scan_workers = max(0, int(settings['scan_workers'] or 0))
+            except (TypeError, ValueError):
+                error = "The number of search processes is not valid"
+        # Update the search engine, the settings are saved even when the daemon can not be reached (yet)
+        try:
+            app.update_search_engine()
+        except ValueError as e:
+            error = f"The search daemon did not accept the settings: {e}"
+        except OSError as e:
+            error = app.daemon_error(e)
         app.save_settings(settings=settings)
         return error
 
 
 if __name__ == "__main__":
+    # The scan and content workers are spawned processes, in the frozen (pyinstaller) build they run this executable,
+    # which then has to run the worker instead of the app
+    multiprocessing.freeze_support()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     # Create the search app
     # Check if there are saved settings
     settings = SearchApp.load_settings('settings.json')
@@ -321,7 +437,9 @@ if __name__ == "__main__":
     # Create the app
     try:
         app = SearchApp('localhost', 8080, "3020", (w, h),
-                        (pos_w, pos_h), root_dir, prod=prod)
+                        (pos_w, pos_h), root_dir, prod=prod, daemon=settings.get('daemon', ''),
+                        crawl_rules=settings.get('crawl_rules'), content_index=settings.get('content_index', False),
+                        scan_workers=settings.get('scan_workers', 0))
     except FileNotFoundError:
         new_dir = os.path.abspath(os.sep)
         print(
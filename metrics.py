@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The upper bounds of the buckets of a latency histogram (in milliseconds), the last bucket holds everything slower
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# The upper bounds of the buckets of a count histogram (matches, candidates)
+COUNT_BUCKETS = [0, 1, 10, 100, 1000, 10000, 100000, 1000000]
+
+
+class Histogram:
+    """ Histogram counts values in fixed buckets, so recording a value is cheap and the memory use is constant. """
+
+    def __init__(self, bounds: List[float]):
+        """Initializes the histogram
+
+        Args:
+            bounds (List[float]): The (sorted) upper bounds of the buckets
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Records a value"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        """Returns (an upper bound of) the p-th percentile, the bound of the bucket it falls in"""
+        if self.count == 0:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        """Returns the histogram as a (json) dict: count, mean, p50, p90, p99, max and the count per bucket"""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'buckets': {str(bound): count for bound, count in zip(self.bounds + ['inf'], self.counts)},
+        }
+
+
+class Metrics:
+    """ Metrics collects the counters, gauges (last values) and histograms of a FileSearchEngine.
+
+    Queries slower than slow_query_seconds are kept (the most recent ones), logged and passed to the
+    optional slow_query_hook, which can be used to profile them further.
+    """
+
+    def __init__(self, slow_query_seconds: float = 0.1, slow_query_hook: Optional[Callable[[dict], None]] = None,
+                 keep_slow_queries: int = 20):
+        """Initializes the metrics
+
+        Args:
+            slow_query_seconds (float, optional): Queries that take longer are slow. Defaults to 0.1
+            slow_query_hook (Callable[[dict], None], optional): Called with the record of every slow query
+            keep_slow_queries (int, optional): The number of slow queries that are kept. Defaults to 20
+        """
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_query_hook = slow_query_hook
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.slow_queries: Deque[dict] = deque(maxlen=keep_slow_queries)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Increments a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name: str, value: float) -> None:
+        """Sets a gauge, e.g. the duration of the last crawl"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, bounds: List[float] = LATENCY_BUCKETS) -> None:
+        """Records a value in a histogram, the histogram is created with the bounds the first time"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Measures the block: the duration (in seconds) is set as the gauge {name}_seconds and
+        recorded in the histogram {name}_ms"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.set(f'{name}_seconds', seconds)
+            self.observe(f'{name}_ms', seconds * 1000)
+
+    def query(self, kind: str, query: str, seconds: float, matched: int, candidates: Optional[int] = None,
+              complete: bool = True, cancelled: bool = False) -> None:
+        """Records a query
+
+        Args:
+            kind (str): The search method (search, advanced_search, ...)
+            query (str): The query
+            seconds (float): The time the query took
+            matched (int): The number of matches
+            candidates (int, optional): The number of entries that had to be checked, None if it is unknown
+            complete (bool, optional): False if the query ran out of time. Defaults to True
+            cancelled (bool, optional): True if the query was cancelled by a newer one. Defaults to False
+        """
+        self.incr('queries')
+        self.incr(f'{kind}_queries')
+        if not complete:
+            self.incr('incomplete_queries')
+        if cancelled:
+            self.incr('cancelled_queries')
+        self.observe(f'{kind}_ms', seconds * 1000)
+        self.observe('matches', matched, COUNT_BUCKETS)
+        if candidates is not None:
+            self.observe('candidates', candidates, COUNT_BUCKETS)
+        if seconds < self.slow_query_seconds:
+            return
+        record = {'kind': kind, 'query': query, 'ms': seconds * 1000, 'matched': matched, 'candidates': candidates,
+                  'complete': complete, 'time': time.time()}
+        self.incr('slow_queries')
+        self.slow_queries.append(record)
+        logger.info('Slow %s for %r: %.1fms, %d matches', kind, query, seconds * 1000, matched)
+        if self.slow_query_hook is not None:
+            self.slow_query_hook(record)
+
+    def snapshot(self) -> dict:
+        """Returns all the metrics as a (json) dict: counters, gauges, histograms and slow_queries"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+                'slow_queries': list(self.slow_queries),
+            }
@@ -0,0 +1,181 @@
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+# Buffers smaller than this are scanned in the calling thread, sending the work to the pool would take longer
+MIN_PARALLEL_BYTES = 4 * 1024 * 1024
+
+# The number of indexes (e.g. of several roots) whose search buffer stays in shared memory
+MAX_PUBLISHED = 8
+
+# The shared memory blocks a worker process is attached to: key of the index -> (buffer block, offsets block)
+_attached: 'OrderedDict[int, Tuple[object, object]]' = OrderedDict()
+
+
+def _attach(key: int, buffer_name: str, offsets_name: str) -> Tuple[object, object]:
+    """Attaches a worker to the shared memory blocks of an index, they stay attached until the buffer is replaced"""
+    from multiprocessing import shared_memory
+    blocks = _attached.get(key)
+    if blocks is not None and (blocks[0].name, blocks[1].name) == (buffer_name, offsets_name):
+        _attached.move_to_end(key)
+        return blocks
+    # The parent removed the old blocks, they are only freed when every worker closed them as well
+    if blocks is not None:
+        for block in blocks:
+            block.close()
+    blocks = (shared_memory.SharedMemory(buffer_name), shared_memory.SharedMemory(offsets_name))
+    _attached[key] = blocks
+    while len(_attached) > MAX_PUBLISHED:
+        for block in _attached.popitem(last=False)[1]:
+            block.close()
+    return blocks
+
+
+def scan_shard(key: int, buffer_name: str, buffer_size: int, offsets_name: str, count: int, first: int, last: int,
+               pattern: bytes, flags: int) -> bytes:
+    """Scans the entries first to last (exclusive) of a search buffer in shared memory, it runs in the worker processes
+
+    Args:
+        key (int): Identifies the index the buffer belongs to (see ShardedScanner.scan)
+        buffer_name (str): The shared memory block with the search buffer
+        buffer_size (int): The size of the search buffer
+        offsets_name (str): The shared memory block with the offsets of the entries (count + 1 unsigned 64 bit numbers)
+        count (int): The number of entries in the buffer
+        first (int): The first entry of the shard
+        last (int): The entry after the shard
+        pattern (bytes): The regular expression to search for, it should not match the null byte that separates the names
+        flags (int): The flags of the regular expression
+
+    Returns:
+        bytes: The ids of the matching entries (an array of unsigned 32 bit numbers), in index order
+    """
+    buffer_block, offsets_block = _attach(key, buffer_name, offsets_name)
+    buffer = buffer_block.buf[:buffer_size]
+    offsets = offsets_block.buf[:8 * (count + 1)].cast('Q')
+    search = re.compile(pattern, flags).search
+    ids = array('I')
+    end = offsets[last]
+    m = search(buffer, offsets[first], end)
+    while m is not None:
+        i = bisect_right(offsets, m.start()) - 1
+        ids.append(i)
+        # Continue at the next entry, so every entry is only returned once
+        if i + 1 >= last:
+            break
+        m = search(buffer, offsets[i + 1], end)
+    buffer.release()
+    offsets.release()
+    return ids.tobytes()
+
+
+class ShardedScanner:
+    """ ShardedScanner scans the search buffer of a NameIndex with a pool of processes.
+
+    The buffer and its offsets are copied into shared memory once (every time the buffer is rebuilt, the copies of
+    the old buffer are removed then), the workers attach to it by name, so the index is never pickled or copied per worker or per query. Every worker scans a
+    shard (a range of entries) and returns the ids it found; the shards are concatenated in order, so the ids are
+    in index order like a scan in a single thread.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_bytes: int = MIN_PARALLEL_BYTES):
+        """Initializes the scanner and starts the worker processes
+
+        Args:
+            workers (int, optional): The number of processes (and shards). Defaults to the number of cpus
+            min_bytes (int, optional): Smaller buffers are scanned in the calling thread. Defaults to MIN_PARALLEL_BYTES
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.min_bytes = min_bytes
+        # spawn (instead of fork) so the workers do not inherit the threads and the memory of the app
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        # The published buffer of every index: key of the index -> (buffer, buffer block, offsets block)
+        self._published: 'OrderedDict[int, Tuple[object, object, object]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Start the workers now, so the first query does not wait for them
+        for _ in range(self.workers):
+            self.pool.submit(os.getpid)
+
+    def scan(self, key: int, buffer: bytes, offsets: Sequence[int], pattern: Pattern[bytes]) -> Optional[List[int]]:
+        """Finds the entries in the buffer that match the pattern
+
+        Args:
+            key (int): Identifies the index (e.g. NameIndex.uid), a new buffer of the index replaces its old one
+            buffer (bytes): The search buffer (see NameIndex)
+            offsets (Sequence[int]): The offset of every entry in the buffer, and the end of the buffer
+            pattern (Pattern[bytes]): The regular expression, it should not match the null byte that separates the names
+
+        Returns:
+            Optional[List[int]]: The ids of the matching entries in index order, None if the buffer is too small
+                                 to scan in parallel (or the workers failed), the caller then scans it itself
+        """
+        count = len(offsets) - 1
+        if len(buffer) < self.min_bytes or count < self.workers:
+            return None
+        try:
+            buffer_block, offsets_block = self.publish(key, buffer, offsets)
+            step = -(-count // self.workers)
+            futures = [self.pool.submit(scan_shard, key, buffer_block.name, len(buffer), offsets_block.name, count, first,
+                                        min(first + step, count), pattern.pattern, pattern.flags)
+                       for first in range(0, count, step)]
+            ids: List[int] = []
+            for future in futures:
+                ids.extend(array('I', future.result()))
+            return ids
+        except Exception:
+            # E.g. a block that was replaced before a worker attached to it, or a worker that died
+            return None
+
+    def publish(self, key: int, buffer: bytes, offsets: Sequence[int]) -> Tuple[object, object]:
+        """Copies the search buffer of an index and its offsets into shared memory, if they are not there yet.
+        The copies of the previous buffer of the index are removed.
+
+        Returns:
+            Tuple[object, object]: The shared memory blocks of the buffer and the offsets
+        """
+        from multiprocessing import shared_memory
+
+        with self._lock:
+            # The buffers are never changed, a rebuilt buffer is a new object
+            published = self._published.pop(key, None)
+            if published is not None:
+                if published[0] is buffer:
+                    self._published[key] = published
+                    return published[1], published[2]
+                self._release(published)
+            buffer_block = shared_memory.SharedMemory(create=True, size=max(1, len(buffer)))
+            buffer_block.buf[:len(buffer)] = buffer
+            packed = array('Q', offsets)
+            offsets_block = shared_memory.SharedMemory(create=True, size=max(1, len(packed) * packed.itemsize))
+            offsets_block.buf[:len(packed) * packed.itemsize] = packed.tobytes()
+            self._published[key] = (buffer, buffer_block, offsets_block)
+            while len(self._published) > MAX_PUBLISHED:
+                self._release(self._published.popitem(last=False)[1])
+            return buffer_block, offsets_block
+
+    def release(self, key: int) -> None:
+        """Removes the shared memory copies of an index, e.g. when it is replaced by a new one"""
+        with self._lock:
+            published = self._published.pop(key, None)
+            if published is not None:
+                self._release(published)
+
+    @staticmethod
+    def _release(published: Tuple[object, object, object]) -> None:
+        for block in published[1:]:
+            block.close()
+            block.unlink()
+
+    def close(self) -> None:
+        """Stops the workers and removes the shared memory blocks"""
+        self.pool.shutdown(wait=False)
+        with self._lock:
+            for published in self._published.values():
+                self._release(published)
+            self._published.clear()
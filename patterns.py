@@ -0,0 +1,184 @@
+import fnmatch
+import re
+from functools import lru_cache
+from typing import List, Pattern
+
+# The ways a query can match a name, see compile_query
+MODES = ('substring', 'glob', 'regex')
+
+# A quantifier in braces: {n}, {n,}, {,m} or {n,m}
+BRACES = re.compile(r'\{(\d*)(?:,(\d*))?\}')
+
+# A whole escape: a character code (\x41, \u0041, \U00000041, \N{...}, octal \101 or \0), a group reference
+# (\1 to \99) or a single escaped character
+ESCAPE = re.compile(r'\\(?:x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}|N\{[^}]*\}?|[0-7]{3}|0[0-7]{0,2}|\d{1,2}|.)',
+                    re.DOTALL)
+
+
+def glob_literals(glob: str) -> List[str]:
+    """Returns the literal fragments of a glob, every name the glob matches contains all of them
+
+    Args:
+        glob (str): The glob, * matches anything, ? one character and [...] one character of a class
+
+    Returns:
+        List[str]: The fragments between the wildcards, e.g. ['report_', '.pdf'] for 'report_*.pdf'
+    """
+    literals = []
+    run = ''
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        i += 1
+        if char == '[':
+            # The same rules as fnmatch: a class can start with ! and ], without a closing ] the [ is literal
+            j = i
+            if j < len(glob) and glob[j] == '!':
+                j += 1
+            if j < len(glob) and glob[j] == ']':
+                j += 1
+            j = glob.find(']', j)
+            if j != -1:
+                i = j + 1
+                char = '*'
+        if char in '*?':
+            if run:
+                literals.append(run)
+            run = ''
+        else:
+            run += char
+    if run:
+        literals.append(run)
+    return literals
+
+
+def regex_literals(regex: str) -> List[str]:
+    """Returns literal fragments of a regular expression, every string the expression matches contains all of them
+
+    The extraction is conservative: groups are skipped and an alternation outside of a group (a|b) has no
+    required fragments at all. Fewer fragments only mean more candidates, never a missed match.
+
+    Args:
+        regex (str): The (valid) regular expression
+
+    Returns:
+        List[str]: The fragments, e.g. ['report_', '.pdf'] for r'report_\\d{4}\\.pdf'
+    """
+    literals = []
+    run = ''
+    depth = 0
+    # True if the last item was a character that was added to the run, a quantifier then applies to it
+    previous = False
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        literal = None
+        quantifier = None
+        if char == '\\':
+            escape = ESCAPE.match(regex, i)
+            escaped = escape.group()[1:] if escape else ''
+            # Escaped punctuation is literal, the other escapes (classes, anchors, references and character codes
+            # like \x41) end the run
+            if len(escaped) == 1 and not escaped.isalnum():
+                literal = escaped
+            i = escape.end() if escape else i + 1
+        elif char == '[':
+            i += 1
+            if regex[i:i + 1] == '^':
+                i += 1
+            # A ] directly at the start belongs to the class
+            if regex[i:i + 1] == ']':
+                i += 1
+            while i < len(regex) and regex[i] != ']':
+                i += 2 if regex[i] == '\\' else 1
+            i += 1
+        elif char == '(':
+            depth += 1
+            i += 1
+        elif char == ')':
+            depth -= 1
+            i += 1
+        elif char == '|':
+            if depth == 0:
+                # Only one of the alternatives has to match
+                return []
+            i += 1
+        elif char in '*?+':
+            quantifier = 1 if char == '+' else 0
+            i += 1
+        elif char == '{' and BRACES.match(regex, i):
+            braces = BRACES.match(regex, i)
+            quantifier = int(braces.group(1) or 0)
+            i = braces.end()
+        elif char in '.^$':
+            i += 1
+        else:
+            literal = char
+            i += 1
+        if depth > 0 or char == ')':
+            literal = None
+        if quantifier is not None:
+            # The repeated character is optional when it may occur zero times
+            if previous and quantifier == 0:
+                run = run[:-1]
+            # A lazy or possessive quantifier
+            if regex[i:i + 1] in ('?', '+'):
+                i += 1
+        if literal is not None and quantifier is None:
+            run += literal
+            previous = True
+            continue
+        if run:
+            literals.append(run)
+        run = ''
+        previous = False
+    if run:
+        literals.append(run)
+    return literals
+
+
+class QueryPattern:
+    """ QueryPattern is a compiled glob or regular expression query.
+
+    The literal fragments every match contains are extracted when it is compiled, so the candidates can be found
+    with the (trigram) name index and only those are checked against the full pattern.
+    """
+
+    def __init__(self, query: str, mode: str):
+        """Compiles the query
+
+        Args:
+            query (str): The glob or regular expression
+            mode (str): 'glob' (matches the whole name, e.g. *.pdf) or 'regex' (searched for in the name)
+
+        Raises:
+            ValueError: If the mode is unknown, or the query is not a valid pattern
+        """
+        self.query = query
+        self.mode = mode
+        if mode == 'glob':
+            self.pattern: Pattern[str] = re.compile(fnmatch.translate(query), re.IGNORECASE)
+            self.literals = glob_literals(query)
+        elif mode == 'regex':
+            try:
+                self.pattern = re.compile(query, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f'{query} is not a valid regular expression: {e}') from e
+            # Whitespace and comments are ignored in verbose patterns, the scan does not know about them
+            self.literals = regex_literals(query) if not self.pattern.flags & re.VERBOSE else []
+        else:
+            raise ValueError(f'{mode} is not a pattern mode, use glob or regex')
+        # The longest fragment usually has the fewest candidates, so it goes first
+        self.literals.sort(key=len, reverse=True)
+
+    def matches(self, name: str) -> bool:
+        """Checks if the (case insensitive) pattern matches a name"""
+        if self.mode == 'glob':
+            return self.pattern.match(name) is not None
+        return self.pattern.search(name) is not None
+
+
+@lru_cache(maxsize=64)
+def compile_query(query: str, mode: str) -> QueryPattern:
+    """Compiles a glob or regular expression query, the recent queries are only compiled once (see QueryPattern)"""
+    return QueryPattern(query, mode)
@@ -0,0 +1,167 @@
+import re
+from typing import Callable, Optional, Pattern
+
+from index import fold
+
+# Scores of the fuzzy matcher, modelled after fzf
+SCORE_MATCH = 16
+SCORE_GAP_START = -3
+SCORE_GAP_EXTENSION = -1
+# A match at the start of a word (after a separator or at the start of the name)
+BONUS_BOUNDARY = 8
+# A match on an upper case character after a lower case one (camelCase)
+BONUS_CAMEL = 7
+# A match directly after the previous match
+BONUS_CONSECUTIVE = 4
+# The bonus of the first character of the query counts this many times
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+# Every character of the query that matched the name (instead of the directories) gets this bonus
+BONUS_BASENAME = 4
+
+# The characters that separate the words of a name
+SEPARATORS = frozenset(' -_./\\()[]{}')
+
+# The characters that separate the directories in a query
+QUERY_SEPARATORS = re.compile(r'[\\/]')
+
+
+def subsequence_pattern(query: str) -> Pattern[bytes]:
+    """Creates the pattern that finds the folded names that contain the characters of the query in order
+
+    Every gap only skips the bytes that do not start the next character, so the pattern matches the first
+    occurrence of every character and a name that almost matches is rejected without backtracking through
+    all the ways the characters could be spread over it.
+
+    Args:
+        query (str): The (name part of the) query
+
+    Returns:
+        Pattern[bytes]: The pattern, it never matches across the null separators of the search buffer
+    """
+    chars = [fold(char) for char in query]
+    pattern = re.escape(chars[0]) if chars else b''
+    for char in chars[1:]:
+        pattern += _gap(char) + re.escape(char)
+    return re.compile(pattern, re.DOTALL)
+
+
+def _gap(char: bytes) -> bytes:
+    """Returns the pattern that matches the bytes of a name up to the next occurrence of the (utf-8) character"""
+    first = re.escape(char[:1])
+    if len(char) == 1:
+        return b'[^' + first + b'\0]*'
+    # A multibyte character: any byte, except the start of the character
+    return b'(?:[^' + first + b'\0]|' + first + b'(?!' + re.escape(char[1:]) + b'))*'
+
+
+def fuzzy_score(query: str, text: str) -> Optional[int]:
+    """Scores how well the text matches the (folded) query as a subsequence
+
+    The shortest window that contains the query is searched (a forward and a backward pass), and every
+    character of the query matched in it is scored, with bonuses for word boundaries, camelCase and
+    consecutive matches and a penalty for the gaps.
+
+    Args:
+        query (str): The lower case query
+        text (str): The text to score
+
+    Returns:
+        Optional[int]: The score (higher is better), None if the text does not contain the query
+    """
+    if not query:
+        return 0
+    lower = text.lower()
+    # A few characters have a longer lower case (e.g. İ), the positions in the lower case text then do not fit the text
+    if len(lower) != len(text):
+        text = lower
+    # Forward pass: the first position where the whole query is matched
+    qi = 0
+    end = -1
+    for ti, char in enumerate(lower):
+        if char == query[qi]:
+            qi += 1
+            if qi == len(query):
+                end = ti + 1
+                break
+    if end < 0:
+        return None
+    # Backward pass: the last start from which the query still matches, which gives the shortest window
+    qi = len(query) - 1
+    start = 0
+    for ti in range(end - 1, -1, -1):
+        if lower[ti] == query[qi]:
+            qi -= 1
+            if qi < 0:
+                start = ti
+                break
+
+    score = 0
+    qi = 0
+    gap = 0
+    previous_match = False
+    for ti in range(start, end):
+        if qi < len(query) and lower[ti] == query[qi]:
+            bonus = _boundary_bonus(text, ti)
+            if previous_match:
+                bonus = max(bonus, BONUS_CONSECUTIVE)
+            if qi == 0:
+                bonus *= BONUS_FIRST_CHAR_MULTIPLIER
+            score += SCORE_MATCH + bonus
+            qi += 1
+            gap = 0
+            previous_match = True
+        else:
+            score += SCORE_GAP_START if gap == 0 else SCORE_GAP_EXTENSION
+            gap += 1
+            previous_match = False
+    return score
+
+
+def _boundary_bonus(text: str, i: int) -> int:
+    """Returns the bonus for matching the character at position i of the text"""
+    if i == 0 or text[i - 1] in SEPARATORS:
+        return BONUS_BOUNDARY
+    if text[i].isupper() and text[i - 1].islower():
+        return BONUS_CAMEL
+    return 0
+
+
+class FuzzyMatcher:
+    """FuzzyMatcher scores the entries of the index against a fuzzy query.
+
+    The last part of the query (after the last / or \\) is matched against the name of an entry, the
+    parts before it against the path of the directory the entry is in. Matches in the name get a bonus.
+    """
+
+    def __init__(self, query: str):
+        """Initializes the matcher
+
+        Args:
+            query (str): The query
+        """
+        parts = QUERY_SEPARATORS.split(query.lower())
+        self.name_query = parts[-1]
+        self.dir_query = ''.join(parts[:-1])
+        # Finds the candidates in the search buffer, None if every entry is a candidate
+        self.pattern = subsequence_pattern(self.name_query) if self.name_query else None
+
+    def score(self, name: str, dir_path: Callable[[], str]) -> Optional[int]:
+        """Scores an entry
+
+        Args:
+            name (str): The name of the entry
+            dir_path (Callable[[], str]): Returns the path of the directory the entry is in, only called if it is needed
+
+        Returns:
+            Optional[int]: The score (higher is better), None if the entry does not match
+        """
+        score = fuzzy_score(self.name_query, name)
+        if score is None:
+            return None
+        score += BONUS_BASENAME * len(self.name_query)
+        if self.dir_query:
+            dir_score = fuzzy_score(self.dir_query, dir_path())
+            if dir_score is None:
+                return None
+            score += dir_score
+        return score
@@ -0,0 +1,200 @@
+import os
+import re
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+# On windows the file system (and so the patterns) is case insensitive
+CASE_FLAGS = re.IGNORECASE if os.name == 'nt' else 0
+
+# The attribute windows uses to hide files and directories
+FILE_ATTRIBUTE_HIDDEN = 2
+
+
+def glob_pattern(glob: str) -> Tuple[Pattern[str], bool, bool]:
+    """Compiles a gitignore style glob
+
+    A glob without a / (except a trailing one) matches the name at any depth, otherwise it is anchored to the root.
+    * matches anything except /, ** matches any number of directories, ? matches one character and [...] a class.
+    A trailing / only matches directories, a leading ! negates the glob.
+
+    Args:
+        glob (str): The glob, e.g. 'node_modules/', '*.pyc', '/build', 'docs/**/*.tmp'
+
+    Raises:
+        ValueError: If the glob is invalid (e.g. a character class with a reversed range)
+
+    Returns:
+        Tuple[Pattern[str], bool, bool]: The pattern that matches the relative (/ separated) path,
+                                         whether the glob is negated and whether it only matches directories
+    """
+    negated = glob.startswith('!')
+    if negated:
+        glob = glob[1:]
+    dir_only = glob.endswith('/')
+    glob = glob.rstrip('/')
+    anchored = '/' in glob
+    glob = glob.lstrip('/')
+    regex = ''
+    i = 0
+    while i < len(glob):
+        if glob.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif glob.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif glob[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif glob[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif glob[i] == '[' and ']' in glob[i + 2:]:
+            end = glob.index(']', i + 2)
+            content = glob[i + 1:end]
+            if content.startswith('!'):
+                content = '^' + content[1:]
+            regex += f'[{content}]'
+            i = end + 1
+        else:
+            regex += re.escape(glob[i])
+            i += 1
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    try:
+        return re.compile(regex, CASE_FLAGS), negated, dir_only
+    except re.error as e:
+        raise ValueError(f'{glob} is not a valid glob') from e
+
+
+class CrawlRules:
+    """ CrawlRules decide which entries are indexed and which directories are listed.
+
+    The rules are applied while crawling, so the excluded directories are never listed at all. The defaults
+    index everything.
+    """
+
+    def __init__(self, exclude: Iterable[str] = (), include: Iterable[str] = (), hidden: bool = True,
+                 max_depth: Optional[int] = None, one_file_system: bool = False):
+        """Initializes the rules
+
+        Args:
+            exclude (Iterable[str], optional): Gitignore style globs of the files and directories to leave out, the last
+                                               matching glob wins and a glob starting with ! includes the entry again
+            include (Iterable[str], optional): When given, only the files that match one of these globs are indexed
+                                               (directories are always indexed, unless they are excluded)
+            hidden (bool, optional): Set to false to leave out hidden files and directories. Defaults to True
+            max_depth (int, optional): The maximum depth of the entries (1 is directly in the root). Defaults to no maximum
+            one_file_system (bool, optional): Set to true to not list directories on another file system (mount points)
+
+        Raises:
+            ValueError: If one of the globs is invalid, or the max_depth is less than 1
+        """
+        if max_depth is not None and max_depth < 1:
+            raise ValueError('The max_depth should be at least 1')
+        self.exclude = [glob.strip() for glob in exclude if glob.strip()]
+        self.include = [glob.strip() for glob in include if glob.strip()]
+        self.hidden = hidden
+        self.max_depth = max_depth
+        self.one_file_system = one_file_system
+        self._exclude = [glob_pattern(glob) for glob in self.exclude]
+        self._include = [glob_pattern(glob) for glob in self.include]
+        # Most entries match none of the globs, which is checked with a single pattern first
+        self._any_exclude = self._combine(self._exclude)
+        self._negations = any(negated for _, negated, _ in self._exclude)
+
+    @staticmethod
+    def _combine(patterns: List[Tuple[Pattern[str], bool, bool]]) -> Optional[Pattern[str]]:
+        if not patterns:
+            return None
+        return re.compile('|'.join(f'(?:{pattern.pattern})' for pattern, _, _ in patterns), CASE_FLAGS)
+
+    @classmethod
+    def from_dict(cls, rules: Optional[dict]) -> 'CrawlRules':
+        """Creates the rules from their (settings) dict, see as_dict"""
+        rules = rules or {}
+        max_depth = rules.get('max_depth')
+        return cls(rules.get('exclude', ()), rules.get('include', ()), bool(rules.get('hidden', True)),
+                   int(max_depth) if max_depth not in (None, '') else None, bool(rules.get('one_file_system', False)))
+
+    def as_dict(self) -> dict:
+        """Returns the rules as a (json) dict: exclude, include, hidden, max_depth and one_file_system"""
+        return {
+            'exclude': self.exclude,
+            'include': self.include,
+            'hidden': self.hidden,
+            'max_depth': self.max_depth,
+            'one_file_system': self.one_file_system,
+        }
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CrawlRules) and self.as_dict() == other.as_dict()
+
+    def __bool__(self) -> bool:
+        """False when the rules index everything"""
+        return self != CrawlRules()
+
+    def allows(self, rel_path: str, is_dir: bool, hidden: bool = False) -> bool:
+        """Checks if an entry is indexed
+
+        Args:
+            rel_path (str): The path of the entry relative to the root, separated by /
+            is_dir (bool): True if the entry is a directory
+            hidden (bool, optional): True if the file system marks the entry as hidden (see is_hidden)
+
+        Returns:
+            bool: True if the entry is indexed
+        """
+        if not self.hidden and (hidden or rel_path.rpartition('/')[2].startswith('.')):
+            return False
+        if self._any_exclude is not None and self._any_exclude.fullmatch(rel_path):
+            # The last glob that matches decides
+            for pattern, negated, dir_only in reversed(self._exclude):
+                if (is_dir or not dir_only) and pattern.fullmatch(rel_path):
+                    if not negated:
+                        return False
+                    break
+        if is_dir or not self._include:
+            return True
+        return any(pattern.fullmatch(rel_path) for pattern, _, _ in self._include)
+
+    def lists(self, depth: int, dev: int = 0, root_dev: int = 0) -> bool:
+        """Checks if a (indexed) directory is listed
+
+        Args:
+            depth (int): The depth of the directory (0 is the root)
+            dev (int, optional): The device of the directory (st_dev)
+            root_dev (int, optional): The device of the root
+
+        Returns:
+            bool: True if the directory is listed
+        """
+        if self.max_depth is not None and depth >= self.max_depth:
+            return False
+        return not self.one_file_system or dev == root_dev
+
+
+def is_hidden(entry: os.DirEntry) -> bool:
+    """Checks if the file system marks an entry as hidden (on windows), names starting with a dot are checked by the rules"""
+    if os.name != 'nt':
+        return False
+    try:
+        # On windows the stat result of a DirEntry comes with the listing, so this is free
+        return bool(entry.stat(follow_symlinks=False).st_file_attributes & FILE_ATTRIBUTE_HIDDEN)
+    except OSError:
+        return False
+
+
+def device(entry: os.DirEntry) -> int:
+    """Returns the device (st_dev) of an entry, without following symbolic links"""
+    try:
+        if os.name == 'nt':
+            # The stat result of a DirEntry has no device on windows
+            return os.stat(entry.path, follow_symlinks=False).st_dev
+        return entry.stat(follow_symlinks=False).st_dev
+    except OSError:
+        return 0
+
+
+def relative(rel_dir: str, name: str) -> str:
+    """Returns the relative path of a name in a directory (with relative path rel_dir)"""
+    return f'{rel_dir}/{name}' if rel_dir else name
@@ -1,40 +1,206 @@
+import heapq
 import json
+import logging
 import os
-from dataclasses import dataclass
-from typing import Dict, List
+import struct
+import time
+from array import array
+from dataclasses import asdict
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-from utils import getFileType
+from cache import QueryCache
+from index import COMPACT_RATIO, NameIndex, KIND_DIR, KIND_FILE, fold
+from metrics import Metrics
+from patterns import MODES, compile_query
+from ranking import FuzzyMatcher
+from rules import CrawlRules
+from trigram import TrigramIndex
+from utils import getNameType
 import threading
 
-@dataclass
-class SearchResult:
-    """SearchResult is a dataclass that stores an individual search result
+# The content index (sqlite), the crawler, the watcher and the scan workers are imported when they are used, so the
+# read only engine (e.g. of the command line) starts fast
+if TYPE_CHECKING:
+    from content import ContentIndex, ContentIndexer
+    from crawler import CrawlProgress
+    from parallel import ShardedScanner
+
+logger = logging.getLogger(__name__)
+
+class SearchResult(NamedTuple):
+    """SearchResult is a (lightweight) named tuple that stores an individual search result
     Args:
         name (str): The name of the file (excluding the extension)
         path (str): The full path of the file
         file_type (str): The type of the file as specified in utils.FileTypes
+        size (int): The size of a file in bytes when it was indexed (0 for directories)
+        modified (float): The modification time when it was indexed (seconds since the epoch)
     """
     name: str
     path: str
     file_type: str
+    size: int = 0
+    modified: float = 0.0
+
+
+# The number of matches between two checks whether a search was cancelled or ran out of time
+CHECK_EVERY = 1024
+
+# The freshness of an index (see FileSearchEngine.freshness): its saved state is served while it is checked against
+# the file system, or the partial index is served while the root_dir is crawled (there was no saved state)
+VALIDATING = 'validating'
+CRAWLING = 'crawling'
+# Checked (or crawled), the watcher keeps it up to date from then on
+FRESH = 'fresh'
+# The check failed, the saved state is served as it is
+STALE = 'stale'
+# A read only index is never checked
+UNVERIFIED = 'unverified'
+
+# The result fields advanced_search can sort on (besides the score), a leading - sorts descending
+SORT_FIELDS = ('size', 'modified')
+
+
+def sort_order(sort: str) -> Tuple[Optional[str], bool]:
+    """Parses the sort option of advanced_search
+
+    Args:
+        sort (str): 'score' (the default), 'size', 'modified', '-size' or '-modified'
+
+    Raises:
+        ValueError: If the sort option is unknown
+
+    Returns:
+        Tuple[Optional[str], bool]: The result field to sort on (None for the score) and whether it is descending
+    """
+    field = sort.lstrip('-')
+    if field in ('', 'score'):
+        return None, True
+    if field not in SORT_FIELDS:
+        raise ValueError(f'Can not sort on {sort}')
+    return field, sort.startswith('-')
+
+
+def default_save_file(root_dir: str) -> str:
+    """Returns the name of the file the index of root_dir is saved to when no save_file is given"""
+    clear = root_dir.lower().replace(" ", "_").replace("\\", "_").replace("/", "_")
+    return f'{clear}.idx'
+
+
+class QueryRun:
+    """ QueryRun keeps track of the time budget and the cancellation of a single query. """
+
+    def __init__(self, engine: 'FileSearchEngine', index: NameIndex, query_id: Optional[int], budget: float,
+                 checkpoint: Optional[Callable[[], None]] = None):
+        """Initializes the run
+
+        Args:
+            engine (FileSearchEngine): The engine that runs the query
+            index (NameIndex): The index that is searched, the results are created from the same index
+            query_id (int, optional): The id of the query
+            budget (float): The maximum time to spend matching (in seconds)
+            checkpoint (Callable[[], None], optional): Called regularly while searching
+        """
+        self.engine = engine
+        self.index = index
+        self.query_id = query_id
+        self.start = time.perf_counter()
+        self.deadline = self.start + budget
+        self.checkpoint = checkpoint
+        self.complete = True
+        # A newer query could have been started while this one was waiting
+        self.cancelled = engine.is_cancelled(query_id)
+        # The number of ids that passed the guard
+        self.scanned = 0
+        # Filled in by the search (e.g. the number of candidates), see NameIndex.search
+        self.stats: dict = {}
+
+    def guard(self, ids: Iterable[int]) -> Iterator[int]:
+        """Passes the ids on, until the query is cancelled or runs out of time
+
+        Args:
+            ids (Iterable[int]): The ids of the matches
+
+        Yields:
+            int: The same ids
+        """
+        if self.cancelled:
+            return
+        for n, i in enumerate(ids):
+            if n % CHECK_EVERY == CHECK_EVERY - 1:
+                if self.checkpoint is not None:
+                    self.checkpoint()
+                if self.engine.is_cancelled(self.query_id):
+                    self.cancelled = True
+                    return
+                if time.perf_counter() > self.deadline:
+                    self.complete = False
+                    return
+            self.scanned = n + 1
+            yield i
+
+    def page(self, ids: List[int], matched: int) -> dict:
+        """Creates the page of results that is returned to the interface
+
+        Args:
+            ids (List[int]): The ids of the results on the page
+            matched (int): The number of matches that were ranked
+
+        Returns:
+            dict: query_id, results (List[dict]), matched, complete (False if the search ran out of time) and cancelled
+        """
+        return {
+            'query_id': self.query_id,
+            'results': [] if self.cancelled else [self.engine.result(i, self.index)._asdict() for i in ids],
+            'matched': matched,
+            'complete': self.complete,
+            'cancelled': self.cancelled,
+        }
+
+    def finish(self, kind: str, query: str, matched: int) -> None:
+        """Records the query in the metrics of the engine
+
+        Args:
+            kind (str): The search method
+            query (str): The query
+            matched (int): The number of matches
+        """
+        self.engine.metrics.query(kind, query, time.perf_counter() - self.start, matched, self.stats.get('candidates'),
+                                  self.complete, self.cancelled)
 
 
 class FileSearchEngine:
     """ FileSearchengine will index, and allow searching in the root_dir. """
     
-    def __init__(self, root_dir: str, watch_timeout: float = 5.0, save_file: str = ''):
-        """Initializes the FileSearchEngine with the root_path, the watch_timeout and the save_file
+    def __init__(self, root_dir: str, watch_timeout: float = 5.0, save_file: str = '', watch_mode: str = 'events',
+                 crawl_workers: int = 8, cache_bytes: int = 64 * 1024 * 1024, read_only: bool = False,
+                 slow_query_hook: Optional[Callable[[dict], None]] = None, rules: Optional[CrawlRules] = None,
+                 content_index: bool = False, scanner: Optional['ShardedScanner'] = None):
+        """Initializes the FileSearchEngine with the root_path, the watch_timeout and the save_file.
+        The saved index (if there is one) is searchable when this returns, it is checked against the file system
+        (or the root_dir is crawled when there is none) in the background, see revalidate and freshness.
 
         Args:
             root_dir (str): The directory in which all searches should take place.
             watch_timeout (floato, optional): The time to wait between (re)indexing the root_dir (used for the filewatcher). Defaults to 5.0
             save_file? (str, optional): The filename to save the index folder structure to. Defaults to the root_dir
+            watch_mode (str, optional): 'events' applies filesystem events and changed directories to the index,
+                                        'rebuild' recreates the whole index every watch_timeout. Defaults to 'events'
+            crawl_workers (int, optional): The number of threads that list directories when creating the index. Defaults to 8
+            cache_bytes (int, optional): The maximum memory used by the query cache. Defaults to 64MB
+            read_only (bool, optional): Only load the save_file, the index is never created, saved or watched. Defaults to False
+            slow_query_hook (Callable[[dict], None], optional): Called with the record of every slow query, see metrics.Metrics
+            rules (CrawlRules, optional): Decide which entries are indexed (see rules.CrawlRules). Defaults to the rules
+                                          of the save_file when read_only, and to indexing everything otherwise
+            content_index (bool, optional): Set to true to index the content of documents as well (in the background),
+                                            see advanced_search. Defaults to False
+            scanner (ShardedScanner, optional): Scans the index in parallel when a query can not use the trigram index
+                                                (see parallel.ShardedScanner). Defaults to scanning in the calling thread
 
         Raises:
-            FileNotFoundError: If the root_directory specified does not exist
-
-        Todo:
-            * Implement the firlewatcher and have it re-index the root_dir on change.
+            FileNotFoundError: If the root_directory specified does not exist (or the save_file when read_only)
+            ValueError: If read_only and the save_file is not a valid index of the root_dir
         """
 
         # The directory in which all searches happen
@@ -42,125 +208,798 @@ class FileSearchEngine:
             raise FileNotFoundError
         self.root_dir = root_dir
         # The index stores the current folder/file structure
-        self.index = []
+        self.index = NameIndex(root_dir)
+        # Every published index scans with the scanner (if there is one)
+        self.scanner = scanner
+        self.index.scanner = scanner
         # Watch timeout. (min)
         self.timeout = watch_timeout * 60 # Make it minutes
+        self.watch_mode = watch_mode
         self.watcher = None
+        # Guards the changes to the index, they are made from the watcher threads
+        self.lock = threading.RLock()
+        # The generation of the index when it was saved, so unchanged indexes are not saved again
+        self.saved_generation = 0
+        self.crawl_workers = crawl_workers
+        # The progress of the last (or current) crawl
+        self.crawl_progress: Optional['CrawlProgress'] = None
+        # The id of the last query that was started, searches with a lower id are cancelled
+        self.latest_query_id = 0
+        # Caches the matches of recent queries, so typing a longer query only filters them
+        self.cache = QueryCache(cache_bytes)
+        # Timings, counters and histograms of the indexing and the queries
+        self.metrics = Metrics(slow_query_hook=slow_query_hook)
+        self.read_only = read_only
+        # The rules of a loaded index are changed to these (None keeps the rules of the save_file)
+        self.rules = rules
         # Check if a save_file was provided
-        if save_file == '':
-            clear = root_dir.lower().replace(" ", "_").replace("\\", "_").replace("/", "_")
-            self.save_file = f'{clear}.json'
-        else:
-            self.save_file = save_file
+        self.save_file = save_file if save_file != '' else default_save_file(root_dir)
+        # Older versions saved the index as json, it is converted when there is no save_file yet
+        self.legacy_file = f'{os.path.splitext(self.save_file)[0]}.json'
+        # The trigram index is saved next to the save_file
+        self.trigram_file = f'{os.path.splitext(self.save_file)[0]}.tri'
+        # The content of the documents is indexed in a database next to the save_file, when it is enabled
+        self.content_file = f'{os.path.splitext(self.save_file)[0]}.content.db'
+        self.content: Optional['ContentIndex'] = None
+        self.content_indexer: Optional['ContentIndexer'] = None
+
+        # Set when the served index was checked (or crawled) after starting, see revalidate
+        self.fresh = threading.Event()
+        self.freshness = {'state': UNVERIFIED if read_only else VALIDATING, 'checked': None, 'changed': 0}
+        # Set when the watcher is stopped, so the startup does not start it anymore
+        self.stopped = False
 
-        # Check if there is a index file otherwise create one.
-        self.load_or_create_index()
+        if read_only:
+            self.fresh.set()
+            # A missing or stale trigram index is not rebuilt, the queries scan instead
+            self.load_index(rebuild_trigrams=False)
+            # The content index of another process can be searched, if there is one
+            content_path = os.path.join(os.getcwd(), self.content_file)
+            if os.path.isfile(content_path):
+                from content import ContentIndex
+                try:
+                    self.content = ContentIndex(content_path, read_only=True)
+                except FileNotFoundError:
+                    pass
+            return
 
-        # Start the watcher to automatically update the index every timout secconds
-        self.start_watcher()
+        # The saved index is searchable right away, it is checked (or the root_dir is crawled) in the background
+        loaded = self.load_saved_index()
+        if content_index:
+            self.set_content_indexing(True)
+        threading.Thread(target=self.revalidate, args=(loaded,), name=f'revalidate {root_dir}', daemon=True).start()
 
-    def load_or_create_index(self) -> None:
-        """Checks if the index save file exists and if it does loads it, otherwise it will generate a new one and save it"""
+    def load_saved_index(self) -> bool:
+        """Loads the saved index (or the json index of older versions) without checking it against the file system,
+        a missing or stale trigram index is rebuilt later (see revalidate)
 
+        Returns:
+            bool: True if an index was loaded, False if there is none (or it could not be loaded)
+        """
         # Check if the file exists, it is a double check because in load_index we check again.
         # But it is not a costly opperation an it avoids the FileNotFoundError
         if os.path.isfile(os.path.join(os.getcwd(), self.save_file)):
-            self.load_index() # Loads the index if the file exists
-        else:
-            # If the file does not exists create a new one and save it
-            self.create_index()
-            self.save_index()
-    
+            try:
+                self.load_index(rebuild_trigrams=False)
+                return True
+            except ValueError:
+                # The file is corrupt (or of another version), so it is recreated
+                logger.warning('Could not load %s, the index is recreated', self.save_file, exc_info=True)
+        elif os.path.isfile(os.path.join(os.getcwd(), self.legacy_file)):
+            try:
+                self.load_legacy_index()
+                return True
+            except ValueError:
+                pass
+        self.freshness['state'] = CRAWLING
+        return False
 
-    def load_index(self) -> None:
-        """Loads the file index from self.save_file
+    def revalidate(self, loaded: bool) -> None:
+        """Brings the served index up to date, it runs in the background once the engine is created
+
+        A loaded index is checked against the file system: only the directories whose modification time changed
+        are listed again (see watcher.reconcile), and the changes are saved. Without a loaded index the root_dir
+        is crawled, the partial index is searchable meanwhile. Crawl rules that changed in the meantime are
+        applied afterwards, then the watcher is started.
+
+        Args:
+            loaded (bool): True if a saved index was loaded (see load_saved_index)
+        """
+        try:
+            if loaded:
+                with self.metrics.timer('validate'):
+                    if self.index.trigrams is None:
+                        logger.info('The trigram index of %s is missing or stale, it is rebuilt', self.root_dir)
+                        with self.lock:
+                            self.index.build_trigrams()
+                            self.save_trigrams()
+                    changed = self.refresh_index()
+                logger.info('Checked the index of %s, %d directories changed', self.root_dir, changed)
+            else:
+                changed = 0
+                self.create_index()
+                self.freshness['checked'] = time.time()
+                self.save_index()
+        except Exception:
+            logger.exception('Could not bring the index of %s up to date, the saved index is served', self.root_dir)
+            self.freshness['state'] = STALE
+            changed = 0
+        with self.lock:
+            # The saved index could have been crawled with other rules, or the rules changed during the startup
+            if self.rules is not None and self.index.rules != self.rules:
+                self._apply_rules()
+            if self.freshness['state'] != STALE:
+                self.freshness.update(state=FRESH, changed=changed)
+            self.fresh.set()
+            # The content was not updated from the partial (or unchecked) index
+            if self.content_indexer is not None:
+                self.content_indexer.schedule()
+            if not self.stopped:
+                self.start_watcher()
+
+    def wait_until_fresh(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the startup checked (or crawled) the index, see revalidate
+
+        Args:
+            timeout (float, optional): The maximum time to wait (in seconds). Defaults to waiting until it is done
+
+        Returns:
+            bool: True if the startup is done
+        """
+        return self.fresh.wait(timeout)
+
+    def load_index(self, rebuild_trigrams: bool = True) -> None:
+        """Loads the file index from self.save_file, the file is mapped into memory so this is (nearly) instant
+
+        Args:
+            rebuild_trigrams (bool, optional): Set to false to load the index without a trigram index when the saved
+                                               one is missing or stale (the queries then scan). Defaults to True
 
         Raises:
-            FileNotFoundError: If the provided save_file does not exists 
-        """ 
+            FileNotFoundError: If the provided save_file does not exists
+            ValueError: If the save_file is not a valid index of the root_dir
+        """
 
         # Create the full path
         file_path = os.path.join(os.getcwd(), self.save_file)
         # Check if the file exists
         if not os.path.isfile(file_path):
-            raise FileNotFoundError        
-        try:    
+            raise FileNotFoundError
+        with self.metrics.timer('load'):
+            try:
+                index = NameIndex.load(file_path)
+            except (OSError, struct.error) as e:
+                raise ValueError(f'Could not load {file_path}') from e
+            if index.root_dir != self.root_dir:
+                raise ValueError(f'{file_path} is not an index of {self.root_dir}')
+            with self.lock:
+                self.publish(index)
+                self.saved_generation = index.generation
+            self.load_trigrams(rebuild_trigrams)
+        self.metrics.set('index_bytes', os.path.getsize(file_path))
+
+    def load_legacy_index(self) -> None:
+        """Loads the file index from the json file older versions saved (self.legacy_file), without a trigram index
+        (revalidate builds it in the background)
+
+        Raises:
+            ValueError: If the legacy_file could not be loaded
+        """
+        file_path = os.path.join(os.getcwd(), self.legacy_file)
+        try:
             with open(file_path, 'r') as f:
-                self.index = json.load(f)
-        except:
-            self.index = []
+                # The file stores the os.walk output, which is converted to the flat index
+                index = NameIndex.from_walk(self.root_dir, chain.from_iterable(json.load(f)))
+        except (OSError, TypeError, ValueError) as e:
+            raise ValueError(f'Could not load {file_path}') from e
+        self.publish(index)
+
+    def load_trigrams(self, rebuild: bool = True) -> None:
+        """Loads the trigram index from self.trigram_file, it is rebuilt (and saved) if it is missing or stale
+
+        Args:
+            rebuild (bool, optional): Set to false to leave a missing or stale trigram index out. Defaults to True
+        """
+        file_path = os.path.join(os.getcwd(), self.trigram_file)
+        try:
+            if self.index.attach_trigrams(TrigramIndex.load(file_path)):
+                return
+        except (OSError, ValueError):
+            pass
+        if not rebuild:
+            return
+        logger.info('The trigram index of %s is missing or stale, it is rebuilt', self.root_dir)
+        self.index.build_trigrams()
+        self.save_trigrams()
 
 
     def create_index(self) -> None:
-        """Creates the index from the root directory"""
-        # Loop trough everyfile and folder using os.walk and store all the files
-        self.index = [[(root, dirs, files) for root, dirs, files in os.walk(self.root_dir)]]
-    
+        """Creates the index from the root directory.
+        The new index is built on the side, searches keep using the current index until the new one is published."""
+        from crawler import Crawler
+        crawler = Crawler(self.root_dir, workers=self.crawl_workers, progress=self.set_crawl_progress,
+                          rules=self.rules if self.rules is not None else self.index.rules)
+        # When there is nothing to search yet, the partial index can already be searched while crawling
+        if len(self.index) <= 1:
+            self.publish(crawler.index)
+        with self.metrics.timer('crawl'):
+            index = crawler.run()
+        with self.metrics.timer('build_trigrams'):
+            index.build_trigrams()
+        self.publish(index)
+        seconds = self.metrics.gauges['crawl_seconds']
+        self.metrics.incr('crawls')
+        self.metrics.set('crawl_entries', len(index))
+        self.metrics.set('crawl_entries_per_second', len(index) / seconds if seconds else 0.0)
+        logger.info('Indexed %d entries of %s in %.2fs', len(index), self.root_dir, seconds)
+
+    def publish(self, index: NameIndex) -> None:
+        """Replaces the index. Searches that already started keep the index they started with (they pin it),
+        so they are never affected; the changes of the watcher are made to the published index only.
+
+        Args:
+            index (NameIndex): The new index
+        """
+        with self.lock:
+            index.scanner = self.scanner
+            if self.scanner is not None and index is not self.index:
+                self.scanner.release(self.index.uid)
+            self.index = index
+
+    def set_scanner(self, scanner: Optional['ShardedScanner']) -> None:
+        """Changes the scanner of the index, None scans in the calling thread (see parallel.ShardedScanner)"""
+        with self.lock:
+            self.scanner = scanner
+            self.index.scanner = scanner
+
+    def set_rules(self, rules: CrawlRules) -> None:
+        """Changes the crawl rules, the index is updated (and saved) without crawling the root_dir again:
+        only the directories the old rules pruned are listed again (see watcher.apply_rules)
+
+        Args:
+            rules (CrawlRules): The new rules
+        """
+        self.rules = rules
+        if self.read_only:
+            return
+        with self.lock:
+            # Until the startup is done the index can still be crawled, revalidate applies the rules afterwards
+            if self.fresh.is_set():
+                self._apply_rules()
+
+    def _apply_rules(self) -> None:
+        """Applies self.rules to the index and saves it, see set_rules"""
+        from watcher import apply_rules
+        with self.lock, self.metrics.timer('apply_rules'):
+            changed = apply_rules(self.index, self.rules)
+            self.index.freeze()
+            self.save_index()
+        logger.info('Applied the crawl rules to %s, %d directories changed', self.root_dir, changed)
+
+    def set_content_indexing(self, enabled: bool) -> None:
+        """Starts or stops indexing the content of the documents. The content is extracted in the background, in
+        other processes, and the content index is brought up to date every time the index is saved.
+
+        Args:
+            enabled (bool): True to index the content
+        """
+        if self.read_only or enabled == (self.content_indexer is not None):
+            return
+        if not enabled:
+            self.content_indexer.stop()
+            self.content_indexer = None
+            self.content = None
+            return
+        from content import ContentIndex, ContentIndexer
+        self.content = ContentIndex(os.path.join(os.getcwd(), self.content_file))
+        self.content_indexer = ContentIndexer(self.content, self.content_candidates)
+        # During the startup the index can still be crawled, revalidate schedules the indexer when it is done
+        if self.fresh.is_set():
+            self.content_indexer.schedule()
+
+    def content_candidates(self) -> Dict[str, Tuple[int, float, int]]:
+        """Returns the files of the current index whose content can be indexed, see content.candidates"""
+        from content import candidates
+        with self.lock:
+            return candidates(self.index)
+
+    def set_crawl_progress(self, progress: 'CrawlProgress') -> None:
+        """Stores the progress of the crawl, it is called by the crawler"""
+        self.crawl_progress = progress
 
     def save_index(self) -> None:
         """Saves the current index to the save_file in the current working directory"""
+        if self.read_only:
+            return
         # Create the full path
-        file_path = os.path.join(os.getcwd(), self.save_file) 
-        try:    
-            with open(file_path, 'w') as f:
-                json.dump(self.index, f, indent=4)
-        except:
-            #TODO:Implement loggin.
-            pass
+        file_path = os.path.join(os.getcwd(), self.save_file)
+        # The index can not change (or be replaced) while it is written
+        with self.lock:
+            self.compact_index()
+            self.saved_generation = self.index.generation
+            try:
+                with self.metrics.timer('save'):
+                    self.index.save(file_path)
+                self.metrics.incr('saves')
+                self.metrics.set('index_bytes', os.path.getsize(file_path))
+            except OSError:
+                self.metrics.incr('save_errors')
+                logger.exception('Could not save the index to %s', file_path)
+            self.save_trigrams()
+        # The files changed, so the content index could be behind
+        if self.content_indexer is not None:
+            self.content_indexer.schedule()
+
+    def compact_index(self) -> bool:
+        """Replaces the index with a compacted copy (see NameIndex.compact) when too many of its entries are removed,
+        the caller should hold the lock
+
+        Returns:
+            bool: True if the index was compacted
+        """
+        index = self.index
+        if index.removed <= COMPACT_RATIO * len(index):
+            return False
+        with self.metrics.timer('compact'):
+            compacted, remap = index.compact()
+            # The compacted index has its own uid, so the cached queries (and the shared memory copies of the search
+            # buffer) of the old index are dropped. The trigram index was rebuilt with the new ids
+            self.publish(compacted)
+            # The content index refers to the files by their id, the files that were removed are dropped when the
+            # content indexer runs (it is scheduled when the index is saved)
+            if self.content is not None:
+                self.content.move((doc, remap[entry]) for doc, entry, _, _ in self.content.docs().values()
+                                  if entry < len(remap) and remap[entry] not in (-1, entry))
+        self.metrics.incr('compactions')
+        logger.info('Compacted the index of %s, %d removed entries were dropped', self.root_dir, index.removed)
+        return True
+
+    def save_trigrams(self) -> None:
+        """Saves the trigram index to the trigram_file in the current working directory"""
+        if self.index.trigrams is None or self.read_only:
+            return
+        file_path = os.path.join(os.getcwd(), self.trigram_file)
+        with self.lock:
+            try:
+                self.index.trigrams.save(file_path)
+                self.metrics.set('trigram_bytes', os.path.getsize(file_path))
+            except OSError:
+                self.metrics.incr('save_errors')
+                logger.exception('Could not save the trigram index to %s', file_path)
 
     def create_and_save_index(self) -> None:
-        print('Creating and saving')
+        """Recreates the index and saves it, the crawl does not hold the lock so searches and saves are not blocked"""
+        logger.info('Recreating the index of %s', self.root_dir)
         self.create_index()
         self.save_index()
 
-    def simple_search(self, query: str, ret_dic: bool = False) -> List[dict] :
+    def refresh_index(self) -> int:
+        """Lists the directories that changed since they were listed and saves the index if anything changed
+
+        Returns:
+            int: The number of directories that changed
+        """
+        from watcher import reconcile
+        with self.lock, self.metrics.timer('refresh'):
+            changed = reconcile(self.index)
+            self.metrics.incr('refreshes')
+            self.freshness['checked'] = time.time()
+            if self.index.generation != self.saved_generation:
+                self.index.freeze()
+                self.save_index()
+        return changed
+
+    def simple_search(self, query: str, ret_dic: bool = False, mode: str = 'substring') -> List[dict] :
         """Does a 'simple' search for the provided query in the root directory. 
         Simple in this case means that all the files and directories are matched against the query, there is no filtering or anything.
 
         Args:
             query (str): The query to search for
             ret_dic (bool, optional): Set to true if you want the return to be List[dict] instead of List[SearchResult]
+            mode (str, optional): 'substring', 'glob' or 'regex', see search(). Defaults to 'substring'
+
+        Raises:
+            ValueError: If the mode is unknown or the query is not a valid glob or regular expression
 
         Returns:
             List[SearchResult]: The results of the search
         """
-        results: List[SearchResult] = []
-
-        # Loop through everyitem in the index
-        for item in self.index:
-            # The index is generated with os.walk, so every item will have path, dirs and files in a tuple
-            for path, dirs, files  in item:    
-                # Loop trough the files and check if any of them match
-                for file in files:    
-                    # We use lower case here because it is a simple search, the aim is to quickly find matching files
-                    if query.lower() in file.lower():
-                        # If there is a match extract the needed data 
-                        name, ext = os.path.splitext(file)
-                        path = os.path.join(path, file)
-                        file_type = getFileType(path)
-                        # Create a searchresult and add it to the results list
-                        res = SearchResult(name=name, path=path, file_type=file_type)
-                        if ret_dic:
-                            res = res.__dict__
-                        results.append(res)
-                # Loop trough the directories and check if any of them match
-                for direc in dirs:
-                    if query.lower() in direc.lower():
-                        name = direc
-                        path = os.path.join(path, direc)
-                        file_type = getFileType(path)
-                        res = SearchResult(name=name, path=path, file_type=file_type)
-                        if ret_dic:
-                            res = res.__dict__
-                        results.append(res)
+        # Pin the index, it could be replaced while searching
+        index = self.index
+        start = time.perf_counter()
+        stats = {}
+        results = [self.result(i, index) for i in self.matching_ids(query, index, stats, mode)]
+        self.metrics.query('simple_search', query, time.perf_counter() - start, len(results), stats.get('candidates'))
+        if ret_dic:
+            # Convert the results once, so they can be send to the interface
+            return [res._asdict() for res in results]
         return results
 
-    def advanced_search(self, query: str, opts: dict):
-        raise NotImplementedError
+    def iter_search(self, query: str, limit: Optional[int] = None, offset: int = 0,
+                    query_id: Optional[int] = None, opts: Optional[dict] = None) -> Iterator[SearchResult]:
+        """Searches like simple_search, but yields the results (in index order) as they are found
+
+        Args:
+            query (str): The query to search for
+            limit (int, optional): The maximum number of results. Defaults to no limit
+            offset (int, optional): The number of results to skip. Defaults to 0
+            query_id (int, optional): The id of the query, the search stops when a query with a higher id is started
+            opts (dict, optional): The types, extensions and path filters of advanced_search, and the mode of search()
+                                   ('substring', 'glob' or 'regex'). Defaults to a substring search without filters
+
+        Yields:
+            SearchResult: The results of the search
+        """
+        self.start_query(query_id)
+        # Pin the index, it could be replaced while the results are consumed
+        index = self.index
+        matches = self.matching_ids(query, index, mode=(opts or {}).get('mode') or 'substring')
+        accept = self.entry_filter(index, opts) if opts else None
+        if accept is not None:
+            names = index.names
+            matches = (i for i in matches if accept(i, names[i]))
+        matches = islice(matches, offset, None if limit is None else offset + limit)
+        for n, i in enumerate(matches):
+            if n % CHECK_EVERY == 0 and self.is_cancelled(query_id):
+                return
+            yield self.result(i, index)
+
+    def search(self, query: str, limit: int = 50, offset: int = 0, query_id: Optional[int] = None,
+               budget: float = 0.25, checkpoint: Optional[Callable[[], None]] = None, mode: str = 'substring') -> dict:
+        """Searches for the query and returns one page of the results, ranked the same way as utils.sortByFolder.
+        Only the best offset + limit matches are kept (a top-k selection instead of sorting everything), and the
+        search stops when it runs out of time, so the latency is bounded no matter how many entries match.
+
+        Args:
+            query (str): The query to search for
+            limit (int, optional): The number of results on the page. Defaults to 50
+            offset (int, optional): The number of (ranked) results before the page. Defaults to 0
+            query_id (int, optional): The id of the query, the search stops when a query with a higher id is started
+            budget (float, optional): The maximum time to spend matching (in seconds). Defaults to 0.25
+            checkpoint (Callable[[], None], optional): Called regularly while searching, e.g. to let other requests run
+            mode (str, optional): How the query matches a name: 'substring' (case insensitive), 'glob' (the whole name,
+                                  e.g. *.pdf) or 'regex' (a case insensitive regular expression that is searched for
+                                  in the name). Defaults to 'substring'
+
+        Raises:
+            ValueError: If the mode is unknown or the query is not a valid glob or regular expression
+
+        Returns:
+            dict: query_id, results (List[dict]), matched (the number of matches that were ranked),
+                  complete (False if the search ran out of time) and cancelled
+        """
+        self.start_query(query_id)
+        index = self.index
+        names, kinds = index.names, index.kinds
+        run = QueryRun(self, index, query_id, budget, checkpoint)
+        matches = self.matching_ids(query, index, run.stats, mode, run.guard)
+        matched = 0
+
+        def ranked():
+            nonlocal matched
+            # Rank on the file type (like sortByFolder), and keep the index order within a type
+            for n, i in enumerate(matches):
+                matched = n + 1
+                yield getNameType(names[i], kinds[i] == KIND_DIR), n, i
+
+        best = heapq.nsmallest(offset + limit, ranked())
+        page = run.page([i for _, _, i in best[offset:]], matched)
+        run.finish('search', query, matched)
+        return page
+
+    def advanced_search(self, query: str, opts: dict) -> dict:
+        """Does a fuzzy search for the query, with filters, and returns one page of the results ranked on their score.
+
+        The query matches when its characters occur in the name in order (e.g. 'rprt' matches 'report.pdf'), and the
+        matches are scored like fzf: word boundaries, camelCase and consecutive characters are rewarded, gaps are not.
+        When the query contains a / or \\ the part before it is matched against the directories of the entry.
+        The candidates are found with one regular expression scan over the search buffer, and the filters are checked
+        against the index columns before anything is scored.
+
+        Args:
+            query (str): The query to search for
+            opts (dict): The options of the search, all of them are optional:
+                types (List[str]): Only return these file types (values of utils.fileTypeNames)
+                extensions (List[str]): Only return files with these extensions (e.g. ['.pdf', '.docx'])
+                path (str): Only return entries in this directory (absolute or relative to the root_dir)
+                mode (str): 'fuzzy', or one of the modes of search(): 'substring', 'glob' or 'regex'. Defaults to 'fuzzy'
+                fuzzy (bool): Set to false to match the query as a substring instead (the same as the substring mode)
+                min_size, max_size (int): Only return files with a size (in bytes) in this range
+                modified_after, modified_before (float): Only return entries modified in this range (seconds since the epoch)
+                sort (str): 'score' (the best match first), 'size', 'modified' (the smallest/oldest first),
+                            '-size' or '-modified' (the largest/newest first). Defaults to 'score'
+                content (bool): Also return the documents that contain the words of the query, when the content is
+                                indexed (see set_content_indexing), not in the glob and regex modes. Defaults to False
+                limit, offset, query_id, budget: See search()
+
+        Raises:
+            ValueError: If the sort option or the mode is unknown, or the query is not a valid glob or regular expression
+
+        Returns:
+            dict: The page of results (see search), every result has a score as well. With the content option every
+                  result has a match key as well: 'name' (the content can add to the score) or 'content' (only the
+                  content matched, these come after the name matches)
+        """
+        limit = int(opts.get('limit', 50))
+        offset = int(opts.get('offset', 0))
+        query_id = opts.get('query_id')
+        field, descending = sort_order(opts.get('sort') or 'score')
+        mode = opts.get('mode') or ('fuzzy' if opts.get('fuzzy', True) else 'substring')
+        if mode != 'fuzzy' and mode not in MODES:
+            raise ValueError(f'Unknown mode {mode}, use fuzzy, {", ".join(MODES)}')
+        self.start_query(query_id)
+        index = self.index
+        names = index.names
+        # The column that is sorted on (instead of the score), descending values are negated so the largest key wins
+        column = {'size': index.sizes, 'modified': index.mtimes}.get(field)
+        sign = 1 if descending else -1
+        run = QueryRun(self, index, query_id, float(opts.get('budget', 0.25)), opts.get('checkpoint'))
+
+        # The other modes only match, every match gets the same score
+        matcher = FuzzyMatcher(query if mode == 'fuzzy' else '')
+        if mode != 'fuzzy':
+            # Guarded before the pattern is checked, so the rejected candidates count against the budget as well
+            candidates = self.matching_ids(query, index, run.stats, mode, run.guard)
+        elif matcher.pattern is not None:
+            candidates = run.guard(index.match(matcher.pattern))
+        else:
+            candidates = run.guard(index.search(''))
+        accept = self.entry_filter(index, opts)
+        # The content matches only cost a lookup in the content index, they add to the score of the name matches
+        content = self.content
+        with_content = opts.get('content') and content is not None and mode in ('fuzzy', 'substring')
+        hits = content.search(query, index) if with_content else {}
+        # The entries that only matched on their content
+        content_only = set()
+
+        matched = 0
+
+        def scored():
+            nonlocal matched
+            n = -1
+            for n, i in enumerate(candidates):
+                # Names of a mapped index are decoded on access, so only do it once
+                name = names[i]
+                if accept is not None and not accept(i, name):
+                    continue
+                score = matcher.score(name, lambda: index.path(index.parents[i]))
+                if score is None:
+                    continue
+                score += hits.pop(i, 0)
+                matched += 1
+                # Higher scores first (or the sort column), then shorter names, then the index order
+                key = (1, score) if column is None else sign * column[i]
+                yield key, score, -len(name), -n, i
+            # The documents that only match on their content, they come after the name matches
+            for n, (i, score) in enumerate(list(hits.items()), n + 1):
+                name = names[i]
+                if accept is not None and not accept(i, name):
+                    continue
+                matched += 1
+                content_only.add(i)
+                key = (0, score) if column is None else sign * column[i]
+                yield key, score, -len(name), -n, i
+
+        best = heapq.nlargest(offset + limit, scored())
+        page = run.page([i for _, _, _, _, i in best[offset:]], matched)
+        for res, (_, score, _, _, i) in zip(page['results'], best[offset:]):
+            res['score'] = score
+            if opts.get('content'):
+                res['match'] = 'content' if i in content_only else 'name'
+        # Every candidate that passed the guard was checked against the filters and scored
+        run.stats.setdefault('candidates', run.scanned)
+        run.finish('advanced_search', query, matched)
+        return page
+
+    def entry_filter(self, index: NameIndex, opts: dict) -> Optional[Callable[[int, str], bool]]:
+        """Creates the filter for the types, extensions, path, size and modified options of advanced_search
+
+        Args:
+            index (NameIndex): The index the filter is used on
+            opts (dict): The options of the search
+
+        Returns:
+            Optional[Callable[[int, str], bool]]: Returns True for the (id, name) of the entries that pass,
+                                                  None if there is nothing to filter
+        """
+        kinds, parents, sizes, mtimes = index.kinds, index.parents, index.sizes, index.mtimes
+        checks: List[Callable[[int, str], bool]] = []
+        # The range checks only compare numbers in the columns, so they go first
+        if opts.get('min_size') is not None or opts.get('max_size') is not None:
+            min_size = int(opts.get('min_size') or 0)
+            max_size = int(opts['max_size']) if opts.get('max_size') is not None else float('inf')
+            checks.append(lambda i, name: kinds[i] == KIND_FILE and min_size <= sizes[i] <= max_size)
+        if opts.get('modified_after') is not None or opts.get('modified_before') is not None:
+            after = float(opts.get('modified_after') or float('-inf'))
+            before = float(opts['modified_before']) if opts.get('modified_before') is not None else float('inf')
+            checks.append(lambda i, name: after <= mtimes[i] <= before)
+        if opts.get('extensions'):
+            extensions = tuple(ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in opts['extensions'])
+            checks.append(lambda i, name: kinds[i] != KIND_DIR and name.lower().endswith(extensions))
+        if opts.get('types'):
+            types = frozenset(opts['types'])
+            checks.append(lambda i, name: getNameType(name, kinds[i] == KIND_DIR) in types)
+        if opts.get('path'):
+            # Normalized, so e.g. projects/, ./projects and projects are the same directory
+            prefix = os.path.normcase(os.path.normpath(os.path.join(self.root_dir, opts['path'])))
+            # Remember for every directory whether it is in the path
+            inside: Dict[int, bool] = {}
+
+            def in_path(i: int, name: str) -> bool:
+                parent = parents[i]
+                if parent not in inside:
+                    dir_path = os.path.normcase(os.path.normpath(index.path(parent)))
+                    inside[parent] = dir_path == prefix or dir_path.startswith(os.path.join(prefix, ''))
+                return inside[parent]
+            checks.append(in_path)
+        if len(checks) <= 1:
+            return checks[0] if checks else None
+
+        def accept(i: int, name: str) -> bool:
+            for check in checks:
+                if not check(i, name):
+                    return False
+            return True
+        return accept
+
+    def matching_ids(self, query: str, index: Optional[NameIndex] = None, stats: Optional[dict] = None,
+                     mode: str = 'substring', guard: Optional[Callable[[Iterable[int]], Iterator[int]]] = None
+                     ) -> Iterator[int]:
+        """Searches the index for the query, using the query cache
+
+        When the matches of the query are cached they are returned directly, when the matches of a shorter query
+        that the query contains are cached only those are checked. The matches are cached when they are all consumed.
+
+        A glob or regex query is compiled once (see patterns.QueryPattern), the candidates are the (cached) substring
+        matches of its longest literal fragment and only those are checked against the full pattern. A pattern
+        without any literal fragments (e.g. *) is checked against every entry.
+
+        Args:
+            query (str): The query to search for
+            index (NameIndex, optional): The index to search. Defaults to the current index
+            stats (dict, optional): Receives the number of candidates that were checked, see NameIndex.search
+            mode (str, optional): 'substring', 'glob' or 'regex', see search(). Defaults to 'substring'
+            guard (Callable[[Iterable[int]], Iterator[int]], optional): Wraps the candidates before they are checked
+                                                                        against the pattern (e.g. QueryRun.guard), so
+                                                                        the rejected candidates are guarded as well
+
+        Raises:
+            ValueError: If the mode is unknown or the query is not a valid glob or regular expression
+
+        Returns:
+            Iterator[int]: The ids of the matching entries
+        """
+        index = index if index is not None else self.index
+        if mode == 'substring':
+            ids = self.cached_ids(query, index, stats)
+            return guard(ids) if guard is not None else ids
+        # Compiled before searching, so an invalid pattern raises right away
+        pattern = compile_query(query, mode)
+        names = index.names
+        literal = pattern.literals[0] if pattern.literals else ''
+        candidates = self.cached_ids(literal, index, stats)
+        if guard is not None:
+            candidates = guard(candidates)
+        return (i for i in candidates if pattern.matches(names[i]))
+
+    def cached_ids(self, query: str, index: NameIndex, stats: Optional[dict] = None) -> Iterator[int]:
+        """Searches the index for the (substring) query, using the query cache, see matching_ids"""
+        needle = fold(query)
+        # Everything matches the empty query, there is no need to cache it
+        if not needle:
+            yield from index.search(query, stats=stats)
+            return
+        state = index.state
+        ids, exact = self.cache.lookup(needle, state)
+        if exact:
+            if stats is not None:
+                stats['candidates'] = 0
+            yield from ids
+            return
+        matches = array('I')
+        for i in index.search(query, ids, stats):
+            matches.append(i)
+            yield i
+        # Only reached when every match was consumed
+        self.cache.store(needle, matches, state)
+
+    def start_query(self, query_id: Optional[int]) -> None:
+        """Registers a new query, which cancels the searches of the queries with a lower id.
+        An id below the latest one starts a new sequence (e.g. the interface was reloaded and counts from 1 again),
+        it is not an old query
+
+        Args:
+            query_id (int, optional): The id of the query, queries without an id are never cancelled
+        """
+        if query_id is not None:
+            self.latest_query_id = query_id
+
+    def is_cancelled(self, query_id: Optional[int]) -> bool:
+        """Checks if a newer query was started (see start_query)
+
+        Args:
+            query_id (int, optional): The id of the query
+
+        Returns:
+            bool: True if the search for the query should stop
+        """
+        return query_id is not None and query_id < self.latest_query_id
+
+    def result(self, i: int, index: Optional[NameIndex] = None) -> SearchResult:
+        """Creates the SearchResult of an entry in the index, everything needed is in the index so the filesystem is not accessed
+
+        Args:
+            i (int): The id of the entry
+            index (NameIndex, optional): The index the id belongs to. Defaults to the current index
+
+        Returns:
+            SearchResult: The search result
+        """
+        index = index if index is not None else self.index
+        full_name = index.names[i]
+        path = index.path(i)
+        is_dir = index.kinds[i] == KIND_DIR
+        # The name of a file excludes the extension, directories keep their full name
+        name = full_name if is_dir else os.path.splitext(full_name)[0]
+        return SearchResult(name=name, path=path, file_type=getNameType(full_name, is_dir), size=index.sizes[i],
+                            modified=index.mtimes[i])
+
+    def stats(self) -> dict:
+        """Returns the health of the index and the metrics of the engine
+
+        Returns:
+            dict: root_dir, entries (without the removed ones), generation, saved (False if there are unsaved changes), save_file, rules, watch_mode,
+                  freshness (state: validating, crawling, fresh, stale or unverified, checked: the last time the index
+                  was checked against the file system, changed: the directories the startup check changed),
+                  crawl_progress, cache (see QueryCache.stats), scan_workers (0 when the index is scanned in the calling thread),
+                  content (see ContentIndexer.stats, None when the content is not indexed) and metrics (see Metrics.snapshot)
+        """
+        index = self.index
+        return {
+            'root_dir': self.root_dir,
+            'entries': len(index) - index.removed,
+            'generation': index.generation,
+            'saved': index.generation == self.saved_generation,
+            'save_file': self.save_file,
+            'rules': index.rules.as_dict(),
+            'watch_mode': self.watch_mode if self.watcher is not None else None,
+            'freshness': dict(self.freshness),
+            'crawl_progress': asdict(self.crawl_progress) if self.crawl_progress is not None else None,
+            'cache': self.cache.stats(),
+            'scan_workers': self.scanner.workers if self.scanner is not None else 0,
+            'content': self.content_indexer.stats() if self.content_indexer is not None else None,
+            'metrics': self.metrics.snapshot(),
+        }
 
     def start_watcher(self):
-       self.watcher = threading.Timer(self.timeout, lambda: self.create_and_save_index())
-       self.watcher.start()
-    
+        """Starts keeping the index up to date, how depends on the watch_mode"""
+        with self.lock:
+            self.stopped = False
+            # During the startup the watcher is started when the index is fresh (see revalidate)
+            if not self.fresh.is_set():
+                return
+            if self.watch_mode == 'rebuild':
+                self.watcher = threading.Timer(self.timeout, lambda: self.rebuild_and_rearm())
+                self.watcher.daemon = True
+                self.watcher.start()
+            else:
+                from watcher import IndexWatcher
+                self.watcher = IndexWatcher(self, self.timeout)
+                self.watcher.start()
+
+    def rebuild_and_rearm(self):
+        """Recreates the index and schedules the next rebuild (used in the 'rebuild' watch_mode)"""
+        self.create_and_save_index()
+        # The watcher is None when it was stopped during the rebuild
+        if self.watcher is not None:
+            self.start_watcher()
+
     def stop_watcher(self):
-        self.watcher.cancel()
+        with self.lock:
+            self.stopped = True
+        # The rebuild timer of the 'rebuild' watch_mode, or the IndexWatcher
+        if isinstance(self.watcher, threading.Timer):
+            self.watcher.cancel()
+        elif self.watcher is not None:
+            self.watcher.stop()
+        self.watcher = None
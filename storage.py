@@ -0,0 +1,180 @@
+import mmap
+import os
+import sys
+import tempfile
+import time
+from array import array
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Union
+
+# All the numbers in the index files are little endian
+NATIVE = sys.byteorder == 'little'
+
+# Sections in the index files start at a multiple of this, so the arrays are aligned
+ALIGNMENT = 8
+
+# Sections that are mapped on their own have to start at a multiple of the allocation granularity (64KB on windows)
+SECTION_ALIGNMENT = 65536
+
+# Every array type that can be written or viewed
+ArrayLike = Union[array, memoryview]
+
+
+@contextmanager
+def atomic_write(file_path: str) -> Iterator[BinaryIO]:
+    """Opens a temporary file next to file_path for writing, and replaces file_path with it when the block succeeds.
+    A crash while writing therefore never leaves a torn file behind.
+
+    Args:
+        file_path (str): The file to (over)write
+
+    Yields:
+        BinaryIO: The temporary file to write to
+    """
+    # Every write gets its own temporary file, so two threads saving the same file never write into each other
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{os.path.basename(file_path)}.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with open(fd, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    sync_dir(os.path.dirname(os.path.abspath(file_path)))
+
+
+def sync_dir(dir_path: str) -> None:
+    """Flushes a directory to disk, so a file that was replaced in it survives a crash.
+    Directories can not be opened on windows, where the replace is durable without it.
+
+    Args:
+        dir_path (str): The directory to flush
+    """
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def replace(src: str, dest: str, attempts: int = 10) -> None:
+    """Replaces dest with src.
+    On windows a file can not be replaced while it is (still) mapped, so it is retried for a short while.
+
+    Args:
+        src (str): The file to move
+        dest (str): The file to replace
+        attempts (int, optional): The number of attempts. Defaults to 10
+    """
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dest)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def map_file(file_path: str) -> memoryview:
+    """Maps a file (read only) into memory
+
+    Args:
+        file_path (str): The file to map
+
+    Returns:
+        memoryview: A view of the mapped file, the file is unmapped when nothing refers to it anymore
+    """
+    with open(file_path, 'rb') as f:
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def map_section(file_path: str, offset: int, length: int) -> mmap.mmap:
+    """Maps a part of a file (read only) into memory, positions in the map are relative to the start of the part
+
+    Args:
+        file_path (str): The file to map
+        offset (int): The start of the part, it has to be a multiple of SECTION_ALIGNMENT
+        length (int): The size of the part
+
+    Returns:
+        mmap.mmap: The mapped part of the file
+    """
+    with open(file_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+
+
+def view_array(view: memoryview, typecode: str, offset: int, count: int) -> ArrayLike:
+    """Returns an array stored in a mapped file, without copying it if possible
+
+    Args:
+        view (memoryview): The mapped file
+        typecode (str): The type of the items (as used by array)
+        offset (int): The position of the array in the file
+        count (int): The number of items in the array
+
+    Raises:
+        ValueError: If the file is truncated
+
+    Returns:
+        ArrayLike: The array, which is a view of the file on little endian machines
+    """
+    size = array(typecode).itemsize * count
+    if offset + size > len(view):
+        raise ValueError('The file is truncated')
+    section = view[offset:offset + size]
+    if NATIVE:
+        return section.cast(typecode)
+    copy = array(typecode, section.tobytes())
+    copy.byteswap()
+    return copy
+
+
+def write_array(f: BinaryIO, arr: ArrayLike) -> None:
+    """Writes an array (little endian) and pads the file to the next section
+
+    Args:
+        f (BinaryIO): The file to write to
+        arr (ArrayLike): The array to write
+    """
+    if NATIVE:
+        f.write(memoryview(arr).tobytes())
+    else:
+        swapped = array(memoryview(arr).format, arr)
+        swapped.byteswap()
+        f.write(swapped.tobytes())
+    pad(f)
+
+
+def to_array(arr: ArrayLike, typecode: str) -> array:
+    """Returns a (writable) copy of an array, used for arrays that are viewed from a mapped file
+
+    Args:
+        arr (ArrayLike): The array to copy
+        typecode (str): The type of the items
+
+    Returns:
+        array: The copy
+    """
+    copy = array(typecode)
+    copy.frombytes(memoryview(arr).cast('B'))
+    return copy
+
+
+def pad(f: BinaryIO, alignment: int = ALIGNMENT) -> None:
+    """Pads the file with zeros up to the next section"""
+    f.write(b'\0' * (-f.tell() % alignment))
+
+
+def aligned(offset: int, alignment: int = ALIGNMENT) -> int:
+    """Returns the start of the section at (or after) offset"""
+    return offset + (-offset % alignment)
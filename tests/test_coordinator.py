@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from coordinator import SearchCoordinator
+
+
+@pytest.fixture
+def roots(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for name in ('one', 'two', 'three'):
+        root = tmp_path / name
+        root.mkdir()
+        (root / f'{name}.txt').write_text('')
+        paths.append(str(root))
+    yield paths
+    # The removed engines are still checked in the background, their save files go to tmp_path as well
+    for thread in threading.enumerate():
+        if thread.name.startswith('revalidate '):
+            thread.join()
+
+
+def test_set_roots_adds_and_removes(roots):
+    coordinator = SearchCoordinator(roots[:2])
+    try:
+        engine = coordinator.engines[roots[0]]
+        coordinator.set_roots(roots[::2])
+        assert coordinator.roots == [roots[0], roots[2]]
+        # The kept root is not indexed again
+        assert coordinator.engines[roots[0]] is engine
+    finally:
+        coordinator.close()
+
+
+def test_set_roots_missing_root_changes_nothing(roots, tmp_path):
+    coordinator = SearchCoordinator(roots[:2])
+    try:
+        with pytest.raises(FileNotFoundError):
+            coordinator.set_roots([roots[2], str(tmp_path / 'missing')])
+        assert coordinator.roots == roots[:2]
+        with pytest.raises(ValueError):
+            coordinator.set_roots([{'path': roots[2], 'search_timeout': 'often'}])
+        assert coordinator.roots == roots[:2]
+    finally:
+        coordinator.close()
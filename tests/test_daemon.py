@@ -0,0 +1,88 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from daemon import RemoteSearchEngine, serve
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / 'report.txt').write_text('')
+    monkeypatch.chdir(tmp_path)
+    ready = threading.Event()
+    servers = []
+
+    def started(server):
+        servers.append(server)
+        ready.set()
+
+    threading.Thread(target=serve, args=([str(root)],), kwargs={'port': 0, 'ready': started}, daemon=True).start()
+    assert ready.wait(10)
+    server = servers[0]
+    for engine in server.coordinator.engines.values():
+        engine.wait_until_fresh()
+    yield server
+    server.shutdown()
+    server.coordinator.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=10)
+    headers = {'Content-Type': 'application/json', **(headers or {})}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def test_search(server):
+    remote = RemoteSearchEngine(f'http://127.0.0.1:{server.server_port}')
+    assert remote.search('report')['matched'] == 1
+    assert remote.advanced_search('rprt', {})['matched'] == 1
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('GET', '/search?q=report&query_id=abc', None),
+    ('GET', '/search?q=report&limit=many', None),
+    ('POST', '/advanced_search', b'[1, 2]'),
+    ('POST', '/advanced_search', b'{"query": "x", "opts": []}'),
+    ('POST', '/advanced_search', b'{"query": "x", "opts": {"limit": "many"}}'),
+    ('POST', '/reindex', b'{"root": 5}'),
+    ('POST', '/roots', b'{"watch_timeout": "often"}'),
+    ('POST', '/roots', b'{"roots": [{"no_path": 1}]}'),
+    ('POST', '/roots', b'{"roots": ["/does/not/exist"]}'),
+])
+def test_invalid_requests(server, method, path, body):
+    roots = server.coordinator.roots
+    timeout = server.coordinator.watch_timeout
+    assert request(server, method, path, body)[0] == 400
+    # Nothing changed, and the daemon still serves
+    assert server.coordinator.roots == roots
+    assert server.coordinator.watch_timeout == timeout
+    status, body = request(server, 'GET', '/roots')
+    assert status == 200 and json.loads(body) == roots
+
+
+def test_untrusted_requests(server):
+    assert request(server, 'POST', '/reindex', b'{}', {'Content-Type': 'text/plain'})[0] == 415
+    assert request(server, 'GET', '/roots', headers={'Host': 'example.com'})[0] == 403
+
+
+def test_remote_errors(server):
+    remote = RemoteSearchEngine(f'http://127.0.0.1:{server.server_port}')
+    # The same error as the local engine
+    with pytest.raises(ValueError, match='not a valid regular expression'):
+        remote.search('(', mode='regex')
+    with pytest.raises(ValueError):
+        remote.set_roots(['/does/not/exist'])
+
+
+def test_remote_unreachable(server):
+    server.shutdown()
+    server.server_close()
+    remote = RemoteSearchEngine(f'http://127.0.0.1:{server.server_port}', timeout=1)
+    with pytest.raises(OSError):
+        remote.search('report')
@@ -0,0 +1,84 @@
+import fnmatch
+import random
+
+import pytest
+
+from patterns import QueryPattern, compile_query, glob_literals, regex_literals
+
+
+@pytest.mark.parametrize('glob, literals', [
+    ('*.pdf', ['.pdf']),
+    ('report_2024*', ['report_2024']),
+    ('a?b[cd]e*f', ['a', 'b', 'e', 'f']),
+    ('[!x]y', ['y']),
+    ('[abc', ['[abc']),
+    ('[]]x', ['x']),
+    ('*', []),
+])
+def test_glob_literals(glob, literals):
+    assert glob_literals(glob) == literals
+
+
+@pytest.mark.parametrize('regex, literals', [
+    (r'report_\d{4}\.pdf', ['report_', '.pdf']),
+    ('ab*c', ['a', 'c']),
+    ('abc+d', ['abc', 'd']),
+    ('a|b', []),
+    ('(a|b)cd', ['cd']),
+    (r'\bfoo(?=bar)', ['foo']),
+    ('x{0,2}yz', ['yz']),
+    ('x{2}y', ['x', 'y']),
+    ('[(]abc', ['abc']),
+    ('a*?b', ['b']),
+    ('a{', ['a{']),
+    (r'a\.b', ['a.b']),
+    # Character codes are not literals, the characters after them are
+    (r'\x41\x42c', ['c']),
+    (r'\101\102c', ['c']),
+    (r'\u0041bc', ['bc']),
+    (r'\U00000041bc', ['bc']),
+    (r'\N{LATIN CAPITAL LETTER A}bc', ['bc']),
+    (r'\0x', ['x']),
+    (r'(a)\1bc', ['bc']),
+])
+def test_regex_literals(regex, literals):
+    assert regex_literals(regex) == literals
+
+
+@pytest.mark.parametrize('regex', [r'\x41\x42c', r'\101\102c', r'ABc', r'\N{LATIN CAPITAL LETTER A}Bc'])
+def test_regex_character_codes_match(regex):
+    pattern = compile_query(regex, 'regex')
+    assert pattern.matches('ABc.txt')
+    assert all(literal.lower() in 'abc.txt' for literal in pattern.literals)
+
+
+def test_regex_literals_are_in_every_match():
+    rng = random.Random(2)
+    names = [''.join(rng.choice('ab.cxyz_') for _ in range(rng.randint(1, 8))) for _ in range(500)]
+    atoms = ['a', 'b', 'c', r'\.', '.', 'x', '[ab]', '(ab|c)', 'y', r'\x61', r'\142']
+    quantifiers = ['', '', '*', '+', '?', '{0,2}', '{1,2}', '*?']
+    for _ in range(500):
+        regex = ''.join(rng.choice(atoms) + rng.choice(quantifiers) for _ in range(rng.randint(1, 5)))
+        pattern = QueryPattern(regex, 'regex')
+        for name in names:
+            if pattern.matches(name):
+                assert all(literal.lower() in name.lower() for literal in pattern.literals), (regex, name)
+
+
+def test_glob_literals_are_in_every_match():
+    rng = random.Random(3)
+    names = [''.join(rng.choice('ab.cxyz_') for _ in range(rng.randint(1, 8))) for _ in range(500)]
+    for _ in range(500):
+        glob = ''.join(rng.choice(['a', 'b', '*', '?', '[ab]', '[!a]', '.', 'c']) for _ in range(rng.randint(1, 5)))
+        pattern = QueryPattern(glob, 'glob')
+        for name in names:
+            assert pattern.matches(name) == fnmatch.fnmatch(name.lower(), glob.lower())
+            if pattern.matches(name):
+                assert all(literal in name for literal in pattern.literals), (glob, name)
+
+
+def test_invalid_patterns():
+    with pytest.raises(ValueError):
+        QueryPattern('(', 'regex')
+    with pytest.raises(ValueError):
+        QueryPattern('x', 'fuzzy')
@@ -0,0 +1,57 @@
+import time
+
+from ranking import FuzzyMatcher, fuzzy_score, subsequence_pattern
+from searcher import FileSearchEngine
+
+
+def test_subsequence_pattern_matches_in_order():
+    assert subsequence_pattern('rprt').search(b'\0my report.pdf\0')
+    assert subsequence_pattern('rprt').search(b'\0trpr\0') is None
+
+
+def test_subsequence_pattern_stays_in_one_name():
+    assert subsequence_pattern('ab').search(b'\0a\0b\0') is None
+
+
+def test_subsequence_pattern_multibyte_characters():
+    assert subsequence_pattern('éx').search('\0aéàx\0'.encode())
+    assert subsequence_pattern('éx').search('\0aàx\0'.encode()) is None
+
+
+def test_subsequence_pattern_near_miss_is_fast():
+    # A near miss used to backtrack through every way the zeros could be matched
+    start = time.perf_counter()
+    assert subsequence_pattern('00000000x').search(b'\0backup_' + b'0' * 40 + b'.log\0') is None
+    assert time.perf_counter() - start < 0.1
+
+
+def test_advanced_search_near_miss_is_fast(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    root.mkdir()
+    (root / ('backup_' + '0' * 40 + '.log')).write_text('')
+    monkeypatch.chdir(tmp_path)
+    engine = FileSearchEngine(str(root))
+    try:
+        engine.wait_until_fresh()
+        start = time.perf_counter()
+        page = engine.advanced_search('00000000x', {})
+        assert time.perf_counter() - start < 0.25
+        assert page['results'] == [] and page['complete']
+    finally:
+        engine.stop_watcher()
+
+
+def test_fuzzy_score_longer_lower_case():
+    # The lower case of İ is two characters long
+    assert fuzzy_score('z', 'İİİİz') is not None
+
+
+def test_fuzzy_score_prefers_boundaries():
+    assert fuzzy_score('rp', 'report_plan') > fuzzy_score('rp', 'aardpig')
+    assert fuzzy_score('fb', 'fooBar') > fuzzy_score('fb', 'foobar')
+
+
+def test_fuzzy_matcher_directories():
+    matcher = FuzzyMatcher('docs/rprt')
+    assert matcher.score('report.pdf', lambda: '/home/docs') is not None
+    assert matcher.score('report.pdf', lambda: '/home/music') is None
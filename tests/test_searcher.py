@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from searcher import FileSearchEngine
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    for directory in ('projects/app', 'projects2', 'other'):
+        (root / directory).mkdir(parents=True)
+    for path in ('projects/plan.txt', 'projects/app/plan.txt', 'projects2/plan.txt', 'other/plan.txt'):
+        (root / path).write_text('')
+    monkeypatch.chdir(tmp_path)
+    engine = FileSearchEngine(str(root))
+    engine.wait_until_fresh()
+    yield engine
+    engine.stop_watcher()
+
+
+def paths(page, root):
+    return sorted(os.path.relpath(result['path'], root).replace(os.sep, '/') for result in page['results'])
+
+
+@pytest.mark.parametrize('path', ['projects', 'projects/', './projects', 'projects/app/..'])
+def test_advanced_search_path(engine, path):
+    page = engine.advanced_search('plan', {'path': path})
+    assert paths(page, engine.root_dir) == ['projects/app/plan.txt', 'projects/plan.txt']
+
+
+def test_advanced_search_absolute_path(engine):
+    page = engine.advanced_search('plan', {'path': os.path.join(engine.root_dir, 'other')})
+    assert paths(page, engine.root_dir) == ['other/plan.txt']
+
+
+def test_search_cancels_older_queries(engine):
+    engine.start_query(5)
+    assert engine.is_cancelled(4)
+    assert not engine.is_cancelled(5)
+    assert not engine.is_cancelled(None)
+
+
+def test_search_query_ids_start_again(engine):
+    # The interface counts from 1 again when it is reloaded
+    assert not engine.search('plan', query_id=40)['cancelled']
+    page = engine.search('plan', query_id=1)
+    assert not page['cancelled'] and page['matched'] == 4
+    page = engine.advanced_search('plan', {'query_id': 2})
+    assert not page['cancelled'] and page['matched'] == 4
+
+
+def test_search_regex_character_codes(engine):
+    page = engine.search(r'\x6Flan', mode='regex')
+    assert page['matched'] == 0
+    page = engine.search(r'\x70lan\.txt', mode='regex')
+    assert page['matched'] == 4
+
+
+def test_legacy_index_trigrams_built_in_background(tmp_path, monkeypatch):
+    root = tmp_path / 'legacy'
+    (root / 'docs').mkdir(parents=True)
+    (root / 'docs' / 'report.txt').write_text('')
+    monkeypatch.chdir(tmp_path)
+    save_file = 'legacy.idx'
+    # The json index of older versions: the os.walk output
+    legacy = [[str(root), ['docs'], []], [str(root / 'docs'), [], ['report.txt']]]
+    (tmp_path / 'legacy.json').write_text(json.dumps([legacy]))
+    engine = FileSearchEngine(str(root), save_file=save_file)
+    try:
+        engine.wait_until_fresh()
+        assert engine.index.trigrams is not None
+        assert engine.search('report')['matched'] == 1
+    finally:
+        engine.stop_watcher()
@@ -0,0 +1,67 @@
+from array import array
+
+from index import NameIndex, KIND_DIR, KIND_FILE
+from trigram import TrigramIndex
+
+
+def build(tmp_path):
+    index = NameIndex(str(tmp_path))
+    docs = index.add('docs', 0, KIND_DIR)
+    for name in ('report.txt', 'plan.pdf', 'notes.md'):
+        index.add(name, docs, KIND_FILE)
+    index.freeze()
+    index.build_trigrams()
+    return index
+
+
+def test_index_round_trip(tmp_path):
+    index = build(tmp_path)
+    index.save(str(tmp_path / 'i.idx'))
+    loaded = NameIndex.load(str(tmp_path / 'i.idx'))
+    assert list(loaded.names) == list(index.names)
+    assert list(loaded.search('repo')) == list(index.search('repo'))
+
+
+def test_index_save_over_its_own_file(tmp_path):
+    path = str(tmp_path / 'i.idx')
+    build(tmp_path).save(path)
+    loaded = NameIndex.load(path)
+    # The loaded index does not refer to the file anymore once it saved over it
+    loaded.save(path)
+    assert not loaded._mapped
+    assert isinstance(loaded._snapshot[0], bytes)
+    assert list(NameIndex.load(path).names) == list(loaded.names)
+
+
+def test_trigrams_only_saved_when_changed(tmp_path):
+    path = str(tmp_path / 'i.tri')
+    index = build(tmp_path)
+    index.trigrams.save(path)
+    trigrams = TrigramIndex.load(path)
+    assert not trigrams.dirty
+    mtime = (tmp_path / 'i.tri').stat().st_mtime_ns
+    trigrams.save(path)
+    assert (tmp_path / 'i.tri').stat().st_mtime_ns == mtime
+
+    # Only the search buffer changed, the posting lists are still mapped from the file
+    trigrams.stamp(b'other\0')
+    trigrams.save(path)
+    assert not trigrams.dirty
+    # They were copied before the file they were mapped from was replaced
+    assert all(type(arr) is array for arr in (trigrams.keys, trigrams.starts, trigrams.postings))
+    assert TrigramIndex.load(path).matches(b'other\0')
+
+    trigrams.add(len(index), b'report2.txt')
+    assert trigrams.dirty
+    trigrams.save(path)
+    assert len(index) in TrigramIndex.load(path).candidates(b'report2')
+
+
+def test_trigrams_stamp(tmp_path):
+    index = build(tmp_path)
+    trigrams = index.trigrams
+    trigrams.dirty = False
+    trigrams.stamp(index._snapshot[0])
+    assert not trigrams.dirty
+    trigrams.stamp(b'other\0')
+    assert trigrams.dirty
@@ -0,0 +1,244 @@
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+
+from storage import ArrayLike, aligned, atomic_write, map_file, pad, to_array, view_array, write_array
+
+# Header of the trigram file: magic, version, reserved, checksum of the search buffer, key count and entry count
+HEADER = struct.Struct('<4sHHIIQ')
+MAGIC = b'FSTG'
+VERSION = 2
+
+# Once the candidate set is this small, verifying the candidates is cheaper than intersecting more posting lists
+SMALL_CANDIDATES = 256
+
+
+def trigram_keys(folded: bytes) -> Set[int]:
+    """Returns the (unique) trigrams of a folded name as integers
+
+    Args:
+        folded (bytes): The folded name
+
+    Returns:
+        Set[int]: The trigrams, every trigram is the big endian integer of its three bytes
+    """
+    return {int.from_bytes(folded[j:j + 3], 'big') for j in range(len(folded) - 2)}
+
+
+class TrigramIndex:
+    """TrigramIndex maps every trigram (three consecutive bytes of a folded name) to the sorted ids of the entries containing it.
+
+    The posting lists are stored flat: the sorted keys, the start of every key's postings and one array with all the postings.
+    Entries that are added (or renamed) later are kept in a small overlay until the index is compacted.
+    A loaded index is mapped into memory, the posting lists are read directly from the file. It is only written
+    again when it changed, and never while the posting lists are still mapped from the file it replaces.
+    """
+
+    def __init__(self, keys: ArrayLike, starts: ArrayLike, postings: ArrayLike, checksum: int = 0, entries: int = 0):
+        # The flat posting lists are replaced as a whole by compact(), so a lookup never mixes old and new arrays
+        self._flat = (keys, starts, postings)
+        # Identifies the search buffer the index was built from, used to detect a stale save file
+        self.checksum = checksum
+        self.entries = entries
+        # The posting lists of the entries added after the index was built
+        self.extra: Dict[int, List[int]] = {}
+        # The file the index was loaded from (or last saved to), and whether it changed since
+        self.file_path: Optional[str] = None
+        self.dirty = True
+
+    @property
+    def keys(self) -> ArrayLike:
+        """The sorted trigrams"""
+        return self._flat[0]
+
+    @property
+    def starts(self) -> ArrayLike:
+        """The start of the postings of every trigram (with one extra start at the end)"""
+        return self._flat[1]
+
+    @property
+    def postings(self) -> ArrayLike:
+        """The posting lists of all the trigrams"""
+        return self._flat[2]
+
+    @classmethod
+    def build(cls, buffer: bytes, offsets: ArrayLike) -> 'TrigramIndex':
+        """Builds the trigram index for a search buffer (see NameIndex)
+
+        Args:
+            buffer (bytes): The folded names, separated by a null byte
+            offsets (ArrayLike): The offset of every entry in the buffer (with one extra offset at the end)
+
+        Returns:
+            TrigramIndex: The created index
+        """
+        lists: Dict[int, List[int]] = {}
+        for i in range(len(offsets) - 1):
+            for key in trigram_keys(buffer[offsets[i]:offsets[i + 1] - 1]):
+                if key in lists:
+                    lists[key].append(i)
+                else:
+                    lists[key] = [i]
+        keys = array('I', sorted(lists))
+        starts = array('Q', [0])
+        postings = array('I')
+        for key in keys:
+            # The entries are visited in order, so the posting lists are already sorted
+            postings.extend(lists[key])
+            starts.append(len(postings))
+        return cls(keys, starts, postings, zlib.crc32(buffer), len(offsets) - 1)
+
+    def posting(self, key: int) -> ArrayLike:
+        """Returns the posting list (the entry ids) of a trigram
+
+        Args:
+            key (int): The trigram
+
+        Returns:
+            ArrayLike: The ids of the entries containing the trigram, empty if there are none
+        """
+        keys, starts, postings = self._flat
+        pos = bisect_left(keys, key)
+        if pos == len(keys) or keys[pos] != key:
+            posting = array('I')
+        else:
+            posting = postings[starts[pos]:starts[pos + 1]]
+        extra = self.extra.get(key)
+        if extra:
+            posting = array('I', posting)
+            posting.extend(extra)
+        return posting
+
+    def add(self, i: int, folded: bytes) -> None:
+        """Adds the trigrams of an added (or renamed) entry to the overlay
+        Note: The old trigrams of a renamed entry stay, they are filtered out when the candidates are verified
+
+        Args:
+            i (int): The id of the entry
+            folded (bytes): The (new) folded name of the entry
+        """
+        for key in trigram_keys(folded):
+            if key in self.extra:
+                self.extra[key].append(i)
+            else:
+                self.extra[key] = [i]
+        self.entries = max(self.entries, i + 1)
+        self.dirty = True
+
+    def stamp(self, buffer) -> None:
+        """Records that the index (still) describes the given search buffer, used after the buffer was rebuilt
+
+        Args:
+            buffer (bytes-like): The search buffer
+        """
+        checksum = zlib.crc32(buffer)
+        if checksum != self.checksum:
+            self.checksum = checksum
+            self.dirty = True
+
+    def compact(self) -> None:
+        """Merges the overlay into the flat posting lists"""
+        if not self.extra:
+            return
+        extra = self.extra
+        old_keys, old_starts, old_postings = self._flat
+        keys = array('I', sorted(set(old_keys).union(extra)))
+        starts = array('Q', [0])
+        postings = array('I')
+        for key in keys:
+            pos = bisect_left(old_keys, key)
+            if pos < len(old_keys) and old_keys[pos] == key:
+                postings.extend(old_postings[old_starts[pos]:old_starts[pos + 1]])
+            if key in extra:
+                postings.extend(sorted(extra[key]))
+            starts.append(len(postings))
+        self._flat = (keys, starts, postings)
+        # A lookup in between sees the merged entries twice, which the candidate set removes
+        self.extra = {}
+
+    def candidates(self, needle: bytes) -> Optional[List[int]]:
+        """Returns the entries that contain every trigram of the needle
+
+        Args:
+            needle (bytes): The folded query
+
+        Returns:
+            Optional[List[int]]: The sorted candidate ids, they still have to be verified.
+                                 None if the needle is to short to have any trigrams.
+        """
+        keys = trigram_keys(needle)
+        if not keys:
+            return None
+        # Start with the shortest posting lists, it keeps the candidate set as small as possible
+        lists = sorted((self.posting(key) for key in keys), key=len)
+        result = set(lists[0])
+        for posting in lists[1:]:
+            if len(result) <= SMALL_CANDIDATES:
+                break
+            result.intersection_update(posting)
+        return sorted(result)
+
+    def matches(self, buffer) -> bool:
+        """Checks if the index was built from the given search buffer
+
+        Args:
+            buffer (bytes-like): The search buffer
+
+        Returns:
+            bool: True if the index belongs to the buffer
+        """
+        return self.checksum == zlib.crc32(buffer)
+
+    def save(self, file_path: str) -> None:
+        """Saves the index to file_path, the file is replaced atomically. Nothing is written when the file is
+        already up to date
+
+        Args:
+            file_path (str): The file to write the index to
+        """
+        if not self.dirty and self.file_path == file_path and os.path.isfile(file_path):
+            return
+        self.compact()
+        if self.file_path == file_path:
+            # The posting lists can still be mapped from the file, which can not be replaced on windows
+            self._flat = (to_array(self.keys, 'I'), to_array(self.starts, 'Q'), to_array(self.postings, 'I'))
+        with atomic_write(file_path) as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self.checksum, len(self.keys), self.entries))
+            pad(f)
+            for arr in (self.keys, self.starts, self.postings):
+                write_array(f, arr)
+        self.file_path = file_path
+        self.dirty = False
+
+    @classmethod
+    def load(cls, file_path: str) -> 'TrigramIndex':
+        """Loads the index from file_path by mapping it into memory
+
+        Args:
+            file_path (str): The file the index was saved to
+
+        Raises:
+            ValueError: If the file is not a (supported) trigram file, or if it is truncated
+
+        Returns:
+            TrigramIndex: The loaded index
+        """
+        view = map_file(file_path)
+        if len(view) < HEADER.size:
+            raise ValueError(f'{file_path} is not a trigram file')
+        magic, version, _, checksum, key_count, entries = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{file_path} is not a trigram file')
+        pos = aligned(HEADER.size)
+        keys = view_array(view, 'I', pos, key_count)
+        pos = aligned(pos + keys.itemsize * key_count)
+        starts = view_array(view, 'Q', pos, key_count + 1)
+        pos = aligned(pos + starts.itemsize * (key_count + 1))
+        postings = view_array(view, 'I', pos, starts[-1])
+        trigrams = cls(keys, starts, postings, checksum, entries)
+        trigrams.file_path = file_path
+        trigrams.dirty = False
+        return trigrams
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List, Optional
 from operator import itemgetter
 
 # Keeps track of which type of extension should be classified as what
@@ -17,16 +17,28 @@ fileTypeNames = {
     'other': 'any',
 }
 
+# Maps every (lower case) extension in fileTypes to its file type, so classifying a file is a single lookup
+extensionTypes: Dict[str, str] = {
+    **{ext: fileTypeNames['document'] for ext in fileTypes['document_ext']},
+    **{ext: fileTypeNames['image'] for ext in fileTypes['image_ext']},
+}
+
 # Returns the type of file (from the fileTypeNames dict) based on the file types stored in fileTypes
-def getFileType(path: str) -> str:
-    if os.path.isdir(path): 
+# When is_dir is given the filesystem is not accessed, so it should be passed whenever it is known
+def getFileType(path: str, is_dir: Optional[bool] = None) -> str:
+    if is_dir is None:
+        is_dir = os.path.isdir(path)
+    return getNameType(os.path.basename(path), is_dir)
+
+# Returns the type of a file or directory name (without the directories), this is used for every match so it avoids os.path
+def getNameType(name: str, is_dir: bool) -> str:
+    if is_dir:
         return fileTypeNames['directory']
-    filename, ext = os.path.splitext(path)
-    if ext in fileTypes['document_ext']:
-        return fileTypeNames['document']
-    if ext in fileTypes['image_ext']:
-        return fileTypeNames['image']
-    return fileTypeNames['other']
+    dot = name.rfind('.')
+    # Like os.path.splitext, the leading dots of a name are not an extension
+    if dot <= 0 or (name[0] == '.' and not name[:dot].strip('.')):
+        return fileTypeNames['other']
+    return extensionTypes.get(name[dot:].lower(), fileTypeNames['other'])
 
 def sortByFolder(results: List[object]):
     # If the length of the results is less then or equal to 1 there is no need to sort it.
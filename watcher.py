@@ -0,0 +1,428 @@
+import os
+import threading
+from itertools import compress
+from stat import S_ISLNK
+from typing import List, Optional, Tuple
+
+from index import NameIndex, KIND_DIR, KIND_FILE
+from rules import CrawlRules, is_hidden, relative
+
+
+def relative_path(index: NameIndex, path: str) -> str:
+    """Returns the path relative to the root_dir of the index (separated by /), the rules match these paths"""
+    rel = os.path.relpath(path, index.root_dir)
+    return '' if rel == '.' else rel.replace(os.sep, '/')
+
+
+def root_device(index: NameIndex) -> int:
+    """Returns the device of the root_dir, it is only looked up when the rules need it"""
+    if not index.rules.one_file_system:
+        return 0
+    try:
+        return os.stat(index.root_dir).st_dev
+    except OSError:
+        return 0
+
+
+def is_listed(rules: CrawlRules, path: str, rel: str, root_dev: int) -> bool:
+    """Checks if the rules list a directory
+
+    Args:
+        rules (CrawlRules): The rules
+        path (str): The full path of the directory
+        rel (str): The relative path of the directory (see relative_path)
+        root_dev (int): The device of the root_dir (see root_device)
+
+    Returns:
+        bool: True if the content of the directory is indexed
+    """
+    depth = rel.count('/') + 1 if rel else 0
+    dev = root_dev
+    if rules.one_file_system:
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            pass
+    return rules.lists(depth, dev, root_dev)
+
+
+# A listed entry: its name, whether it is a directory, a symbolic link and hidden, and the mtime and size of a file
+Listed = Tuple[str, bool, bool, bool, float, int]
+
+
+def stat_file(path: str) -> Tuple[float, int]:
+    """Returns the modification time and the size of a file (zeros if it is gone)"""
+    try:
+        st = os.stat(path, follow_symlinks=False)
+        return st.st_mtime, st.st_size
+    except OSError:
+        return 0.0, 0
+
+
+def scan(path: str) -> List[Listed]:
+    """Lists a directory
+
+    Args:
+        path (str): The full path of the directory
+
+    Returns:
+        List[Listed]: The entries of the directory
+    """
+    listed = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                mtime, size = 0.0, 0
+                if not is_dir:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        mtime, size = st.st_mtime, st.st_size
+                    except OSError:
+                        pass
+                listed.append((entry.name, is_dir, entry.is_symlink(), is_hidden(entry), mtime, size))
+    except OSError:
+        # Like os.walk, a directory that can not be listed is empty
+        pass
+    return listed
+
+
+def add_path(index: NameIndex, path: str, is_dir: bool) -> bool:
+    """Adds a created file or directory to the index, the content of a created directory is added as well
+
+    Args:
+        index (NameIndex): The index to update
+        path (str): The full path of the created file or directory
+        is_dir (bool): True if the path is a directory
+
+    Returns:
+        bool: True if the index changed
+    """
+    parent = index.lookup(os.path.dirname(path))
+    name = os.path.basename(path)
+    # Ignore paths outside of the index and duplicate events
+    if parent is None or index.kinds[parent] != KIND_DIR or name in index.children(parent):
+        return False
+    rules = index.rules
+    if rules:
+        rel = relative_path(index, path)
+        # The content of a directory that is not listed is not indexed either
+        if not is_listed(rules, os.path.dirname(path), relative_path(index, os.path.dirname(path)), root_device(index)):
+            return False
+        # The hidden attribute of windows is checked when the directory is listed again
+        if not rules.allows(rel, is_dir):
+            index.pruned.add(parent)
+            return False
+    if is_dir:
+        add_tree(index, parent, path)
+    else:
+        index.add(name, parent, KIND_FILE, *stat_file(path))
+    return True
+
+
+def update_path(index: NameIndex, path: str) -> bool:
+    """Records the new modification time and size of a modified file
+
+    Args:
+        index (NameIndex): The index to update
+        path (str): The full path of the modified file
+
+    Returns:
+        bool: True if the index changed
+    """
+    i = index.lookup(path)
+    if i is None or index.kinds[i] != KIND_FILE:
+        return False
+    generation = index.generation
+    index.set_metadata(i, *stat_file(path))
+    return index.generation != generation
+
+
+def remove_path(index: NameIndex, path: str) -> bool:
+    """Removes a deleted file or directory from the index
+
+    Args:
+        index (NameIndex): The index to update
+        path (str): The full path of the deleted file or directory
+
+    Returns:
+        bool: True if the index changed
+    """
+    i = index.lookup(path)
+    if i is None or i == 0:
+        return False
+    index.remove(i)
+    return True
+
+
+def move_path(index: NameIndex, src: str, dest: str, is_dir: bool) -> bool:
+    """Moves (or renames) a file or directory in the index
+
+    Args:
+        index (NameIndex): The index to update
+        src (str): The old full path
+        dest (str): The new full path
+        is_dir (bool): True if the path is a directory
+
+    Returns:
+        bool: True if the index changed
+    """
+    i = index.lookup(src)
+    parent = index.lookup(os.path.dirname(dest))
+    # Moved from outside of the index, or the entries in a directory that was already moved
+    if i is None:
+        return add_path(index, dest, is_dir)
+    # Moved out of the index, or to a place the rules leave out
+    if parent is None or (index.rules and not index.rules.allows(relative_path(index, dest), is_dir)):
+        return remove_path(index, src)
+    # Replace whatever was at the destination
+    existing = index.lookup(dest)
+    if existing is not None and existing != i:
+        index.remove(existing)
+    index.move(i, parent, os.path.basename(dest))
+    return True
+
+
+def add_tree(index: NameIndex, parent: int, path: str) -> int:
+    """Adds a directory and everything in it (that the rules of the index allow) to the index
+
+    Args:
+        index (NameIndex): The index to update
+        parent (int): The id of the directory the new directory is in
+        path (str): The full path of the new directory
+
+    Returns:
+        int: The id of the added directory
+    """
+    rules = index.rules
+    root_dev = root_device(index)
+    top = index.add(os.path.basename(path), parent, KIND_DIR)
+    stack = [(top, path, relative_path(index, path))]
+    while stack:
+        i, dir_path, rel = stack.pop()
+        if not is_listed(rules, dir_path, rel, root_dev):
+            index.pruned.add(i)
+            continue
+        # The modification time is recorded before the directory is listed, so changes are never missed
+        try:
+            index.set_mtime(i, os.stat(dir_path).st_mtime)
+        except OSError:
+            pass
+        for name, is_dir, is_link, hidden, mtime, size in scan(dir_path):
+            child_rel = relative(rel, name)
+            if not rules.allows(child_rel, is_dir, hidden):
+                index.pruned.add(i)
+                continue
+            j = index.add(name, i, KIND_DIR if is_dir else KIND_FILE, mtime, size)
+            # Like os.walk, symbolic links to directories are added but not followed
+            if is_dir and not is_link:
+                stack.append((j, os.path.join(dir_path, name), child_rel))
+    return top
+
+
+def relist(index: NameIndex, i: int, path: str, mtime: float) -> None:
+    """Lists a (changed) directory again and applies the differences to the index
+
+    Args:
+        index (NameIndex): The index to update
+        i (int): The id of the directory
+        path (str): The full path of the directory
+        mtime (float): The current modification time of the directory
+    """
+    rules = index.rules
+    rel = relative_path(index, path)
+    index.set_mtime(i, mtime)
+    index.pruned.discard(i)
+    if not is_listed(rules, path, rel, root_device(index)):
+        index.pruned.add(i)
+        return
+    known = index.children(i)
+    for name, is_dir, is_link, hidden, file_mtime, size in scan(path):
+        if not rules.allows(relative(rel, name), is_dir, hidden):
+            # Removed below, when it was indexed
+            index.pruned.add(i)
+            continue
+        j = known.pop(name, None)
+        if j is not None:
+            # Unchanged, unless a file was replaced by a directory or the other way around
+            if (index.kinds[j] == KIND_DIR) == is_dir:
+                if not is_dir:
+                    # The listing has the metadata anyway, so the files in a changed directory are kept up to date
+                    index.set_metadata(j, file_mtime, size)
+                continue
+            index.remove(j)
+        if is_dir and not is_link:
+            add_tree(index, i, os.path.join(path, name))
+        else:
+            index.add(name, i, KIND_DIR if is_dir else KIND_FILE, file_mtime, size)
+    # Whatever was not listed anymore is removed
+    for j in known.values():
+        index.remove(j)
+
+
+def reconcile(index: NameIndex) -> int:
+    """Compares the modification time of every directory with the time it was listed, and only lists the changed directories again
+
+    Args:
+        index (NameIndex): The index to update
+
+    Returns:
+        int: The number of directories that changed
+    """
+    changed = 0
+    # The directories are found with one pass over the kinds column. Directories added during the reconciliation
+    # are listed already, so they do not need to be checked
+    kinds = index.kinds
+    for i in list(compress(range(len(index)), map(KIND_DIR.__eq__, kinds))):
+        # A directory in a removed directory is removed as well
+        if index.kinds[i] != KIND_DIR:
+            continue
+        path = index.path(i)
+        try:
+            # The root directory can be a symbolic link, the others are not followed (like when crawling)
+            st = os.stat(path) if i == 0 else os.lstat(path)
+        except OSError:
+            # The directory is gone, the root directory always stays
+            if i != 0:
+                index.remove(i)
+                changed += 1
+            continue
+        if S_ISLNK(st.st_mode):
+            continue
+        mtime = st.st_mtime
+        if mtime != index.mtimes[i]:
+            relist(index, i, path, mtime)
+            changed += 1
+    return changed
+
+
+def apply_rules(index: NameIndex, rules: CrawlRules) -> int:
+    """Changes the crawl rules of the index, without crawling the root_dir again
+
+    First the entries the new rules leave out are removed (this only walks the index), then the directories
+    the old rules pruned are listed again, so only the subtrees the change affects are listed.
+    The hidden attribute (of windows) is only checked for the directories that are listed again.
+
+    Args:
+        index (NameIndex): The index to update
+        rules (CrawlRules): The new rules
+
+    Returns:
+        int: The number of directories that changed
+    """
+    index.rules = rules
+    root_dev = root_device(index)
+    changed = set()
+    stack = [(0, index.root_dir, '')]
+    while stack:
+        i, path, rel = stack.pop()
+        children = index.children(i)
+        if i != 0 and not is_listed(rules, path, rel, root_dev):
+            for j in children.values():
+                index.remove(j)
+            if children:
+                changed.add(i)
+            index.pruned.add(i)
+            continue
+        for name, j in children.items():
+            child_rel = relative(rel, name)
+            is_dir = index.kinds[j] == KIND_DIR
+            if not rules.allows(child_rel, is_dir):
+                index.remove(j)
+                index.pruned.add(i)
+                changed.add(i)
+            elif is_dir:
+                stack.append((j, os.path.join(path, name), child_rel))
+    # The directories that were pruned could have more entries now
+    for i in sorted(index.pruned):
+        if index.kinds[i] != KIND_DIR:
+            continue
+        path = index.path(i)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        generation = index.generation
+        relist(index, i, path, mtime)
+        if index.generation != generation:
+            changed.add(i)
+    return len(changed)
+
+
+class IndexWatcher:
+    """IndexWatcher keeps the index of a FileSearchEngine up to date.
+
+    Filesystem events (when watchdog is available) are applied to the index as they happen, and every
+    interval a reconciliation pass lists the directories that changed since they were listed. After that
+    the engine saves the index if it changed.
+    """
+
+    def __init__(self, engine, interval: float):
+        """Initializes the watcher
+
+        Args:
+            engine (FileSearchEngine): The engine whose index is updated
+            interval (float): The time between the reconciliation passes (in seconds)
+        """
+        self.engine = engine
+        self.interval = interval
+        self.timer: Optional[threading.Timer] = None
+        self.observer = None
+        self.stopped = False
+
+    def start(self) -> None:
+        """Starts the event observer (if possible) and schedules the first reconciliation pass"""
+        self.stopped = False
+        try:
+            # watchdog is optional, without it the index is only kept up to date by the reconciliation passes
+            from watchdog.observers import Observer
+            self.observer = Observer()
+            self.observer.schedule(self, self.engine.root_dir, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+        except Exception:
+            # Also happens when the os limits the number of watched directories
+            self.observer = None
+        self._schedule()
+
+    def stop(self) -> None:
+        """Stops the event observer and the reconciliation passes"""
+        self.stopped = True
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.observer is not None:
+            self.observer.stop()
+
+    def dispatch(self, event) -> None:
+        """Applies a (watchdog) filesystem event to the index, called by the observer
+
+        Args:
+            event (FileSystemEvent): The event that happened
+        """
+        with self.engine.lock:
+            index = self.engine.index
+            if event.event_type == 'created':
+                add_path(index, event.src_path, event.is_directory)
+            elif event.event_type == 'deleted':
+                remove_path(index, event.src_path)
+            elif event.event_type == 'moved':
+                move_path(index, event.src_path, event.dest_path, event.is_directory)
+            elif event.event_type == 'modified' and not event.is_directory:
+                update_path(index, event.src_path)
+
+    def _schedule(self) -> None:
+        """Schedules the next reconciliation pass"""
+        self.timer = threading.Timer(self.interval, self._tick)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _tick(self) -> None:
+        """Runs a reconciliation pass and schedules the next one"""
+        try:
+            self.engine.refresh_index()
+        finally:
+            if not self.stopped:
+                self._schedule()
@@ -29,17 +29,33 @@ function FileItem({ file, handleClick }) {
   )
 }
 
+// The number of results that are requested at once
+const PAGE_SIZE = 50
+
 function App() {
 
   // const [currentTab, setCurrentTab] = useState('all')
   const [searchQuery, setSearchQuery] = useState('')
   const [files, setFiles] = useState([])
+  const [hasMore, setHasMore] = useState(false)
+  // How the query matches the names: 'substring', 'glob' or 'regex'
+  const [mode, setMode] = useState('substring')
+  const [error, setError] = useState('')
   const input = useRef(null)
+  // Every query gets a new id, the backend cancels the searches of the older queries
+  const queryId = useRef(0)
 
-  // Get the files and add them to the state
-  const getAndSetFiles = async () => {
-    const result = await searchFile(searchQuery)
-    setFiles(result)
+  // Get the files and add them to the state, with an offset the page is added to the current files
+  const getAndSetFiles = async (offset = 0, searchMode = mode) => {
+    const id = ++queryId.current
+    const page = await searchFile(searchQuery, id, PAGE_SIZE, offset, searchMode)
+    // Ignore the results of queries that were replaced by a newer one
+    if (page.cancelled || id !== queryId.current) {
+      return
+    }
+    setError(page.error || '')
+    setFiles(current => offset > 0 ? current.concat(page.results) : page.results)
+    setHasMore(page.matched > offset + page.results.length || !page.complete)
   }
 
   // Handle the on change event on the main (search) input
@@ -61,6 +77,14 @@ function App() {
     }
   }
 
+  // Search again in the new mode
+  const handleModeChange = (e) => {
+    setMode(e.target.value)
+    if (searchQuery !== '') {
+      getAndSetFiles(0, e.target.value)
+    }
+  }
+
   const handleFileItemClick = (path) => {
     openFile(path)
   }
@@ -80,7 +104,17 @@ function App() {
               <i className="fas fa-search" aria-hidden="true"></i>
             </span>
           </p>
+          <div className="control">
+            <div className="select">
+              <select value={mode} onChange={e => handleModeChange(e)}>
+                <option value="substring">Name</option>
+                <option value="glob">Glob</option>
+                <option value="regex">Regex</option>
+              </select>
+            </div>
+          </div>
         </div>
+        {error && <p className="panel-block has-text-danger">{error}</p>}
         <div className="panel-tabs">
           <a className="is-active" href='#_'>All <FileIcon /></a>
           {/* <a href="#_">Documents</a> */}
@@ -92,6 +126,11 @@ function App() {
         )) : (
             <p className="panel-block has-text-centered	 ">Start searching to find!</p>
           )}
+        {hasMore && (
+          <div className="panel-block">
+            <button className="button is-link is-outlined is-fullwidth" onClick={_ => getAndSetFiles(files.length)}>Show more</button>
+          </div>
+        )}
 
       </nav>
     </div >
@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react'
-import { getSettings, saveSettings } from '../eel'
+import { getSettings, saveSettings, getStats } from '../eel'
 
 function SettingsModal() {
 
@@ -7,6 +7,12 @@ function SettingsModal() {
   const [hotkey, setHotkey] = useState("")
   const [root_dir, setRootDir] = useState("")
   const [search_timeout, setTimeout] = useState("")
+  const [roots, setRoots] = useState([])
+  const [roots_text, setRootsText] = useState("")
+  const [crawl_rules, setCrawlRules] = useState({ exclude: [], include: [], hidden: true, max_depth: null, one_file_system: false })
+  const [content_index, setContentIndex] = useState(false)
+  const [scan_workers, setScanWorkers] = useState(0)
+  const [stats, setStats] = useState(null)
   const modal = useRef(null)
 
   useEffect(() => {
@@ -15,6 +21,13 @@ function SettingsModal() {
       setHotkey(settings.hotkey)
       setRootDir(settings.root_dir)
       setTimeout(settings.search_timeout)
+      setRoots(settings.roots || [])
+      setRootsText((settings.roots || []).map(rootPath).join("\n"))
+      setContentIndex(settings.content_index || false)
+      setScanWorkers(settings.scan_workers || 0)
+      if (settings.crawl_rules) {
+        setCrawlRules(settings.crawl_rules)
+      }
     })
   }, [])
 
@@ -22,7 +35,11 @@ function SettingsModal() {
     const error = await saveSettings({
       hotkey,
       root_dir,
-      search_timeout
+      search_timeout,
+      roots: parseRoots(),
+      crawl_rules,
+      content_index,
+      scan_workers
     })
     if (error !== "") {
       console.log(error)
@@ -34,6 +51,8 @@ function SettingsModal() {
     if (!isOpen) {
       modal.current.classList.add('is-active')
       setIsOpen(true)
+      // Refresh the index health every time the settings are opened
+      getStats().then(setStats)
       return
     }
     setIsOpen(false)
@@ -53,6 +72,63 @@ function SettingsModal() {
     setTimeout(e.target.value)
   }
 
+  const handleRootsChange = (e) => {
+    setRootsText(e.target.value)
+  }
+
+  // The globs are edited one per line
+  const handleGlobsChange = (key, e) => {
+    setCrawlRules({ ...crawl_rules, [key]: e.target.value.split("\n") })
+  }
+
+  const handleMaxDepthChange = (e) => {
+    setCrawlRules({ ...crawl_rules, max_depth: e.target.value === "" ? null : parseInt(e.target.value) })
+  }
+
+  const handleRuleToggle = (key, e) => {
+    setCrawlRules({ ...crawl_rules, [key]: e.target.checked })
+  }
+
+  // A root is a path or an object with its path and own search_timeout
+  const rootPath = (root) => typeof root === "string" ? root : root.path
+
+  // The freshness of an index: its saved state is served while it is checked, or the partial index while it is crawled
+  const FRESHNESS = {
+    validating: "Checking for changes",
+    crawling: "Indexing",
+    fresh: "Up to date",
+    stale: "Could not check",
+    unverified: "Not checked"
+  }
+
+  // Formats a duration (in seconds or milliseconds) for the index health
+  const formatSeconds = (seconds) => seconds === undefined ? "-" : `${seconds.toFixed(2)}s`
+  const formatMs = (ms) => ms === undefined ? "-" : `${ms.toFixed(1)}ms`
+
+  const renderHealth = (root_dir, root) => {
+    const { gauges, counters, histograms } = root.metrics
+    const latency = histograms.search_ms || {}
+    return (
+      <tr key={root_dir}>
+        <td>{root_dir}</td>
+        <td>{root.entries}</td>
+        <td>{root.saved ? "Saved" : "Unsaved changes"}</td>
+        <td>{root.freshness ? FRESHNESS[root.freshness.state] : "-"}</td>
+        <td>{formatSeconds(gauges.crawl_seconds)}</td>
+        <td>{formatMs(latency.p50)} / {formatMs(latency.p99)}</td>
+        <td>{counters.slow_queries || 0}</td>
+        <td>{root.content ? `${root.content.docs}${root.content.pending ? ` (${root.content.pending} pending)` : ""}` : "-"}</td>
+      </tr>
+    )
+  }
+
+  const parseRoots = () => {
+    // Keep the settings of the roots that are still in the list
+    return roots_text.split("\n").map(line => line.trim()).filter(line => line !== "").map(path =>
+      roots.find(root => rootPath(root) === path) || path
+    )
+  }
+
 
 
   return (
@@ -85,6 +161,13 @@ function SettingsModal() {
                 </div>
                 <p className="help">The directory all the files you want to search are located in.</p>
               </div>
+              <div className="field">
+                <label className="label">Other directories</label>
+                <div className="control">
+                  <textarea className="textarea" rows="3" value={roots_text} onChange={e => handleRootsChange(e)} />
+                </div>
+                <p className="help">More directories to search in, one per line. Every directory has its own index.</p>
+              </div>
               <div className="field">
                 <label className="label">Fetch timeout</label>
                 <div className="control">
@@ -92,7 +175,73 @@ function SettingsModal() {
                 </div>
                 <p className="help">The timeout between re creating the folder structure</p>
               </div>
+              <div className="field">
+                <label className="label">Exclude</label>
+                <div className="control">
+                  <textarea className="textarea" rows="3" value={crawl_rules.exclude.join("\n")} onChange={e => handleGlobsChange("exclude", e)} />
+                </div>
+                <p className="help">Files and directories that are not indexed, one gitignore style pattern per line. E.g.: node_modules/, *.pyc, !keep.pyc</p>
+              </div>
+              <div className="field">
+                <label className="label">Include</label>
+                <div className="control">
+                  <textarea className="textarea" rows="2" value={crawl_rules.include.join("\n")} onChange={e => handleGlobsChange("include", e)} />
+                </div>
+                <p className="help">When set, only the files matching one of these patterns are indexed. E.g.: *.pdf</p>
+              </div>
+              <div className="field">
+                <label className="label">Maximum depth</label>
+                <div className="control">
+                  <input type="number" className="input" min="1" value={crawl_rules.max_depth === null ? "" : crawl_rules.max_depth} onChange={e => handleMaxDepthChange(e)} />
+                </div>
+                <p className="help">How deep the directories are indexed, empty indexes everything.</p>
+              </div>
+              <div className="field">
+                <label className="checkbox">
+                  <input type="checkbox" checked={crawl_rules.hidden} onChange={e => handleRuleToggle("hidden", e)} /> Index hidden files and directories
+                </label>
+              </div>
+              <div className="field">
+                <label className="checkbox">
+                  <input type="checkbox" checked={crawl_rules.one_file_system} onChange={e => handleRuleToggle("one_file_system", e)} /> Stay on the file system of the directory (skip mounted drives)
+                </label>
+              </div>
+              <div className="field">
+                <label className="checkbox">
+                  <input type="checkbox" checked={content_index} onChange={e => setContentIndex(e.target.checked)} /> Index the content of documents
+                </label>
+                <p className="help">Text, markdown, office and (when pypdf is installed) pdf files are searchable by their content. The content is indexed in the background.</p>
+              </div>
+              <div className="field">
+                <label className="label">Search processes</label>
+                <div className="control">
+                  <input type="number" className="input" min="0" value={scan_workers} onChange={e => setScanWorkers(e.target.value === "" ? 0 : parseInt(e.target.value))} />
+                </div>
+                <p className="help">The number of processes that search big indexes in parallel, 0 searches in the app itself. Only short queries and fuzzy matches scan the whole index.</p>
+              </div>
             </form>
+            {stats &&
+              <div className="field">
+                <label className="label">Index health</label>
+                <table className="table is-fullwidth is-narrow">
+                  <thead>
+                    <tr>
+                      <th>Directory</th>
+                      <th>Entries</th>
+                      <th>State</th>
+                      <th>Freshness</th>
+                      <th>Last crawl</th>
+                      <th>Search p50 / p99</th>
+                      <th>Slow queries</th>
+                      <th>Documents</th>
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {Object.entries(stats.roots).map(([root_dir, root]) => renderHealth(root_dir, root))}
+                  </tbody>
+                </table>
+              </div>
+            }
           </section>
           <footer className="modal-card-foot">
             <button className="button is-success" onClick={_ => handleSave()}>Save changes</button>
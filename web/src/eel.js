@@ -1,7 +1,9 @@
 
-export const searchFile = async (filename) => {
-  const files = await window.eel.search_file(filename)()
-  return files
+// Returns one page of results: { query_id, results, matched, complete, cancelled } (and error for an invalid pattern)
+// The mode is 'substring', 'glob' (e.g. *.pdf) or 'regex'
+export const searchFile = async (filename, queryId, limit = 50, offset = 0, mode = 'substring') => {
+  const page = await window.eel.search_file(filename, queryId, limit, offset, mode)()
+  return page
 }
 
 
@@ -17,4 +19,9 @@ export const getSettings = async () => {
 export const saveSettings = async (settings) => {
   const error = await window.eel.update_settings(settings)()
   return error
-}
\ No newline at end of file
+}
+// Returns the health and metrics of the index of every root: { roots: { [root_dir]: stats } }
+export const getStats = async () => {
+  const stats = await window.eel.get_stats()()
+  return stats
+}